@@ -10,6 +10,10 @@ import random
 import signal
 import sys
 import gc
+import os
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from vocabulary import open_vocabulary
 
 BATCH_SIZE = 10000
 OFFSET = 16630000
@@ -35,16 +39,13 @@ class CustomEmbeddingFunction:
         return embeddings
 
 def load_link_embeddings(filename: str):
-    """Load the link_embeddings.json and create an inverse mapping."""
+    """Open the link vocabulary compiled from link_embeddings.json; its term() is the inverse mapping."""
     try:
-        with open(filename, 'r') as f:
-            link_embeddings = json.load(f)
-        # Create inverse mapping
-        inverse_link_embeddings = {str(v): k for k, v in link_embeddings.items()}
-        return inverse_link_embeddings
+        # Memory-mapped (see vocabulary.py), compiled next to the JSON file on first use
+        return open_vocabulary(filename)
     except Exception as e:
         logging.error(f"Error loading link embeddings from '{filename}': {e}")
-        return {}
+        return None
 
 def read_embeddings(db_filename: str, offset: int, limit: int):
     """Read embeddings from the SQLite database."""
@@ -85,8 +86,10 @@ def main():
     collection_name = "wc_final_9"
     dimension = 10000
 
-    # Load the inverse link embeddings
-    inverse_link_embeddings = load_link_embeddings(link_embeddings_filename)
+    # Open the link vocabulary, which maps emb_idx back to link names
+    link_vocabulary = load_link_embeddings(link_embeddings_filename)
+    if link_vocabulary is None:
+        return
 
     # Create the custom embedding function instance
     embedding_function = CustomEmbeddingFunction()
@@ -118,7 +121,7 @@ def main():
         embeddings = []
 
         for emb_idx, sparse_embedding_json in rows:
-            name = inverse_link_embeddings.get(str(emb_idx), None)
+            name = link_vocabulary.term(emb_idx)
             if not name:
                 continue
 
@@ -5,6 +5,7 @@ import random
 import signal
 import sys
 import gc
+import os
 import numpy as np
 import numpy.typing as npt
 import psycopg2
@@ -12,6 +13,9 @@ from psycopg2.errors import UniqueViolation
 import sqlite3
 from typing import List
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from vocabulary import open_vocabulary
+
 BATCH_SIZE = 30000
 OFFSET = 18480000
 
@@ -36,16 +40,13 @@ class CustomEmbeddingFunction:
         return embeddings
 
 def load_link_embeddings(filename: str):
-    """Load the link_embeddings.json and create an inverse mapping."""
+    """Open the link vocabulary compiled from link_embeddings.json; its term() is the inverse mapping."""
     try:
-        with open(filename, 'r') as f:
-            link_embeddings = json.load(f)
-        # Create inverse mapping
-        inverse_link_embeddings = {str(v): k for k, v in link_embeddings.items()}
-        return inverse_link_embeddings
+        # Memory-mapped (see vocabulary.py), compiled next to the JSON file on first use
+        return open_vocabulary(filename)
     except Exception as e:
         logging.error(f"Error loading link embeddings from '{filename}': {e}")
-        return {}
+        return None
 
 def read_embeddings(db_filename: str, offset: int, limit: int):
     """Read embeddings from the SQLite database."""
@@ -98,8 +99,10 @@ def main():
     link_embeddings_filename = 'wiki_knowledge/embeddings/link_embeddings.json'
     dimension = 10000
 
-    # Load the inverse link embeddings
-    inverse_link_embeddings = load_link_embeddings(link_embeddings_filename)
+    # Open the link vocabulary, which maps emb_idx back to link names
+    link_vocabulary = load_link_embeddings(link_embeddings_filename)
+    if link_vocabulary is None:
+        return
 
     # Create the custom embedding function instance
     embedding_function = CustomEmbeddingFunction()
@@ -134,7 +137,7 @@ def main():
         embeddings = []
 
         for emb_idx, sparse_embedding_json in rows:
-            name = inverse_link_embeddings.get(str(emb_idx), None)
+            name = link_vocabulary.term(emb_idx)
             if not name:
                 continue
 
@@ -1,7 +1,12 @@
 import json
+import os
+import sys
 from collections import defaultdict
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from vocabulary import open_vocabulary
+
 def load_json(filename):
     """Load a JSON file and return its contents."""
     with open(filename, 'r') as file:
@@ -10,13 +15,14 @@ def load_json(filename):
 def process_verbs(verbout, verbembeddings, pageembeddings):
     """Process the verbs and create the desired dictionary structure."""
     result = {k:{'embedding': v, 'pages': []}for k,v in verbembeddings.items()}
-    inverse_embeddings = {v:k for k,v in verbembeddings.items()}
 
     for page, verbs in tqdm(verbout.items(), desc='Processing page'):
         if page not in pageembeddings: continue
         for verb in verbs:
-            if inverse_embeddings[verb] in result:
-                result[inverse_embeddings[verb]]['pages'].append(pageembeddings[page])
+            # The vocabulary maps an emb_idx back to its verb without an inverse dict
+            verb_name = verbembeddings.term(verb)
+            if verb_name in result:
+                result[verb_name]['pages'].append(pageembeddings[page])
     return result
 
 def save_json(data, filename):
@@ -32,8 +38,8 @@ output_file = 'processed_verbs.json'
 
 # Load JSON data
 verbout = load_json(verbout_file)
-verbembeddings = load_json(verbembeddings_file)
-pageembeddings = load_json(pageembeddings_file)
+verbembeddings = open_vocabulary(verbembeddings_file)  # memory-mapped, see vocabulary.py
+pageembeddings = open_vocabulary(pageembeddings_file)
 
 # Process verbs
 processed_verbs = process_verbs(verbout, verbembeddings, pageembeddings)
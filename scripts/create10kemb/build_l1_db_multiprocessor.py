@@ -6,6 +6,11 @@ import os
 import signal
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from link_codec import decode_links, decode_links_many
+from neighbor_cache import NeighborCache
+from containment import MinHashSignatures, iter_coreferential_groups, load_records_matrix, open_records_store, rows_of_keys
+
 def create_level1_table(cursor):
     """Create the level1 table in the SQLite database."""
     cursor.execute('''
@@ -25,17 +30,19 @@ def insert_records(cursor, records):
     ''', records)
 
 def get_value_from_db(cursor, key, column="key"):
-    """Retrieve the JSON-loaded value associated with a single key from the database."""
+    """Retrieve the decoded link list associated with a single key from the database."""
     cursor.execute(f'SELECT emb_idx, value FROM records WHERE {column}=?', (key,))
     row = cursor.fetchone()
-    return (row[0], json.loads(row[1])) if row else (None, None)
+    return (row[0], decode_links(row[1]).tolist()) if row else (None, None)
 
 def get_values_from_db(cursor, keys, column="key"):
-    """Retrieve the JSON-loaded values associated with a list of keys from the database."""
+    """Retrieve the decoded link lists, as np.uint32 arrays, associated with a list of keys from the database."""
     placeholders = ','.join(['?'] * len(keys))
     cursor.execute(f'SELECT key, emb_idx, value FROM records WHERE {column} IN ({placeholders})', keys)
     rows = cursor.fetchall()
-    return [[row[0], {row[1]: json.loads(row[2])}] for row in rows]
+    ids, offsets = decode_links_many([row[2] for row in rows])
+    offsets = offsets.tolist()
+    return [[row[0], {row[1]: ids[offsets[i]:offsets[i + 1]]}] for i, row in enumerate(rows)]
 
 def ensure_index(cursor, table, column):
     """Ensure that an index exists on the specified column in the table."""
@@ -43,20 +50,26 @@ def ensure_index(cursor, table, column):
     cursor.execute(f"PRAGMA index_list({table})")
     indexes = cursor.fetchall()
     index_exists = any(index_name == index[1] for index in indexes)
+    # Any index led by the column serves as well, such as the UNIQUE(key) index of build_records_db.py
+    for index in indexes:
+        cursor.execute(f'PRAGMA index_info("{index[1]}")')
+        columns = cursor.fetchall()
+        if columns and columns[0][2] == column:
+            index_exists = True
     if not index_exists:
         cursor.execute(f"CREATE INDEX {index_name} ON {table} ({column})")
         print(f"Created index {index_name} on {table}({column})")
 
-def find_coreferential_groups(original, name, keys, cursor):
+def find_coreferential_groups(original, name, keys, cursor, cache=None):
     """Find the largest group of keys that are co-referential."""
-    key_to_links = get_values_from_db(cursor, keys, "emb_idx")
+    key_to_links = cache.get_values(keys) if cache else get_values_from_db(cursor, keys, "emb_idx")
     emb_idcs = {original}
     names = {name}
     candidates = set(keys)
 
     for elem in key_to_links:
         for k, v in elem[1].items():
-            intersection = candidates.intersection(set(v))
+            intersection = candidates.intersection(v.tolist())
             if len(intersection) >= 0.8 * len(v):
                 emb_idcs.add(k)
                 names.add(elem[0])
@@ -73,8 +86,9 @@ def get_processed_names(write_db_filename):
     conn.close()
     return set(row[0] for row in rows)
 
-def process_key_batch(read_db_filename, write_db_filename, keys, index):
-    """Process a batch of keys to find and store co-referential groups."""
+def process_key_batch(read_db_filename, write_db_filename, keys, index, cache_bytes=80 << 20):
+    """Process a batch of keys to find and store co-referential groups. Rows met before are served from an LRU
+    cache of up to cache_bytes of decoded links (neighbor_cache.py); cache_bytes=0 queries SQLite for every key."""
     read_conn = sqlite3.connect(read_db_filename)
     read_cursor = read_conn.cursor()
     write_conn = sqlite3.connect(write_db_filename)
@@ -84,6 +98,7 @@ def process_key_batch(read_db_filename, write_db_filename, keys, index):
     ensure_index(read_cursor, "records", "emb_idx")
 
     processed_names = get_processed_names(write_db_filename)
+    cache = NeighborCache(read_cursor, cache_bytes) if cache_bytes else None
 
     print(f"Process {index} started with {len(keys)} keys.")
 
@@ -94,7 +109,7 @@ def process_key_batch(read_db_filename, write_db_filename, keys, index):
         original, links = get_value_from_db(read_cursor, k, "key")
         if original is None or links is None:
             continue
-        coreferential_groups, used_names = find_coreferential_groups(original, k, links, read_cursor)
+        coreferential_groups, used_names = find_coreferential_groups(original, k, links, read_cursor, cache)
         batch_records.append((k, json.dumps(list(coreferential_groups)), json.dumps(list(used_names))))
         if len(batch_records) >= 100:  # Adjust batch size as needed
             insert_records(write_cursor, batch_records)
@@ -105,10 +120,50 @@ def process_key_batch(read_db_filename, write_db_filename, keys, index):
         insert_records(write_cursor, batch_records)
         write_conn.commit()
 
+    if cache:
+        print(f"Process {index}: {cache.report()}")
     read_conn.close()
     write_conn.close()
     print(f"Process {index} finished.")
 
+def process_keys_matrix(read_db_filename, write_db_filename, keys, num_workers=None, block_size=64, lsh=None,
+                        store_dir=None):
+    """Process keys with the containment engine (containment.py): the records table is read into arrays once and
+    the co-referential groups of a block of keys are found together, without SQL queries per key. lsh=(bands,
+    rows_per_band) prunes candidates with large link lists by MinHash first, trading some recall for speed. With a
+    store_dir the arrays are memory-mapped from there (built on first use), so the workers share one copy."""
+    write_conn = sqlite3.connect(write_db_filename)
+    write_cursor = write_conn.cursor()
+    create_level1_table(write_cursor)
+    processed_names = get_processed_names(write_db_filename)
+    keys = [k for k in keys if k not in processed_names]
+
+    matrix = open_records_store(read_db_filename, store_dir) if store_dir else load_records_matrix(read_db_filename)
+    read_conn = sqlite3.connect(read_db_filename)
+    read_cursor = read_conn.cursor()
+    ensure_index(read_cursor, "records", "key")
+    rows = rows_of_keys(read_cursor, matrix, keys)
+    read_conn.close()
+    keys = [k for k, row in zip(keys, rows) if row >= 0]
+    rows = rows[rows >= 0]
+    signatures = MinHashSignatures(matrix, *lsh) if lsh else None
+
+    batch_records = []
+    groups = iter_coreferential_groups(matrix, rows, block_size=block_size, num_workers=num_workers,
+                                      signatures=signatures)
+    for k, (_, emb_idcs, names) in zip(keys, tqdm(groups, total=len(rows), desc="Processing keys")):
+        batch_records.append((k, json.dumps(list(set(emb_idcs))), json.dumps(list(set(names)))))
+        if len(batch_records) >= 1000:
+            insert_records(write_cursor, batch_records)
+            write_conn.commit()
+            batch_records.clear()
+
+    if batch_records:
+        insert_records(write_cursor, batch_records)
+        write_conn.commit()
+
+    write_conn.close()
+
 def distribute_keys(keys, num_workers):
     """Distribute keys in a round-robin fashion across workers."""
     keys = list(keys)
@@ -140,6 +195,14 @@ def main():
     max_workers = 1  # Set a reasonable limit on the number of processes
     num_workers = min(max_workers, cpu_count())
 
+    lsh = None  # e.g. (8, 4) to prune hub candidates by MinHash; see lsh_recall_report.py
+    use_matrix = True  # the containment engine over one database; False for the per-key SQL queries on copies
+    if use_matrix:
+        # No per-worker copies: every core maps the same records store and a single writer takes the results
+        process_keys_matrix(f'{db_filename}.db', f'{db_filename}_output.db', keys, cpu_count(), lsh=lsh,
+                            store_dir=f'{db_filename}_records')
+        return
+
     distributed_keys = distribute_keys(keys, num_workers)
 
     signal.signal(signal.SIGINT, signal_handler)
@@ -5,6 +5,11 @@ import os
 import signal
 import sys
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from link_codec import decode_links, decode_links_many
+from neighbor_cache import NeighborCache
+from containment import MinHashSignatures, iter_coreferential_groups, load_records_matrix, open_records_store, rows_of_keys
+
 def create_level1_table(cursor):
     """Create the level1 table in the SQLite database."""
     cursor.execute('''
@@ -24,17 +29,19 @@ def insert_records(cursor, records):
     ''', records)
 
 def get_value_from_db(cursor, key, column="key"):
-    """Retrieve the JSON-loaded value associated with a single key from the database."""
+    """Retrieve the decoded link list associated with a single key from the database."""
     cursor.execute(f'SELECT emb_idx, value FROM records WHERE {column}=?', (key,))
     row = cursor.fetchone()
-    return (row[0], json.loads(row[1])) if row else (None, None)
+    return (row[0], decode_links(row[1]).tolist()) if row else (None, None)
 
 def get_values_from_db(cursor, keys, column="key"):
-    """Retrieve the JSON-loaded values associated with a list of keys from the database."""
+    """Retrieve the decoded link lists, as np.uint32 arrays, associated with a list of keys from the database."""
     placeholders = ','.join(['?'] * len(keys))
     cursor.execute(f'SELECT key, emb_idx, value FROM records WHERE {column} IN ({placeholders})', keys)
     rows = cursor.fetchall()
-    return [[row[0], {row[1]: json.loads(row[2])}] for row in rows]
+    ids, offsets = decode_links_many([row[2] for row in rows])
+    offsets = offsets.tolist()
+    return [[row[0], {row[1]: ids[offsets[i]:offsets[i + 1]]}] for i, row in enumerate(rows)]
 
 def ensure_index(cursor, table, column):
     """Ensure that an index exists on the specified column in the table."""
@@ -42,20 +49,26 @@ def ensure_index(cursor, table, column):
     cursor.execute(f"PRAGMA index_list({table})")
     indexes = cursor.fetchall()
     index_exists = any(index_name == index[1] for index in indexes)
+    # Any index led by the column serves as well, such as the UNIQUE(key) index of build_records_db.py
+    for index in indexes:
+        cursor.execute(f'PRAGMA index_info("{index[1]}")')
+        columns = cursor.fetchall()
+        if columns and columns[0][2] == column:
+            index_exists = True
     if not index_exists:
         cursor.execute(f"CREATE INDEX {index_name} ON {table} ({column})")
         print(f"Created index {index_name} on {table}({column})")
 
-def find_coreferential_groups(original, name, keys, cursor):
+def find_coreferential_groups(original, name, keys, cursor, cache=None):
     """Find the largest group of keys that are co-referential."""
-    key_to_links = get_values_from_db(cursor, keys, "emb_idx")
+    key_to_links = cache.get_values(keys) if cache else get_values_from_db(cursor, keys, "emb_idx")
     emb_idcs = {original}
     names = {name}
     candidates = set(keys)
 
     for elem in key_to_links:
         for k, v in elem[1].items():
-            intersection = candidates.intersection(set(v))
+            intersection = candidates.intersection(v.tolist())
             if len(intersection) >= 0.8 * len(v):
                 emb_idcs.add(k)
                 names.add(elem[0])
@@ -72,8 +85,9 @@ def get_processed_names(write_db_filename):
     conn.close()
     return set(row[0] for row in rows)
 
-def process_keys(read_db_filename, write_db_filename, keys):
-    """Process keys to find and store co-referential groups."""
+def process_keys(read_db_filename, write_db_filename, keys, cache_bytes=80 << 20):
+    """Process keys to find and store co-referential groups. Rows met before are served from an LRU cache of up to
+    cache_bytes of decoded links (neighbor_cache.py); cache_bytes=0 queries SQLite for every key."""
     read_conn = sqlite3.connect(read_db_filename)
     read_cursor = read_conn.cursor()
     write_conn = sqlite3.connect(write_db_filename)
@@ -83,6 +97,7 @@ def process_keys(read_db_filename, write_db_filename, keys):
     ensure_index(read_cursor, "records", "emb_idx")
 
     processed_names = get_processed_names(write_db_filename)
+    cache = NeighborCache(read_cursor, cache_bytes) if cache_bytes else None
 
     batch_records = []
     for k in tqdm(keys, desc="Processing keys"):
@@ -91,7 +106,7 @@ def process_keys(read_db_filename, write_db_filename, keys):
         original, links = get_value_from_db(read_cursor, k, "key")
         if original is None or links is None:
             continue
-        coreferential_groups, used_names = find_coreferential_groups(original, k, links, read_cursor)
+        coreferential_groups, used_names = find_coreferential_groups(original, k, links, read_cursor, cache)
         batch_records.append((k, json.dumps(list(coreferential_groups)), json.dumps(list(used_names))))
         if len(batch_records) >= 100:  # Adjust batch size as needed
             insert_records(write_cursor, batch_records)
@@ -102,7 +117,47 @@ def process_keys(read_db_filename, write_db_filename, keys):
         insert_records(write_cursor, batch_records)
         write_conn.commit()
 
+    if cache:
+        print(cache.report())
+    read_conn.close()
+    write_conn.close()
+
+def process_keys_matrix(read_db_filename, write_db_filename, keys, num_workers=1, block_size=64, lsh=None,
+                        store_dir=None):
+    """Process keys with the containment engine (containment.py): the records table is read into arrays once and
+    the co-referential groups of a block of keys are found together, without SQL queries per key. lsh=(bands,
+    rows_per_band) prunes candidates with large link lists by MinHash first, trading some recall for speed. With a
+    store_dir the arrays are memory-mapped from there (built on first use), so the workers share one copy."""
+    write_conn = sqlite3.connect(write_db_filename)
+    write_cursor = write_conn.cursor()
+    create_level1_table(write_cursor)
+    processed_names = get_processed_names(write_db_filename)
+    keys = [k for k in keys if k not in processed_names]
+
+    matrix = open_records_store(read_db_filename, store_dir) if store_dir else load_records_matrix(read_db_filename)
+    read_conn = sqlite3.connect(read_db_filename)
+    read_cursor = read_conn.cursor()
+    ensure_index(read_cursor, "records", "key")
+    rows = rows_of_keys(read_cursor, matrix, keys)
     read_conn.close()
+    keys = [k for k, row in zip(keys, rows) if row >= 0]
+    rows = rows[rows >= 0]
+    signatures = MinHashSignatures(matrix, *lsh) if lsh else None
+
+    batch_records = []
+    groups = iter_coreferential_groups(matrix, rows, block_size=block_size, num_workers=num_workers,
+                                      signatures=signatures)
+    for k, (_, emb_idcs, names) in zip(keys, tqdm(groups, total=len(rows), desc="Processing keys")):
+        batch_records.append((k, json.dumps(list(set(emb_idcs))), json.dumps(list(set(names)))))
+        if len(batch_records) >= 1000:
+            insert_records(write_cursor, batch_records)
+            write_conn.commit()
+            batch_records.clear()
+
+    if batch_records:
+        insert_records(write_cursor, batch_records)
+        write_conn.commit()
+
     write_conn.close()
 
 def cleanup(db_filename):
@@ -129,7 +184,12 @@ def main():
 
     signal.signal(signal.SIGINT, signal_handler)
 
-    process_keys(db_filename, db_filename, keys)
+    lsh = None  # e.g. (8, 4) to prune hub candidates by MinHash; see lsh_recall_report.py
+    use_matrix = True  # the containment engine; False for the per-key SQL queries
+    if use_matrix:
+        process_keys_matrix(db_filename, db_filename, keys, lsh=lsh, store_dir='wikilinksdata_records')
+    else:
+        process_keys(db_filename, db_filename, keys)
 
     cleanup(db_filename)
 
@@ -1,54 +1,134 @@
-import json
+import os
 import sqlite3
+import sys
+from itertools import islice
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from page_segments import iter_page_embeddings
+from vocabulary import open_vocabulary
+from link_codec import encode_links_many
+
+# Bulk-load settings: the database is built under a temporary name and renamed into place when complete,
+# so a crash can only ever lose the temporary file and no rollback journal or fsync is needed while loading
+BULK_LOAD_PRAGMAS = [
+    'PRAGMA journal_mode = OFF',
+    'PRAGMA synchronous = OFF',
+    'PRAGMA locking_mode = EXCLUSIVE',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -1048576',  # 1 GiB of page cache for the UNIQUE(key) index
+]
+
 def create_table(cursor):
     """Create the table in the SQLite database."""
+    # UNIQUE(key) keeps the first record of a title, as the old in-memory check set did. Without AUTOINCREMENT
+    # an ignored duplicate does not use up an id, so ids stay consecutive in page order.
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            id INTEGER PRIMARY KEY,
             key TEXT,
             emb_idx INTEGER,
-            value TEXT
+            value BLOB,
+            UNIQUE(key)
         )
     ''')
 
-def insert_record(cursor, key, myidx, value):
-    """Insert a record into the SQLite database."""
-    cursor.execute('''
-        INSERT INTO records (key, emb_idx, value)
+def create_indexes(cursor):
+    """Build the secondary indexes once, after the load; the UNIQUE(key) index already serves lookups by key."""
+    cursor.execute('CREATE INDEX IF NOT EXISTS records_emb_idx_idx ON records (emb_idx)')
+
+def insert_records(cursor, records):
+    """Insert a batch of records into the SQLite database, skipping keys that are already present."""
+    cursor.executemany('''
+        INSERT OR IGNORE INTO records (key, emb_idx, value)
         VALUES (?, ?, ?)
-    ''', (key, myidx, value))
-
-def process_jsonl_to_sqlite(jsonl_filename, sqlite_db_filename, link_indices):
-    """Process JSONL file and insert data into SQLite database."""
-    with open(link_indices, "r") as inj:
-        myindices = json.load(inj)
-    check = set()
-    conn = sqlite3.connect(sqlite_db_filename)
+    ''', records)
+
+def other_tables(db_filename):
+    """Tables of an existing database besides records, e.g. level1alt or embeddings built from it."""
+    if not os.path.exists(db_filename):
+        return []
+    conn = sqlite3.connect(db_filename)
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name != 'records' AND name NOT LIKE 'sqlite_%'")]
+    conn.close()
+    return names
+
+def swap_records_table(tmp_filename, sqlite_db_filename):
+    """Replace only the records table of sqlite_db_filename with the one built in tmp_filename, in one transaction."""
+    conn = sqlite3.connect(sqlite_db_filename, isolation_level=None)
     cursor = conn.cursor()
-    
+    cursor.execute('ATTACH DATABASE ? AS built', (tmp_filename,))
+    cursor.execute('BEGIN IMMEDIATE')
+    cursor.execute('DROP TABLE IF EXISTS main.records')
     create_table(cursor)
-    
-    with open(jsonl_filename, 'r') as f:
-        for line in tqdm(f, desc="Processing JSONL file"):
-            record = json.loads(line)
-            if record[0] in check:
-                continue
-            else:
-                check.add(record[0])
-            if record[0] in myindices:
-                myidx = myindices[record[0]]
-            else:
-                myidx = "UNKNOWN"
-            insert_record(cursor, record[0], myidx, json.dumps(record[2]))
-                
+    cursor.execute('INSERT INTO main.records (id, key, emb_idx, value) SELECT id, key, emb_idx, value FROM built.records ORDER BY id')
+    create_indexes(cursor)
+    cursor.execute('COMMIT')
+    cursor.execute('DETACH DATABASE built')
+    conn.close()
+    os.remove(tmp_filename)
+
+def iter_rows(jsonl_filename, myindices):
+    # Reads page_embeddings.jsonl or a directory of binary page embedding segments
+    for record in iter_page_embeddings(jsonl_filename):
+        myidx = myindices.get(record[0])
+        if myidx is None:
+            myidx = "UNKNOWN"
+        yield record[0], myidx, record[2]
+
+def encode_batch(batch):
+    # Link lists are stored as delta-varint BLOBs, encoded for the whole batch at once (see link_codec.py)
+    values = encode_links_many([row[2] for row in batch])
+    return [(key, emb_idx, value) for (key, emb_idx, _), value in zip(batch, values)]
+
+def process_jsonl_to_sqlite(jsonl_filename, sqlite_db_filename, link_indices, batch_size=50000, commit_every=2000000):
+    """Process page embeddings (JSONL or segments) and bulk load them into a new SQLite database."""
+    myindices = open_vocabulary(link_indices)  # memory-mapped, see vocabulary.py
+    tmp_filename = sqlite_db_filename + '.tmp'
+    if os.path.exists(tmp_filename):
+        os.remove(tmp_filename)
+    conn = sqlite3.connect(tmp_filename)
+    cursor = conn.cursor()
+    for pragma in BULK_LOAD_PRAGMAS:
+        cursor.execute(pragma)
+
+    create_table(cursor)
+
+    # Batched executemany inside large transactions; only one batch of rows is in memory at a time
+    rows = iter_rows(jsonl_filename, myindices)
+    pending = 0
+    with tqdm(desc="Loading page embeddings") as pbar:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            insert_records(cursor, encode_batch(batch))
+            pending += len(batch)
+            pbar.update(len(batch))
+            if pending >= commit_every:
+                conn.commit()
+                pending = 0
+    conn.commit()
+
+    create_indexes(cursor)
     conn.commit()
+    inserted = cursor.execute('SELECT COUNT(*) FROM records').fetchone()[0]
     conn.close()
-    print(f"Data inserted into {sqlite_db_filename}")
+    myindices.close()
 
+    # A database that also holds tables built from the records (level1alt, embeddings, ...) keeps them: only its
+    # records table is swapped, which copies the rows once more. Otherwise the new file is renamed into place.
+    kept = other_tables(sqlite_db_filename)
+    if kept:
+        print(f"Replacing only the records table of {sqlite_db_filename}, keeping {', '.join(kept)}")
+        swap_records_table(tmp_filename, sqlite_db_filename)
+    else:
+        os.replace(tmp_filename, sqlite_db_filename)
+    print(f"{inserted} records inserted into {sqlite_db_filename}")
 
-jsonl_filename = 'page_embeddings.jsonl'
-link_indices = 'data/link_embeddings.json'
-sqlite_db_filename = 'wikilinksdata.db'
-process_jsonl_to_sqlite(jsonl_filename, sqlite_db_filename, link_indices)
+if __name__ == "__main__":
+    jsonl_filename = 'page_embeddings'  # or 'page_embeddings.jsonl'
+    link_indices = 'data/link_embeddings.json'
+    sqlite_db_filename = 'wikilinksdata.db'
+    process_jsonl_to_sqlite(jsonl_filename, sqlite_db_filename, link_indices)
@@ -1,9 +1,13 @@
 import sqlite3
 import json
+import os
 import signal
 import sys
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from link_codec import decode_links_many
+
 def load_reverse_mapping(filename):
     """Load the reverse mapping JSON file."""
     with open(filename, 'r') as f:
@@ -22,9 +26,12 @@ def create_output_table(cursor):
 def process_batch(batch, reverse_mapping, key_list):
     """Process a batch of records."""
     processed_records = []
-    for record in tqdm(batch, desc="Processing batch"):
+    # Decode every link list of the batch in one pass (see link_codec.py)
+    ids, offsets = decode_links_many([record[3] for record in batch])
+    ids, offsets = ids.tolist(), offsets.tolist()
+    for i, record in enumerate(tqdm(batch, desc="Processing batch")):
         emb_idx = record[2]
-        values = json.loads(record[3])
+        values = ids[offsets[i]:offsets[i + 1]]
 
         if not values:
             continue
@@ -0,0 +1,25 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from containment import MinHashSignatures, load_records_matrix, recall_report
+
+# (bands, rows_per_band) settings to compare; more bands raise recall, more rows per band prune harder
+SETTINGS = [(4, 4), (8, 4), (16, 4), (8, 8), (16, 8)]
+
+def report_lsh_recall(db_filename, sample_size=20000, min_links=256, settings=SETTINGS, seed=0):
+    """Print the recall and speed of the approximate L1 mode against the exact one on a sample of pages."""
+    matrix = load_records_matrix(db_filename)
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(matrix), size=min(sample_size, len(matrix)), replace=False))
+    print(f"{'bands':>5} {'rows':>4} {'pairs':>10} {'found':>10} {'recall':>8} {'exact':>9} {'approx':>9}")
+    for bands, rows_per_band in settings:
+        signatures = MinHashSignatures(matrix, bands, rows_per_band, min_links, seed)
+        result = recall_report(matrix, rows, signatures)
+        print(f"{bands:>5} {rows_per_band:>4} {result['pairs']:>10} {result['found']:>10} {result['recall']:>8.4f} "
+              f"{result['exact_seconds']:>8.2f}s {result['approximate_seconds']:>8.2f}s")
+
+if __name__ == '__main__':
+    db_filename = 'wikilinksdata.db'
+    report_lsh_recall(db_filename)
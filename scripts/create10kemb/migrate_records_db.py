@@ -0,0 +1,55 @@
+import json
+import os
+import sqlite3
+import sys
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from link_codec import encode_links_many
+
+def iter_json_rows(cursor, batch_size):
+    """Yield batches of (id, value) for the rows whose value is still JSON text, walking the table by id."""
+    last_id = -1
+    while True:
+        cursor.execute('''
+            SELECT id, value FROM records
+            WHERE id > ? AND typeof(value) = 'text'
+            ORDER BY id LIMIT ?
+        ''', (last_id, batch_size))
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        yield rows
+        last_id = rows[-1][0]
+
+def migrate_records(db_filename, batch_size=50000, commit_every=2000000, vacuum=True):
+    """Re-encode the JSON link lists of a records table as delta-varint BLOBs (see link_codec.py)."""
+    conn = sqlite3.connect(db_filename)
+    read_cursor = conn.cursor()
+    write_cursor = conn.cursor()
+    total = read_cursor.execute("SELECT COUNT(*) FROM records WHERE typeof(value) = 'text'").fetchone()[0]
+
+    # Rows already stored as BLOBs are skipped, so an interrupted migration picks up where it stopped
+    pending = 0
+    with tqdm(total=total, desc="Migrating records") as pbar:
+        for rows in iter_json_rows(read_cursor, batch_size):
+            values = encode_links_many([json.loads(row[1]) for row in rows])
+            write_cursor.executemany('UPDATE records SET value = ? WHERE id = ?',
+                                     [(value, row[0]) for row, value in zip(rows, values)])
+            pending += len(rows)
+            pbar.update(len(rows))
+            if pending >= commit_every:
+                conn.commit()
+                pending = 0
+    conn.commit()
+
+    if vacuum:
+        # The BLOBs take a fraction of the space of the JSON text; VACUUM hands the freed pages back
+        print("Vacuuming...")
+        conn.execute('VACUUM')
+    conn.close()
+    print(f"{total} records migrated in {db_filename}")
+
+if __name__ == "__main__":
+    db_filename = 'wikilinksdata.db'
+    migrate_records(db_filename)
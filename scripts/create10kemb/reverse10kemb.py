@@ -1,6 +1,11 @@
 import json
+import os
+import sys
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from vocabulary import open_vocabulary
+
 def load_json(filename):
     """Load a JSON file and return the data."""
     with open(filename, 'r') as f:
@@ -40,7 +45,7 @@ def main():
 
     # Load the JSON files
     cooccurrence_dict = load_json(cooccurrence_filename)
-    links_embeddings = load_json(embeddings_filename)
+    links_embeddings = open_vocabulary(embeddings_filename)  # memory-mapped, see vocabulary.py
 
     # Create the reverse mapping
     reverse_mapping = create_reverse_mapping(cooccurrence_dict, links_embeddings)
@@ -1,50 +1,22 @@
-from lxml import etree
 import os
-import re
-from tqdm import tqdm
+import sys
 
-def filter_wikipedia_dump(dump_path, output_path):
-    # Compile a regex pattern for extracting links
-    link_pattern = re.compile(r"\[\[(.+?)\]\]")
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from dump_pipeline import run_pipeline
+from extractors import FilterExtractor
 
-    # Create output directory if it doesn't exist
-    output_dir = os.path.dirname(output_path)
-    os.makedirs(output_dir, exist_ok=True)
-
-    context = etree.iterparse(dump_path, events=('end',), tag='{http://www.mediawiki.org/xml/export-0.10/}page')
-    root = None
-    output_tree = None
-    counter = 0
-
-    with open(output_path, 'wb') as output_file:
-        for event, elem in tqdm(context, desc="Processing pages"):
-            if root is None:
-                root = elem.getroottree()
-
-            title = elem.findtext('{http://www.mediawiki.org/xml/export-0.10/}title')
-            text = elem.findtext('.//{http://www.mediawiki.org/xml/export-0.10/}text')
-
-            if text:
-                links = link_pattern.findall(text)
-                links = [link.split("|")[0] for link in links]  # Split and take the first part of the link
-                links = [link for link in links if not link.lower().startswith('file:') and not link.lower().endswith('.png')]  # Filter out 'File:' links and images
-                
-                if len(links) > 1:
-                    if output_tree is None:
-                        output_tree = etree.ElementTree(elem)
-                        output_tree.write(output_file, encoding='utf-8', xml_declaration=True)
-                    else:
-                        output_file.write(etree.tostring(elem, encoding='utf-8'))
-            
-            # Clear the element to free up memory
-            elem.clear()
-            while elem.getprevious() is not None:
-                del elem.getparent()[0]
-
-    print(f"Filtered dump saved to {output_path}")
+# Keep the pages with more than one (non file/image) link. Workers decide which pages to keep and the parent
+# writes them in dump order; a .bz2 multistream dump (index_path) or a page index (page_index_path) also lets
+# the workers parse the dump themselves. Each output file gets a page index next to it.
+def filter_wikipedia_dump(dump_path, output_path, index_path=None, page_index_path=None, num_workers=None, shard_pages=None):
+    filter_extractor = FilterExtractor(output_path, dump_path, index_path, shard_pages)
+    run_pipeline(dump_path, [filter_extractor], index_path, page_index_path, num_workers)
 
 if __name__ == "__main__":
     dump_path = 'enwiki-latest-pages-articles.xml'  # Replace with your input XML file path
+    index_path = None  # Set with dump_path = 'enwiki-latest-pages-articles-multistream.xml.bz2' to read the compressed dump
+    page_index_path = None  # e.g. 'enwiki-latest-pages-articles.index.jsonl' built with page_index.py
     output_path = 'wiki_knowledge/filtered_wikipedia_dump.xml'  # Replace with your output XML file path
+    shard_pages = None  # e.g. 1000000 to write filtered_wikipedia_dump_00000.xml, _00001.xml, ... instead
     
-    filter_wikipedia_dump(dump_path, output_path)
+    filter_wikipedia_dump(dump_path, output_path, index_path, page_index_path, shard_pages=shard_pages)
@@ -0,0 +1,74 @@
+import json
+import re
+import time
+from itertools import islice
+from dump_source import iter_pages
+from link_matcher import LinkMatcher, open_matcher
+
+link_pattern = re.compile(r"\[\[(.+?)\]\]")
+
+# Load JSON data
+def load_json(file_path):
+    with open(file_path, 'r') as file:
+        return json.load(file)
+
+# The original mine_embeddings loop: one dict probe per whitespace token per index
+def split_and_probe(text, verb_index, link_index):
+    verb_vector = []
+    link_vector = []
+    for word in text.split():
+        if word in verb_index:
+            verb_vector.append(verb_index[word])
+        if word in link_index:
+            link_vector.append(link_index[word])
+    return verb_vector, link_vector
+
+# Link targets the page explicitly links to that are in the vocabulary: the mentions we expect to find
+def expected_links(text, link_index):
+    targets = {link.split("|")[0] for link in link_pattern.findall(text)}
+    return {link_index[t] for t in targets if t in link_index}
+
+# Time a matcher over the pages and measure recall of the explicitly linked vocabulary titles. match_many, when
+# given, matches the pages batch_size at a time, as mine_embeddings.py does.
+def run(name, pages, match, link_index, match_many=None, batch_size=1000):
+    found = 0
+    expected = 0
+    start = time.perf_counter()
+    if match_many:
+        results = [result for i in range(0, len(pages), batch_size)
+                   for result in match_many([text for _, text in pages[i:i + batch_size]])]
+    else:
+        results = [match(text) for _, text in pages]
+    elapsed = time.perf_counter() - start
+    for (_, text), (verb_vector, link_vector) in zip(pages, results):
+        targets = expected_links(text, link_index)
+        expected += len(targets)
+        found += len(targets & set(link_vector))
+    recall = found / expected if expected else 0.0
+    print(f"{name:>21}: {len(pages) / elapsed:10.1f} pages/sec, link recall {recall:.3f} ({found}/{expected})")
+
+def main(dump_path, verb_index_path, link_index_path, num_pages=2000, index_path=None):
+    verb_index = load_json(verb_index_path)
+    link_index = load_json(link_index_path)
+
+    start = time.perf_counter()
+    matcher = LinkMatcher(verb_index, link_index)
+    print(f"Built matcher over {len(verb_index) + len(link_index)} entries in {time.perf_counter() - start:.1f}s")
+    start = time.perf_counter()
+    compiled = open_matcher(verb_index_path, link_index_path)
+    print(f"Opened compiled matcher {compiled.path} in {time.perf_counter() - start:.1f}s")
+
+    pages = [(p.title, p.text) for p in islice(iter_pages(dump_path, index_path), num_pages) if p.text]
+    print(f"Benchmarking on {len(pages)} pages")
+
+    run("split-and-probe", pages, lambda text: split_and_probe(text, verb_index, link_index), link_index)
+    run("LinkMatcher", pages, matcher.match, link_index)
+    run("CompiledMatcher", pages, compiled.match, link_index)
+    run("CompiledMatcher/batch", pages, None, link_index, compiled.match_many)
+
+if __name__ == "__main__":
+    dump_path = 'enwiki-20240501-pages-articles15.xml-p17324603p17460152'
+    verb_index_path = 'data/verb_embeddings.json'
+    link_index_path = 'data/link_embeddings.json'
+
+    main(dump_path, verb_index_path, link_index_path)
@@ -0,0 +1,89 @@
+import json
+import os
+from page_segments import write_segment
+
+MANIFEST_NAME = 'manifest.jsonl'
+TMP_SUFFIX = '.tmp'
+
+# Write a file under a temporary name, fsync it and rename it into place, so readers never see a partial file
+def atomic_write(path, data):
+    tmp_path = path + TMP_SUFFIX
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+# Batch ids recorded as finished; a torn last line from a crash is ignored
+def load_manifest(segment_dir):
+    done = set()
+    manifest_path = os.path.join(segment_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return done
+    with open(manifest_path, 'r') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['batch'])
+            except (ValueError, KeyError):
+                continue
+    return done
+
+# How the batch ids of a directory are numbered, e.g. 'pages:10000' for page_number // 10000, from the header line
+# of its manifest; None for a new directory or one written before manifests had a header
+def manifest_numbering(segment_dir):
+    manifest_path = os.path.join(segment_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r') as f:
+        for line in f:
+            try:
+                return json.loads(line)['numbering']
+            except (ValueError, KeyError):
+                continue
+    return None
+
+# Batch ids of another numbering name other pages, so resuming with them would skip the wrong work
+def check_numbering(segment_dir, numbering):
+    recorded = manifest_numbering(segment_dir)
+    if numbering and recorded and recorded != numbering:
+        raise ValueError(f"{segment_dir} holds batches numbered {recorded}, not {numbering}: "
+                         "resume with the same batch size or write to another directory")
+
+# Exactly-once batch outputs: one page embeddings segment and one sentences file per batch id,
+# each renamed into place, then the batch id appended to the manifest. A restart skips manifest batches
+# and simply overwrites the files of any batch that was in flight.
+class BatchCheckpoint:
+    def __init__(self, segment_dir, sentences_dir, compress=False, numbering=None):
+        self.segment_dir = segment_dir
+        self.sentences_dir = sentences_dir
+        self.compress = compress
+        for directory in (segment_dir, sentences_dir):
+            os.makedirs(directory, exist_ok=True)
+            for name in os.listdir(directory):
+                if name.endswith(TMP_SUFFIX):
+                    os.remove(os.path.join(directory, name))
+        check_numbering(segment_dir, numbering)
+        manifest_path = os.path.join(segment_dir, MANIFEST_NAME)
+        self.manifest = open(manifest_path, 'a')
+        # Terminate a torn last line so the next entry starts on its own line
+        if self.manifest.tell() > 0:
+            with open(manifest_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self.manifest.write('\n')
+        elif numbering:
+            self.manifest.write(json.dumps({'numbering': numbering}) + '\n')
+            self.manifest.flush()
+
+    def commit(self, batch_id, verb_link_vectors, intersected_sentences):
+        if verb_link_vectors:
+            write_segment(os.path.join(self.segment_dir, f'batch_{batch_id:08d}.wvs'), verb_link_vectors, self.compress)
+        if intersected_sentences:
+            lines = ''.join(json.dumps(sentence) + '\n' for sentence in intersected_sentences)
+            atomic_write(os.path.join(self.sentences_dir, f'batch_{batch_id:08d}.jsonl'), lines.encode('utf-8'))
+        self.manifest.write(json.dumps({'batch': batch_id, 'vectors': len(verb_link_vectors), 'sentences': len(intersected_sentences)}) + '\n')
+        self.manifest.flush()
+        os.fsync(self.manifest.fileno())
+
+    def close(self):
+        self.manifest.close()
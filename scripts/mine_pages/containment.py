@@ -0,0 +1,333 @@
+import json
+import hashlib
+import multiprocessing as mp
+import os
+import sqlite3
+import time
+import numpy as np
+from tqdm import tqdm
+from degree_stats import TitleBlob
+from link_bfs import gather
+from link_codec import decode_links_many
+
+# Link containment between records for the level-1 co-referential groups of build_l1_db_*.py.
+#
+# A page a and a page b it links to (a records row whose emb_idx is one of a's links) are co-referential when
+# at least threshold * len(b's links) of b's distinct links are also links of a, len counting duplicates, as the
+# per-key SQL version tested len(intersection) >= 0.8 * len(v). The overlap |N(a) ∩ N(b)| is entry (a, b) of
+# A·Aᵀ for the binary page x link incidence matrix A, and it is only needed where a links to b, so it is a
+# masked sparse product: for a block of query rows, the rows they link to are gathered from the CSR in one go and
+# each gathered link is looked up in the sorted row of the query it belongs to.
+UNKNOWN = -1  # emb_idx of records whose title has no link embedding (stored as "UNKNOWN")
+LINK_SPACE = 1 << 32  # link ids are uint32, so owner * LINK_SPACE + link orders (owner, link) pairs
+
+# Records store directory layout (.npy arrays are opened with mmap_mode='r', so every worker maps the same pages):
+#   ids.npy            int64[n]     records.id of row i, ascending
+#   emb_idx.npy        int64[n]     emb_idx of row i, UNKNOWN for "UNKNOWN"
+#   link_counts.npy    int64[n]     links of row i, duplicates included
+#   indptr.npy         int64[n+1]   distinct links of row i are indices[indptr[i]:indptr[i + 1]], sorted
+#   indices.npy        uint32[m]
+#   emb_order.npy      int64[n]     rows by ascending emb_idx
+#   sorted_emb.npy     int64[n]     emb_idx[emb_order]
+#   title_offsets.npy  uint64[n+1]  byte offsets of row titles in titles.bin
+#   titles.bin         UTF-8 titles back to back
+#   meta.json          the database the store was built from and its records fingerprint; written last
+STORE_ARRAYS = ['ids', 'emb_idx', 'link_counts', 'indptr', 'indices', 'emb_order', 'sorted_emb', 'title_offsets']
+TITLES = 'titles.bin'
+META = 'meta.json'
+FINGERPRINT_ROWS = 64  # rows at each end of the records table checksummed into the fingerprint
+
+class RecordsMatrix:
+    """The records table as arrays: row i is the i-th record in id order, its distinct links sorted in
+    indices[indptr[i]:indptr[i + 1]] and its link count, duplicates included, in link_counts[i]."""
+
+    def __init__(self, ids, emb_idx, link_counts, indptr, indices, titles, emb_order=None, sorted_emb=None,
+                 store_dir=None):
+        self.ids = ids
+        self.emb_idx = emb_idx
+        self.link_counts = link_counts
+        self.indptr = indptr
+        self.indices = indices
+        self.titles = titles
+        # Rows by emb_idx, for the rows a query links to
+        self.emb_order = np.argsort(emb_idx, kind='stable') if emb_order is None else emb_order
+        self.sorted_emb = emb_idx[self.emb_order] if sorted_emb is None else sorted_emb
+        self.store_dir = store_dir
+
+    # A matrix opened from a store pickles as its path, so even spawned workers map the arrays instead of copying them
+    def __reduce_ex__(self, protocol):
+        if self.store_dir is None:
+            return super().__reduce_ex__(protocol)
+        return open_records_matrix, (self.store_dir,)
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Rows of the given record ids, -1 where there is no such record
+    def rows_of_ids(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.searchsorted(self.ids, ids)
+        found = rows < len(self.ids)
+        found[found] = self.ids[rows[found]] == ids[found]
+        return np.where(found, rows, -1)
+
+    # emb_idx of rows as the records table holds them
+    def emb_values(self, rows):
+        return ["UNKNOWN" if value == UNKNOWN else value for value in self.emb_idx[rows].tolist()]
+
+    def titles_of(self, rows):
+        starts = self.titles.offsets[rows].tolist()
+        ends = self.titles.offsets[rows + 1].tolist()
+        return [bytes(self.titles.data[start:end]).decode('utf-8') for start, end in zip(starts, ends)]
+
+# Sorted, distinct links per row from a decoded batch; JSON rows of an unmigrated table come back unsorted
+def distinct_links(ids, offsets):
+    counts = np.diff(offsets)
+    owners = np.repeat(np.arange(len(counts)), counts)
+    ids = ids.astype(np.int64)
+    if len(ids) > 1 and np.any((np.diff(ids) < 0) & (owners[1:] == owners[:-1])):
+        ids = ids[np.lexsort((ids, owners))]
+    keep = np.ones(len(ids), dtype=bool)
+    keep[1:] = (ids[1:] != ids[:-1]) | (owners[1:] != owners[:-1])
+    return ids[keep].astype(np.uint32), np.bincount(owners[keep], minlength=len(counts)), counts
+
+# One pass over the records table in id order, batch_size rows per query
+def load_records_matrix(db_filename, batch_size=200000):
+    conn = sqlite3.connect(db_filename)
+    cursor = conn.cursor()
+    total = cursor.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+    ids, emb_idx, link_counts, row_lengths, indices, titles = [], [], [], [], [], []
+    last_id = -1
+    with tqdm(total=total, desc="Loading records") as pbar:
+        while True:
+            cursor.execute('SELECT id, key, emb_idx, value FROM records WHERE id > ? ORDER BY id LIMIT ?',
+                           (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            links, lengths, counts = distinct_links(*decode_links_many([row[3] for row in rows]))
+            ids.append(np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)))
+            emb_idx.append(np.fromiter((row[2] if isinstance(row[2], int) else UNKNOWN for row in rows),
+                                       dtype=np.int64, count=len(rows)))
+            link_counts.append(counts)
+            row_lengths.append(lengths)
+            indices.append(links)
+            titles.extend(row[1].encode('utf-8') for row in rows)
+            pbar.update(len(rows))
+    conn.close()
+
+    def join(chunks, dtype):
+        return np.concatenate(chunks).astype(dtype, copy=False) if chunks else np.zeros(0, dtype=dtype)
+
+    indptr = np.zeros(len(titles) + 1, dtype=np.int64)
+    np.cumsum(join(row_lengths, np.int64), out=indptr[1:])
+    title_offsets = np.zeros(len(titles) + 1, dtype=np.uint64)
+    np.cumsum([len(title) for title in titles], out=title_offsets[1:])
+    return RecordsMatrix(join(ids, np.int64), join(emb_idx, np.int64), join(link_counts, np.int64), indptr,
+                         join(indices, np.uint32), TitleBlob(title_offsets, b''.join(titles)))
+
+def write_records_store(matrix, store_dir, meta):
+    os.makedirs(store_dir, exist_ok=True)
+    meta_path = os.path.join(store_dir, META)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)  # the store is incomplete until meta.json is back
+    arrays = {'ids': matrix.ids, 'emb_idx': matrix.emb_idx, 'link_counts': matrix.link_counts,
+              'indptr': matrix.indptr, 'indices': matrix.indices, 'emb_order': matrix.emb_order,
+              'sorted_emb': matrix.sorted_emb, 'title_offsets': matrix.titles.offsets}
+    for name, values in arrays.items():
+        np.save(os.path.join(store_dir, name + '.npy'), values)
+    with open(os.path.join(store_dir, TITLES), 'wb') as f:
+        f.write(matrix.titles.data)
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f, indent=4)
+    print(f"Records store of {len(matrix)} rows and {len(matrix.indices)} links written to {store_dir}")
+
+def open_records_matrix(store_dir):
+    arrays = {name: np.load(os.path.join(store_dir, name + '.npy'), mmap_mode='r') for name in STORE_ARRAYS}
+    titles_path = os.path.join(store_dir, TITLES)
+    titles = np.memmap(titles_path, dtype=np.uint8, mode='r') if os.path.getsize(titles_path) else np.zeros(0, dtype=np.uint8)
+    return RecordsMatrix(arrays['ids'], arrays['emb_idx'], arrays['link_counts'], arrays['indptr'], arrays['indices'],
+                         TitleBlob(arrays['title_offsets'], titles), arrays['emb_order'], arrays['sorted_emb'],
+                         store_dir)
+
+# Record count, last id and a checksum of the first and last rows of a records table, to tell whether a store still
+# matches it. The checksum covers rows rewritten in place at either end, as a rebuild into the same ids is. The
+# file's size and mtime are left out: the l1 scripts write level1alt into the same database on every run.
+def records_fingerprint(db_filename, edge_rows=FINGERPRINT_ROWS):
+    conn = sqlite3.connect(db_filename)
+    records, last_id = conn.execute('SELECT COUNT(*), MAX(id) FROM records').fetchone()
+    digest = hashlib.sha1()
+    for order in ('ASC', 'DESC'):
+        for row in conn.execute(f'SELECT id, key, emb_idx, value FROM records ORDER BY id {order} LIMIT ?', (edge_rows,)):
+            digest.update(repr(row).encode('utf-8'))
+    conn.close()
+    return {'records': records, 'last_id': last_id, 'edge_checksum': digest.hexdigest()}
+
+# The records matrix of a database, memory-mapped from store_dir; the store is built on first use and rebuilt
+# when the table has changed since
+def open_records_store(db_filename, store_dir):
+    fingerprint = records_fingerprint(db_filename)
+    meta_path = os.path.join(store_dir, META)
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if all(meta.get(name) == value for name, value in fingerprint.items()):
+            return open_records_matrix(store_dir)
+    matrix = load_records_matrix(db_filename)
+    write_records_store(matrix, store_dir, dict(fingerprint, db=os.path.abspath(db_filename)))
+    del matrix
+    return open_records_matrix(store_dir)
+
+# MinHash samples of the large rows, for the approximate mode.
+#
+# For hash function k, the sample of a row is its distinct link with the smallest hash, a uniformly random link
+# of the row. It is a link of query a with probability |N(a) ∩ N(b)| / |N(b)|, the containment being tested, so
+# banding the samples as in LSH (a candidate survives when all rows_per_band samples of some band are links of a)
+# keeps it with probability 1 - (1 - c^rows_per_band)^bands: close to 1 above the threshold and close to 0 for
+# the hub pages that share a handful of links with the query. Survivors still get the exact check, so the mode can
+# only miss groups, never add wrong ones. The threshold counts duplicates in len(v) and the samples do not, which
+# only errs towards keeping a candidate. Rows with fewer than min_links distinct links are always checked exactly.
+class MinHashSignatures:
+    def __init__(self, matrix, bands=8, rows_per_band=4, min_links=256, seed=0, chunk_links=1 << 24):
+        self.bands = bands
+        self.rows_per_band = rows_per_band
+        lengths = np.diff(matrix.indptr)
+        large = np.flatnonzero(lengths >= max(min_links, 1))
+        self.slots = np.full(len(matrix), -1, dtype=np.int64)
+        self.slots[large] = np.arange(len(large))
+        self.samples = np.zeros((len(large), bands * rows_per_band), dtype=np.uint32)
+
+        # Multiply-shift hashing: the high 32 bits of a * link + b, a odd, over uint64 arithmetic that wraps
+        rng = np.random.default_rng(seed)
+        multipliers = rng.integers(0, 1 << 63, size=bands * rows_per_band, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        increments = rng.integers(0, 1 << 63, size=bands * rows_per_band, dtype=np.uint64)
+        cumulative = np.cumsum(lengths[large])
+        start = 0
+        with tqdm(total=len(large), desc="MinHash signatures") as pbar:
+            while start < len(large):
+                # As many rows as fit in chunk_links links, at least one
+                done = int(cumulative[start - 1]) if start else 0
+                end = max(start + 1, int(np.searchsorted(cumulative, done + chunk_links, side='right')))
+                links, chunk_lengths = gather(matrix.indptr, matrix.indices, large[start:end])
+                links = links.astype(np.uint64)
+                row_starts = np.cumsum(chunk_lengths) - chunk_lengths
+                for k in range(bands * rows_per_band):
+                    hashes = (links * multipliers[k] + increments[k]) >> np.uint64(32)
+                    # The hash in the high half and the link in the low half: the row minimum carries its link along
+                    packed = np.minimum.reduceat((hashes << np.uint64(32)) | links, row_starts)
+                    self.samples[start:end, k] = packed & np.uint64(0xFFFFFFFF)
+                pbar.update(end - start)
+                start = end
+
+    # Mask of the (candidate, query) pairs worth the exact check
+    def likely_contained(self, candidates, owners, query_keys):
+        keep = np.ones(len(candidates), dtype=bool)
+        slots = self.slots[candidates]
+        large = np.flatnonzero(slots >= 0)
+        if not len(large) or not len(query_keys):
+            return keep
+        keys = owners[large, None] * LINK_SPACE + self.samples[slots[large]].astype(np.int64)
+        found = np.minimum(np.searchsorted(query_keys, keys), len(query_keys) - 1)
+        inside = query_keys[found] == keys
+        keep[large] = inside.reshape(len(large), self.bands, self.rows_per_band).all(axis=2).any(axis=1)
+        return keep
+
+# Co-referential rows for a block of query rows: for query i, the rows it links to that pass the threshold,
+# in ascending emb_idx order as the SQL version met them
+def containment_block(matrix, rows, threshold=0.8, signatures=None):
+    rows = np.asarray(rows, dtype=np.int64)
+    query_links, query_lengths = gather(matrix.indptr, matrix.indices, rows)
+    query_owners = np.repeat(np.arange(len(rows), dtype=np.int64), query_lengths)
+    query_keys = query_owners * LINK_SPACE + query_links.astype(np.int64)
+
+    # Candidates: every row whose emb_idx is one of the query's (distinct) links
+    starts = np.searchsorted(matrix.sorted_emb, query_links, side='left')
+    counts = np.searchsorted(matrix.sorted_emb, query_links, side='right') - starts
+    before = np.cumsum(counts) - counts
+    positions = np.repeat(starts - before, counts) + np.arange(int(counts.sum()), dtype=np.int64)
+    candidates = matrix.emb_order[positions]
+    candidate_owners = np.repeat(query_owners, counts)
+    if signatures is not None:
+        # Approximate mode: large candidates whose sampled links miss the query are dropped before the exact check
+        keep = signatures.likely_contained(candidates, candidate_owners, query_keys)
+        candidates, candidate_owners = candidates[keep], candidate_owners[keep]
+
+    # |N(a) ∩ N(b)| for every candidate pair: look each of b's links up among a's sorted links
+    links, lengths = gather(matrix.indptr, matrix.indices, candidates)
+    pairs = np.repeat(np.arange(len(candidates), dtype=np.int64), lengths)
+    keys = candidate_owners[pairs] * LINK_SPACE + links.astype(np.int64)
+    found = np.searchsorted(query_keys, keys)
+    hits = found < len(query_keys)
+    hits[hits] = query_keys[found[hits]] == keys[hits]
+    overlap = np.bincount(pairs[hits], minlength=len(candidates))
+
+    accepted = overlap >= threshold * matrix.link_counts[candidates]
+    bounds = np.searchsorted(candidate_owners[accepted], np.arange(len(rows) + 1))
+    members = candidates[accepted]
+    return [members[bounds[i]:bounds[i + 1]] for i in range(len(rows))]
+
+# The exact and approximate modes over the same query rows: how many co-referential pairs the approximate mode
+# finds (it finds a subset) and the time each mode took
+def recall_report(matrix, rows, signatures, threshold=0.8, block_size=64):
+    pairs = found = 0
+    exact_seconds = approximate_seconds = 0.0
+    for i in range(0, len(rows), block_size):
+        block = rows[i:i + block_size]
+        start = time.perf_counter()
+        pairs += sum(len(members) for members in containment_block(matrix, block, threshold))
+        middle = time.perf_counter()
+        found += sum(len(members) for members in containment_block(matrix, block, threshold, signatures))
+        exact_seconds += middle - start
+        approximate_seconds += time.perf_counter() - middle
+    return {'pairs': pairs, 'found': found, 'recall': found / pairs if pairs else 1.0,
+            'exact_seconds': exact_seconds, 'approximate_seconds': approximate_seconds}
+
+# The level1alt columns of each query row: its emb_idx and title first, then those of its co-referential rows
+def coreferential_groups(matrix, rows, threshold=0.8, signatures=None):
+    members = containment_block(matrix, rows, threshold, signatures)
+    groups = np.concatenate([np.concatenate(([row], group)) for row, group in zip(rows, members)]).astype(np.int64)
+    bounds = np.concatenate(([0], np.cumsum([len(group) + 1 for group in members]))).tolist()
+    emb_idcs = matrix.emb_values(groups)
+    names = matrix.titles_of(groups)
+    return [(emb_idcs[start:end], names[start:end]) for start, end in zip(bounds[:-1], bounds[1:])]
+
+# Worker globals: the matrix (memory-mapped from a store, or loaded) and signatures are shared with the forked pool
+_matrix = None
+_signatures = None
+
+def init_worker(matrix, signatures=None):
+    global _matrix, _signatures
+    _matrix = matrix
+    _signatures = signatures
+
+def coreferential_groups_task(task):
+    rows, threshold = task
+    return coreferential_groups(_matrix, rows, threshold, _signatures)
+
+# Groups for any number of query rows, block_size rows per task spread over num_workers processes.
+# Yields (row, emb_idcs, names) in row order.
+def iter_coreferential_groups(matrix, rows, threshold=0.8, block_size=64, num_workers=None, signatures=None):
+    blocks = [rows[i:i + block_size] for i in range(0, len(rows), block_size)]
+    tasks = [(block, threshold) for block in blocks]
+    if num_workers == 1 or len(blocks) <= 1:
+        results = (coreferential_groups(matrix, *task, signatures) for task in tasks)
+        for block, groups in zip(blocks, results):
+            for row, (emb_idcs, names) in zip(block, groups):
+                yield row, emb_idcs, names
+        return
+    with mp.Pool(processes=num_workers or mp.cpu_count(), initializer=init_worker, initargs=(matrix, signatures)) as pool:
+        for block, groups in zip(blocks, pool.imap(coreferential_groups_task, tasks)):
+            for row, (emb_idcs, names) in zip(block, groups):
+                yield row, emb_idcs, names
+
+# Rows of the given titles, -1 for titles without a record, looked up through the key index a chunk at a time
+def rows_of_keys(cursor, matrix, keys, chunk_size=900):
+    ids = {}
+    unique = list(dict.fromkeys(keys))
+    for i in range(0, len(unique), chunk_size):
+        chunk = unique[i:i + chunk_size]
+        placeholders = ','.join(['?'] * len(chunk))
+        cursor.execute(f'SELECT key, id FROM records WHERE key IN ({placeholders})', chunk)
+        ids.update(cursor.fetchall())
+    return matrix.rows_of_ids([ids.get(key, -1) for key in keys])
@@ -0,0 +1,207 @@
+import json
+import os
+import re
+import numpy as np
+from checkpoint import atomic_write
+
+# Degree statistics directory layout:
+#   in_degree.npy   int64[n]  number of links pointing at entry i
+#   out_degree.npy  int64[n]  number of links on entry i
+#   meta.json       where entry names come from, and the sources already merged in
+# Entries are either the nodes of a link graph ({'graph_dir': ...}, see link_graph.py) or the canonical pages
+# of a redirect table ({'redirects_path': ...}, see redirects.py), in which case page id adjacency shards
+# (see link_adjacency.py) can be merged in one at a time.
+IN_DEGREE = 'in_degree.npy'
+OUT_DEGREE = 'out_degree.npy'
+META = 'meta.json'
+
+# Titles stored back to back with n+1 byte offsets, as both the link graph and the redirect table keep them
+class TitleBlob:
+    def __init__(self, offsets, data):
+        self.offsets = np.asarray(offsets, dtype=np.uint64)
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def title(self, i):
+        return bytes(self.data[int(self.offsets[i]):int(self.offsets[i + 1])]).decode('utf-8')
+
+    # Mask of the titles containing any of the substrings, found with one scan of the blob per substring
+    def containing(self, substrings):
+        mask = np.zeros(len(self), dtype=bool)
+        for substring in substrings:
+            encoded = substring.encode('utf-8')
+            # A lookahead finds overlapping matches too, so one spanning two titles cannot hide the next
+            starts = np.fromiter((m.start() for m in re.finditer(b'(?=' + re.escape(encoded) + b')', self.data)), dtype=np.uint64)
+            entries = np.searchsorted(self.offsets, starts, side='right') - 1
+            inside = starts + np.uint64(len(encoded)) <= self.offsets[entries + 1]
+            mask[entries[inside]] = True
+        return mask
+
+# Highest counts first, ties in entry order; entries with a zero count or an excluded title are left out
+def top_entries(counts, k=None, names=None, exclude=()):
+    counts = np.asarray(counts)
+    keep = counts > 0
+    if exclude:
+        keep &= ~names.containing(exclude)
+    entries = np.flatnonzero(keep)
+    if k is not None and 0 < k < len(entries):
+        # Only the k largest need sorting; the cut-off count is widened to keep its ties in entry order
+        cutoff = np.partition(counts[entries], len(entries) - k)[len(entries) - k]
+        entries = entries[counts[entries] >= cutoff]
+    order = np.argsort(-counts[entries], kind='stable')
+    return entries[order][:k]
+
+def write_counts_json(path, counts, entries, names):
+    with open(path, 'w') as f:
+        json.dump({names.title(entry): int(counts[entry]) for entry in entries.tolist()}, f, ensure_ascii=False)
+
+def save_array(path, values):
+    tmp_path = path + '.tmp.npy'
+    np.save(tmp_path, values)
+    os.replace(tmp_path, path)
+
+class DegreeStats:
+    def __init__(self, stats_dir):
+        self.stats_dir = stats_dir
+        with open(os.path.join(stats_dir, META), 'r') as f:
+            self.meta = json.load(f)
+        self.in_degree = np.load(os.path.join(stats_dir, IN_DEGREE))
+        self.out_degree = np.load(os.path.join(stats_dir, OUT_DEGREE))
+        self.source = None
+        self.names = None
+
+    def __len__(self):
+        return len(self.in_degree)
+
+    # Opened on first use: degree queries without names never touch the titles
+    def open_names(self):
+        if self.names is None:
+            if 'graph_dir' in self.meta:
+                from link_graph import LinkGraph
+                self.source = LinkGraph(self.meta['graph_dir'])
+                self.names = TitleBlob(self.source.title_offsets, self.source.titles)
+            else:
+                from redirects import RedirectTable
+                self.source = RedirectTable(self.meta['redirects_path'])
+                self.names = TitleBlob(np.frombuffer(self.source.title_offsets, dtype=np.uint64), self.source.sections['title_bytes'])
+        return self.names
+
+    def title(self, entry):
+        return self.open_names().title(entry)
+
+    def counts(self, direction='in'):
+        return self.in_degree if direction == 'in' else self.out_degree
+
+    # [(title, count)] of the k entries with the most in- or out-links, skipping titles containing any of exclude
+    def top(self, k=None, direction='in', exclude=()):
+        counts = self.counts(direction)
+        entries = top_entries(counts, k, self.open_names() if exclude else None, exclude)
+        return [(self.title(entry), int(counts[entry])) for entry in entries.tolist()]
+
+    def write_json(self, path, k=None, direction='in', exclude=()):
+        counts = self.counts(direction)
+        entries = top_entries(counts, k, self.open_names() if exclude else None, exclude)
+        write_counts_json(path, counts, entries, self.open_names())
+
+    # Add the links of one adjacency shard; a shard that was already merged is skipped
+    def merge_adjacency(self, adjacency_dir):
+        from link_adjacency import LinkAdjacency
+        source = os.path.abspath(adjacency_dir)
+        if source in self.meta['merged']:
+            print(f"{adjacency_dir} is already merged into {self.stats_dir}, skipping")
+            return
+        if 'redirects_path' not in self.meta:
+            raise ValueError("only degree statistics over a redirect table can merge adjacency shards")
+        self.open_names()
+        canonical_ids = np.frombuffer(self.source.canonical_ids, dtype=np.uint32)
+        adjacency = LinkAdjacency(adjacency_dir)
+        page_ids = np.frombuffer(adjacency.page_ids, dtype=np.uint32)[:len(adjacency)]
+        offsets = np.frombuffer(adjacency.link_offsets, dtype=np.uint64)[:len(adjacency) + 1]
+        link_ids = np.frombuffer(adjacency.link_ids, dtype=np.uint32)[:int(offsets[-1])]
+
+        def entries(ids):
+            positions = np.searchsorted(canonical_ids, ids)
+            positions[positions == len(canonical_ids)] = 0
+            return positions, canonical_ids[positions] == ids if len(canonical_ids) else np.zeros(len(ids), dtype=bool)
+
+        targets, known_targets = entries(link_ids)
+        sources, known_sources = entries(page_ids)
+        lengths = np.diff(offsets).astype(np.int64)
+        self.in_degree = self.in_degree + np.bincount(targets[known_targets], minlength=len(self))
+        self.out_degree = self.out_degree + np.bincount(sources[known_sources], weights=lengths[known_sources], minlength=len(self)).astype(np.int64)
+        unknown = int((~known_targets).sum()) + int((~known_sources).sum())
+        if unknown:
+            print(f"{unknown} page ids of {adjacency_dir} are not in {self.meta['redirects_path']}")
+        del page_ids, offsets, link_ids
+        adjacency.close()
+        self.meta['merged'].append(source)
+        self.save()
+
+    # Arrays first and the merged list last, each renamed into place
+    def save(self):
+        save_array(os.path.join(self.stats_dir, IN_DEGREE), self.in_degree)
+        save_array(os.path.join(self.stats_dir, OUT_DEGREE), self.out_degree)
+        atomic_write(os.path.join(self.stats_dir, META), json.dumps(self.meta, indent=4).encode('utf-8'))
+
+    def close(self):
+        # The title views borrow the redirect table's buffers, so they go first
+        self.names = None
+        if self.source is not None and hasattr(self.source, 'close'):
+            self.source.close()
+        self.source = None
+
+# Link vector length of every page of a page embeddings segment (see page_segments.py), from its offsets alone
+def segment_link_counts(segment):
+    offsets = np.frombuffer(segment.link_offsets, dtype=np.uint32).astype(np.int64)
+    if not segment.compressed:
+        return np.diff(offsets)
+    # Varint offsets are in bytes: every id ends on a byte without the continuation bit
+    ends = np.concatenate(([0], np.cumsum(np.frombuffer(segment.link_ids, dtype=np.uint8) < 0x80)))
+    return np.diff(ends[offsets])
+
+def create_degree_stats(stats_dir, in_degree, out_degree, meta):
+    os.makedirs(stats_dir, exist_ok=True)
+    save_array(os.path.join(stats_dir, IN_DEGREE), np.asarray(in_degree, dtype=np.int64))
+    save_array(os.path.join(stats_dir, OUT_DEGREE), np.asarray(out_degree, dtype=np.int64))
+    atomic_write(os.path.join(stats_dir, META), json.dumps(dict(meta, merged=[]), indent=4).encode('utf-8'))
+    return DegreeStats(stats_dir)
+
+# In- and out-degree of every node of a link graph: a bincount over the link targets and the CSR row lengths
+def build_degree_stats(graph_dir, stats_dir):
+    from link_graph import LinkGraph
+    graph = LinkGraph(graph_dir)
+    in_degree = np.bincount(graph.fwd_indices, minlength=len(graph))
+    out_degree = np.diff(graph.fwd_indptr).astype(np.int64)
+    return create_degree_stats(stats_dir, in_degree, out_degree, {'graph_dir': graph_dir})
+
+# Degree statistics over the canonical pages of a redirect table, merging adjacency shards not yet counted
+def build_degree_stats_from_adjacency(adjacency_dirs, redirects_path, stats_dir):
+    if os.path.exists(os.path.join(stats_dir, META)):
+        stats = DegreeStats(stats_dir)
+    else:
+        from redirects import RedirectTable
+        redirects = RedirectTable(redirects_path)
+        num_pages = redirects.num_pages
+        redirects.close()
+        zeros = np.zeros(num_pages, dtype=np.int64)
+        stats = create_degree_stats(stats_dir, zeros, zeros, {'redirects_path': redirects_path})
+    for adjacency_dir in adjacency_dirs:
+        stats.merge_adjacency(adjacency_dir)
+    return stats
+
+# Open statistics for a link graph, computing them first if they do not exist yet
+def open_degree_stats(graph_dir, stats_dir):
+    if not os.path.exists(os.path.join(stats_dir, META)):
+        return build_degree_stats(graph_dir, stats_dir)
+    return DegreeStats(stats_dir)
+
+if __name__ == "__main__":
+    adjacency_dirs = ['data/link_adjacency']  # one per dump shard, e.g. from find_links.py with adjacency_dir
+    redirects_path = 'data/redirects.wvr'  # built with redirects.py
+    stats_dir = 'data/degree_stats'
+
+    stats = build_degree_stats_from_adjacency(adjacency_dirs, redirects_path, stats_dir)
+    for title, count in stats.top(20, exclude=['Wikipedia']):
+        print(count, title)
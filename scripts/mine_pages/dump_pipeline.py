@@ -0,0 +1,168 @@
+import abc
+import multiprocessing as mp
+import os
+import signal
+from functools import partial
+from itertools import islice
+from tqdm import tqdm
+from page_index import load_page_index, batch_ranges, iterparse_range
+from dump_source import page_from_elem, iter_xml_pages, load_stream_offsets, read_multistream_header, read_stream, bounded_imap
+
+# Base class for one extractor plugin. The pipeline reads the dump once and hands every page to every extractor.
+#   resume(numbering)    parent, before open(): the task ids already committed under this task numbering (e.g.
+#                        'pages:10000', see checkpoint.py), or None when the sink is rewritten on every pass
+#   open()               parent, before the pass: open output sinks
+#   new_state()          worker, once per task (a batch of pages): fresh partial state
+#   process(page, state) worker, once per page: update the partial state in place
+#   finish(state)        worker, after the task's last page: what is sent back to the parent (the state by default)
+#   merge(task_id, state) parent, once per task and in dump order: fold the partial state into the sink
+#   close()              parent, after the pass: flush and close the sink
+class Extractor(abc.ABC):
+    name = None
+    # Set when process() needs page.xml
+    raw = False
+
+    def resume(self, numbering):
+        return None
+
+    def open(self):
+        pass
+
+    def new_state(self):
+        return None
+
+    @abc.abstractmethod
+    def process(self, page, state):
+        pass
+
+    def finish(self, state):
+        return state
+
+    def merge(self, task_id, state):
+        pass
+
+    def close(self):
+        pass
+
+# Run every extractor over one task's pages and return their partial states
+def run_extractors(extractors, pages):
+    states = [extractor.new_state() for extractor in extractors]
+    count = 0
+    for page in pages:
+        count += 1
+        for extractor, state in zip(extractors, states):
+            extractor.process(page, state)
+    return count, [extractor.finish(state) for extractor, state in zip(extractors, states)]
+
+# Worker globals, set once per pool process so the extractors (and their vocabularies) are not resent per task
+_extractors = None
+
+def init_worker(extractors):
+    global _extractors
+    _extractors = extractors
+    # Interrupts are handled by the parent, which owns the merged state and the sinks
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+# Worker: a batch of pages already parsed by the parent
+def pages_task(task):
+    task_id, pages = task
+    return (task_id,) + run_extractors(_extractors, pages)
+
+# Worker: parse one byte range of a plain XML dump
+def range_task(dump_path, root_tag, raw, task):
+    task_id, start, end = task
+    def pages():
+        for event, elem in iterparse_range(dump_path, root_tag, start, end):
+            yield page_from_elem(elem, raw)
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+    return (task_id,) + run_extractors(_extractors, pages())
+
+# Worker: decompress and parse a group of bz2 streams
+def stream_task(dump_path, root_tag, raw, task):
+    task_id, stream_ranges = task
+    pages = (page for stream_range in stream_ranges for page in read_stream(dump_path, root_tag, stream_range, raw))
+    return (task_id,) + run_extractors(_extractors, pages)
+
+# Batches of batch_size pages read from a plain XML dump by the parent
+def page_batches(dump_path, raw, batch_size):
+    pages = iter_xml_pages(dump_path, raw)
+    task_id = 0
+    while True:
+        batch = list(islice(pages, batch_size))
+        if not batch:
+            break
+        yield task_id, batch
+        task_id += 1
+
+# Tasks for a multistream bz2 dump: groups of streams_per_task consecutive streams
+def stream_tasks(dump_path, index_path, streams_per_task):
+    offsets = load_stream_offsets(index_path)
+    root_tag, _ = read_multistream_header(dump_path, offsets[0])
+    ranges = list(zip(offsets, offsets[1:] + [os.path.getsize(dump_path)]))
+    tasks = [(i, ranges[first:first + streams_per_task]) for i, first in enumerate(range(0, len(ranges), streams_per_task))]
+    return root_tag, tasks
+
+# Read the dump once and feed every page to every extractor.
+#   .bz2 multistream dump (index_path is its index file): workers decompress and parse groups of streams
+#   plain XML with a page index (see page_index.py): workers parse batch_size page byte ranges
+#   plain XML without a page index: the parent parses and hands batches of batch_size pages to the workers
+# Partial states come back in dump order, so ordered sinks (the filtered dump) stay in dump order. At most two
+# tasks per worker are in flight, so workers cannot run ahead of a slow merge with their partial states.
+# Task ids are stream groups for a bz2 dump and page_number // batch_size otherwise, the batch ids of
+# mine_embeddings.py. Tasks that every extractor has already committed under the same numbering are skipped.
+def run_pipeline(dump_path, extractors, index_path=None, page_index_path=None, num_workers=None, batch_size=10000, streams_per_task=10):
+    raw = any(extractor.raw for extractor in extractors)
+    numbering = f'streams:{streams_per_task}' if dump_path.endswith('.bz2') else f'pages:{batch_size}'
+    committed = [extractor.resume(numbering) for extractor in extractors]
+    done = set.intersection(*committed) if all(ids is not None for ids in committed) else set()
+    if done:
+        print(f"{len(done)} tasks already committed by every extractor, skipping them")
+    for extractor in extractors:
+        extractor.open()
+    names = ', '.join(extractor.name for extractor in extractors)
+    num_workers = num_workers or mp.cpu_count()
+
+    with mp.Pool(processes=num_workers, initializer=init_worker, initargs=(extractors,)) as pool:
+        if dump_path.endswith('.bz2'):
+            if index_path is None:
+                raise ValueError(f"{dump_path} is a bz2 dump, the multistream index file is required")
+            root_tag, tasks = stream_tasks(dump_path, index_path, streams_per_task)
+            tasks = [task for task in tasks if task[0] not in done]
+            results = bounded_imap(pool, partial(stream_task, dump_path, root_tag, raw), tasks, 2 * num_workers)
+        elif page_index_path:
+            meta, offsets, _ = load_page_index(page_index_path)
+            tasks = [task for task in batch_ranges(meta, offsets, batch_size) if task[0] not in done]
+            results = bounded_imap(pool, partial(range_task, dump_path, meta['root'], raw), tasks, 2 * num_workers)
+        else:
+            # The parent still parses committed batches, it only does not hand them out
+            tasks = (task for task in page_batches(dump_path, raw, batch_size) if task[0] not in done)
+            results = bounded_imap(pool, pages_task, tasks, 2 * num_workers)
+
+        with tqdm(desc=f"Extracting {names}", unit=" pages") as progress:
+            for task_id, count, states in results:
+                for extractor, state in zip(extractors, states):
+                    extractor.merge(task_id, state)
+                progress.update(count)
+
+    for extractor in extractors:
+        extractor.close()
+
+if __name__ == "__main__":
+    from extractors import LinksExtractor, VerbCountsExtractor, PhrasesExtractor, FilterExtractor, EmbeddingsExtractor
+
+    dump_path = 'enwiki-latest-pages-articles.xml'
+    dump_path = 'enwiki-20240501-pages-articles15.xml-p17324603p17460152'
+    index_path = None  # Set with dump_path = 'enwiki-latest-pages-articles-multistream.xml.bz2' to read the compressed dump
+    page_index_path = None  # e.g. 'enwiki-latest-pages-articles.index.jsonl' built with page_index.py, to parse plain XML in parallel
+
+    # One pass replacing find_links.py, wiki_verb_impact.py, wiki_gather_phrases.py, filter_wikipedia.py and mine_embeddings.py
+    extractors = [
+        LinksExtractor('data/links.json'),
+        VerbCountsExtractor('data/verb_list.json', 'data'),
+        PhrasesExtractor('wiki_phrases'),
+        FilterExtractor('wiki_knowledge/filtered_wikipedia_dump.xml', dump_path, index_path),
+        EmbeddingsExtractor('data/verb_embeddings.json', 'data/link_embeddings.json', 'page_embeddings', 'intersected_sentences'),
+    ]
+    run_pipeline(dump_path, extractors, index_path, page_index_path, num_workers=6)
@@ -0,0 +1,123 @@
+import bz2
+import multiprocessing as mp
+import os
+from collections import deque, namedtuple
+from functools import partial
+from lxml import etree
+
+NS = '{http://www.mediawiki.org/xml/export-0.10/}'
+
+# One page as handed out by every dump source; xml is only filled in when raw=True
+Page = namedtuple('Page', ['title', 'ns', 'page_id', 'redirect', 'text', 'xml'], defaults=(None,))
+
+# Build a Page from a parsed <page> element
+def page_from_elem(elem, raw=False):
+    ns = elem.findtext(f'{NS}ns')
+    page_id = elem.findtext(f'{NS}id')
+    redirect = elem.find(f'{NS}redirect')
+    return Page(
+        elem.findtext(f'{NS}title'),
+        int(ns) if ns else 0,
+        int(page_id) if page_id else None,
+        redirect.get('title') if redirect is not None else None,
+        elem.findtext(f'.//{NS}text'),
+        etree.tostring(elem, encoding='utf-8') if raw else None,
+    )
+
+# Stream pages out of an uncompressed XML dump, clearing each element once the caller is done with it
+def iter_xml_pages(dump_path, raw=False):
+    context = etree.iterparse(dump_path, events=('end',), tag=f'{NS}page')
+    for event, elem in context:
+        yield page_from_elem(elem, raw)
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+# Read the distinct stream start offsets from a multistream index (offset:page_id:title per line)
+def load_stream_offsets(index_path):
+    opener = bz2.open if index_path.endswith('.bz2') else open
+    offsets = []
+    with opener(index_path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            offset = int(line.split(':', 1)[0])
+            if not offsets or offsets[-1] != offset:
+                offsets.append(offset)
+    return offsets
+
+# Decompress one byte range of the dump
+def decompress_range(dump_path, start, end):
+    with open(dump_path, 'rb') as f:
+        f.seek(start)
+        return bz2.decompress(f.read(end - start))
+
+# The first stream holds <mediawiki ...> and <siteinfo>; pull out the root tag so page streams parse on their own
+def read_multistream_header(dump_path, first_offset):
+    header = decompress_range(dump_path, 0, first_offset)
+    start = header.index(b'<mediawiki')
+    end = header.index(b'>', start)
+    return header[start:end + 1], header
+
+# Everything before the first <page>: the <mediawiki ...> root tag and <siteinfo>, to start a new dump with
+def read_dump_header(dump_path, index_path=None):
+    if dump_path.endswith('.bz2'):
+        if index_path is None:
+            raise ValueError(f"{dump_path} is a bz2 dump, the multistream index file is required")
+        _, header = read_multistream_header(dump_path, load_stream_offsets(index_path)[0])
+    else:
+        with open(dump_path, 'rb') as f:
+            header = f.read(1 << 20)
+    end = header.find(b'<page>')
+    return (header[:end] if end != -1 else header).rstrip() + b'\n'
+
+# Worker: decompress and parse one stream of (usually 100) pages
+def read_stream(dump_path, root_tag, stream_range, raw=False):
+    data = decompress_range(dump_path, *stream_range).replace(b'</mediawiki>', b'')
+    root = etree.fromstring(root_tag + data + b'</mediawiki>')
+    return [page_from_elem(elem, raw) for elem in root.iterchildren(f'{NS}page')]
+
+# Worker: decompress and parse a group of consecutive streams
+def read_streams(dump_path, root_tag, stream_ranges, raw=False):
+    return [page for stream_range in stream_ranges for page in read_stream(dump_path, root_tag, stream_range, raw)]
+
+# The oldest pending result, or with ordered=False the first one that is ready (the oldest when none is yet)
+def pop_result(pending, ordered):
+    if not ordered:
+        for i, result in enumerate(pending):
+            if result.ready():
+                del pending[i]
+                return result.get()
+    return pending.popleft().get()
+
+# Like pool.imap (pool.imap_unordered with ordered=False), but with at most `window` tasks in flight so a fast
+# reader cannot queue up the whole dump
+def bounded_imap(pool, func, tasks, window, ordered=True):
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= window:
+            yield pop_result(pending, ordered)
+    while pending:
+        yield pop_result(pending, ordered)
+
+# Stream pages out of a pages-articles-multistream.xml.bz2 dump, decompressing groups of streams_per_task streams
+# in a process pool. At most two groups per worker are in flight, so a slow consumer holds the readers back
+# instead of having the whole dump decompressed into memory ahead of it.
+def iter_multistream_pages(dump_path, index_path, num_workers=None, ordered=True, raw=False, streams_per_task=4):
+    offsets = load_stream_offsets(index_path)
+    root_tag, _ = read_multistream_header(dump_path, offsets[0])
+    ranges = list(zip(offsets, offsets[1:] + [os.path.getsize(dump_path)]))
+    groups = [ranges[first:first + streams_per_task] for first in range(0, len(ranges), streams_per_task)]
+    num_workers = num_workers or mp.cpu_count()
+
+    with mp.Pool(processes=num_workers) as pool:
+        task = partial(read_streams, dump_path, root_tag, raw=raw)
+        for pages in bounded_imap(pool, task, groups, 2 * num_workers, ordered):
+            yield from pages
+
+# Pick the right source for a dump path: multistream .bz2 (needs its index file) or plain XML
+def iter_pages(dump_path, index_path=None, num_workers=None, ordered=True, raw=False):
+    if dump_path.endswith('.bz2'):
+        if index_path is None:
+            raise ValueError(f"{dump_path} is a bz2 dump, the multistream index file is required")
+        return iter_multistream_pages(dump_path, index_path, num_workers, ordered, raw)
+    return iter_xml_pages(dump_path, raw)
@@ -0,0 +1,391 @@
+import json
+import os
+import re
+import shutil
+from collections import Counter
+from dump_pipeline import Extractor
+from dump_source import read_dump_header
+from page_index import verify_page_index
+from link_matcher import open_matcher
+from checkpoint import BatchCheckpoint, atomic_write, check_numbering, load_manifest
+from mine_embeddings import process_pages, is_checkpointed
+from redirects import RedirectCollector, RedirectTable
+from link_adjacency import LinkAdjacencyWriter
+from phrase_runs import RUN_SUFFIX, SpillingCounter, TieredRuns, top_phrases
+
+link_pattern = re.compile(r"\[\[(.+?)\]\]")
+page_tag_pattern = re.compile(rb'<page\b[^>]*>')
+
+# find_links.py: lowercased title -> raw link targets, or canonical link titles when given a redirect table.
+# The JSON object is streamed out one page at a time instead of being built in memory; a title that occurs
+# twice is written twice and, as before, the last one wins when it is loaded.
+class LinksExtractor(Extractor):
+    name = 'links'
+
+    def __init__(self, output_path='data/links.json', redirects_path=None):
+        self.output_path = output_path
+        self.redirects = RedirectTable(redirects_path) if redirects_path else None
+        self.count = 0
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.output_path) or '.', exist_ok=True)
+        self.output_file = open(self.output_path, 'w')
+        self.output_file.write('{')
+
+    def new_state(self):
+        return []
+
+    def process(self, page, state):
+        if self.redirects and page.redirect:
+            return
+        if page.text:
+            links = link_pattern.findall(page.text)
+            if self.redirects:
+                links = [link for link in map(self.redirects.resolve, links) if link]
+            state.append((page.title.lower(), links))
+
+    def merge(self, task_id, state):
+        for title, links in state:
+            entry = json.dumps({title: links}, indent=4, ensure_ascii=False)
+            self.output_file.write((',' if self.count else '') + entry[1:-2])
+            self.count += 1
+        self.output_file.flush()
+
+    def close(self):
+        self.output_file.write('\n}' if self.count else '}')
+        self.output_file.close()
+        print(f"Links written to {self.output_path}")
+
+# find_links.py: (page_id, [canonical link target page ids]) per page, appended to an on-disk adjacency
+# (see link_adjacency.py). Link titles are resolved through the redirect table; links to pages that do not
+# exist are dropped and counted.
+class LinkAdjacencyExtractor(Extractor):
+    name = 'link adjacency'
+
+    def __init__(self, output_dir, redirects_path):
+        self.output_dir = output_dir
+        self.redirects_path = redirects_path
+        self.redirects = RedirectTable(redirects_path)
+        self.unresolved = 0
+
+    def open(self):
+        self.writer = LinkAdjacencyWriter(self.output_dir)
+
+    def new_state(self):
+        return [[], 0]
+
+    def process(self, page, state):
+        if page.redirect or not page.text or page.page_id is None:
+            return
+        link_ids = []
+        for link in link_pattern.findall(page.text):
+            link_id = self.redirects.canonical_id(link.split('|', 1)[0])
+            if link_id is None:
+                state[1] += 1
+            else:
+                link_ids.append(link_id)
+        state[0].append((page.page_id, link_ids))
+
+    def merge(self, task_id, state):
+        records, unresolved = state
+        self.writer.write(records)
+        self.unresolved += unresolved
+
+    def close(self):
+        self.writer.close(redirects_path=self.redirects_path, unresolved=self.unresolved)
+        print(f"Adjacency of {self.writer.num_pages} pages and {self.writer.num_links} links written to {self.output_dir} ({self.unresolved} unresolved links dropped)")
+
+# wiki_verb_impact.py: number of pages each verb of the verb list appears in. Each page's words are intersected
+# with the verb set, so the cost is per distinct word rather than per verb. The merged counts are checkpointed
+# every checkpoint_every pages.
+class VerbCountsExtractor(Extractor):
+    name = 'verb counts'
+    clean_pattern = re.compile(r'[^a-zA-Z ]')
+
+    def __init__(self, verb_list_path, output_dir='data', checkpoint_every=100000):
+        with open(verb_list_path, 'r') as f:
+            self.verb_set = frozenset(json.load(f))
+        self.output_dir = output_dir
+        self.checkpoint_every = checkpoint_every
+        self.knowledge = Counter()
+        self.counter = 0
+        self.pages = 0
+
+    def new_state(self):
+        return [0, Counter()]
+
+    def process(self, page, state):
+        state[0] += 1
+        if page.text:
+            state[1].update(self.verb_set.intersection(self.clean_pattern.sub('', page.text).lower().split()))
+
+    def merge(self, task_id, state):
+        pages, counts = state
+        self.knowledge.update(counts)
+        if self.checkpoint_every and (self.pages + pages) // self.checkpoint_every > self.pages // self.checkpoint_every:
+            self.save()
+        self.pages += pages
+
+    # Written under a temporary name and renamed, so an interrupted save never leaves a truncated file
+    def save(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        sorted_knowledge = dict(self.knowledge.most_common())
+        output_path = f'{self.output_dir}/verb_counts_{self.counter}.json'
+        atomic_write(output_path, json.dumps(sorted_knowledge, indent=4, ensure_ascii=False).encode('utf-8'))
+        print(f"Knowledge written to {output_path}")
+
+    def close(self):
+        self.save()
+
+# wiki_gather_phrases.py: exact counts of 1 to 8 word stretches in bounded memory. Each worker counts into a
+# SpillingCounter that spills sorted runs to output_dir/runs; the parent only keeps run paths, compacting every
+# max_runs runs of a tier into one run of the next (see TieredRuns), and the top_n phrases seen at least min_count
+# times come out of one k-way merge over what is left.
+class PhrasesExtractor(Extractor):
+    name = 'phrases'
+    stretch_pattern = re.compile(r'[a-zA-Z.,?]+')
+
+    def __init__(self, output_dir='wiki_phrases', min_words=1, max_words=8, max_phrases=2000000, top_n=100000, min_count=2, max_runs=64):
+        self.output_dir = output_dir
+        self.run_dir = os.path.join(output_dir, 'runs')
+        self.min_words = min_words
+        self.max_words = max_words
+        self.max_phrases = max_phrases
+        self.top_n = top_n
+        self.min_count = min_count
+        self.max_runs = max_runs
+        self.runs = TieredRuns(self.run_dir, max_runs)
+        self.counter = 0
+
+    def open(self):
+        os.makedirs(self.run_dir, exist_ok=True)
+        for name in os.listdir(self.run_dir):
+            if name.endswith(RUN_SUFFIX):
+                os.remove(os.path.join(self.run_dir, name))
+
+    # A stretch is kept when every word in it is made of letters and .,? only, so split the page into maximal
+    # runs of such words and take every stretch inside each run
+    def find_word_stretches(self, text):
+        stretches = set()
+        words = []
+        for word in text.split() + [None]:
+            if word is not None and self.stretch_pattern.fullmatch(word):
+                words.append(word.lower())
+                continue
+            for start in range(len(words)):
+                for end in range(start + self.min_words, min(start + self.max_words + 1, len(words) + 1)):
+                    stretches.add(" ".join(words[start:end]))
+            words = []
+        return stretches
+
+    def new_state(self):
+        return [0, SpillingCounter(self.run_dir, self.max_phrases)]
+
+    def process(self, page, state):
+        state[0] += 1
+        if page.text:
+            state[1].update(self.find_word_stretches(page.text))
+
+    def finish(self, state):
+        return state[0], state[1].flush()
+
+    def merge(self, task_id, state):
+        pages, runs = state
+        self.counter += pages
+        self.runs.add(runs)
+
+    def save(self):
+        phrases = dict(top_phrases(self.runs.paths(), self.top_n, self.min_count))
+        with open(f'{self.output_dir}/phrases_test_{self.counter}.json', 'w') as outj:
+            json.dump(phrases, outj, indent=4, ensure_ascii=False)
+        print(f"phrases written to {self.output_dir}/phrases_test_{self.counter}.json")
+
+    def close(self):
+        self.save()
+        for path in self.runs.paths():
+            os.remove(path)
+
+# filter_wikipedia.py: the raw XML of every page with more than one link that is not a file or image, written
+# in dump order as a well-formed dump (the source's <mediawiki> and <siteinfo> header, then the pages). With
+# shard_pages the output is split into numbered shards of that many pages, each a complete dump. Every output
+# file gets a page index next to it (see page_index.py), so later stages can shard it without a counting pass;
+# with verify_index each file is indexed again once written, and a mismatch raises ValueError.
+class FilterExtractor(Extractor):
+    name = 'filter'
+    raw = True
+
+    def __init__(self, output_path, dump_path, index_path=None, shard_pages=None, verify_index=True):
+        self.output_path = output_path
+        self.dump_path = dump_path
+        self.index_path = index_path
+        self.shard_pages = shard_pages
+        self.verify_index = verify_index
+        self.output_file = None
+        self.shard = 0
+        self.kept = 0
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.output_path) or '.', exist_ok=True)
+        self.header = read_dump_header(self.dump_path, self.index_path)
+        start = self.header.index(b'<mediawiki')
+        self.root = self.header[start:self.header.index(b'>', start) + 1].decode('utf-8')
+
+    def shard_path(self):
+        if self.shard_pages is None:
+            return self.output_path
+        stem, ext = os.path.splitext(self.output_path)
+        return f'{stem}_{self.shard:05d}{ext}'
+
+    def open_shard(self):
+        self.current_path = self.shard_path()
+        self.output_file = open(self.current_path, 'wb')
+        self.output_file.write(self.header)
+        # Rows go to a side file while the shard grows; the index's first line needs the final end offset
+        self.rows_file = open(self.current_path + '.rows', 'w', encoding='utf-8')
+        self.shard_kept = 0
+
+    def close_shard(self):
+        end = self.output_file.tell()
+        self.output_file.write(b'</mediawiki>\n')
+        self.output_file.close()
+        self.rows_file.close()
+        index_path = os.path.splitext(self.current_path)[0] + '.index.jsonl'
+        with open(index_path, 'w', encoding='utf-8') as out, open(self.current_path + '.rows', 'r', encoding='utf-8') as rows:
+            out.write(json.dumps({'dump_path': self.current_path, 'root': self.root, 'end': end}) + '\n')
+            shutil.copyfileobj(rows, out)
+        os.remove(self.current_path + '.rows')
+        if self.verify_index:
+            verify_page_index(index_path)
+        self.output_file = None
+        self.shard += 1
+
+    def new_state(self):
+        return []
+
+    def process(self, page, state):
+        if page.text:
+            links = [link.split("|")[0] for link in link_pattern.findall(page.text)]
+            links = [link for link in links if not link.lower().startswith('file:') and not link.lower().endswith('.png')]
+            if len(links) > 1:
+                # The whitespace after a page depends on where its byte range or stream ends, so normalize it.
+                # The serialized page redeclares the namespaces of the root it was cut from; the output's root
+                # declares the same ones, and page_index.py looks for a bare <page> line.
+                xml = page_tag_pattern.sub(b'<page>', page.xml.rstrip(), count=1)
+                state.append((page.page_id, page.ns, page.title, b'  ' + xml + b'\n'))
+
+    def merge(self, task_id, state):
+        for page_id, ns, title, xml in state:
+            if self.output_file is None:
+                self.open_shard()
+            row = [self.output_file.tell(), page_id, ns, title]
+            self.rows_file.write(json.dumps(row, ensure_ascii=False) + '\n')
+            self.output_file.write(xml)
+            self.kept += 1
+            self.shard_kept += 1
+            if self.shard_pages and self.shard_kept >= self.shard_pages:
+                self.close_shard()
+
+    def close(self):
+        # An empty filter result still gets a (page-less) dump
+        if self.output_file is None and self.shard == 0:
+            self.open_shard()
+        if self.output_file is not None:
+            self.close_shard()
+        print(f"Filtered dump of {self.kept} pages saved to {self.output_path}" + (f" as {self.shard} shards" if self.shard_pages else ""))
+
+# redirects.py: the title -> canonical page id table. It has to exist before links are folded,
+# so it is the one extractor that needs a pass of its own ahead of the others
+class RedirectsExtractor(Extractor):
+    name = 'redirects'
+
+    def __init__(self, table_path='data/redirects.wvr'):
+        self.table_path = table_path
+        self.collector = RedirectCollector()
+
+    def new_state(self):
+        return RedirectCollector()
+
+    def process(self, page, state):
+        state.add(page)
+
+    def merge(self, task_id, state):
+        self.collector.update(state)
+
+    def close(self):
+        self.collector.write(self.table_path)
+
+# mine_embeddings.py: page verb/link vectors and intersected sentences, checkpointed per task when
+# verb_link_output_path is a segment directory. Its manifest records the task numbering and refuses another, so
+# resume with the same batch_size (or streams_per_task for a bz2 dump); committed tasks are not written twice.
+class EmbeddingsExtractor(Extractor):
+    name = 'embeddings'
+
+    def __init__(self, verb_index_path, link_index_path, verb_link_output_path='page_embeddings', sentences_output_path='intersected_sentences', compress_segments=False, redirects_path=None):
+        # Both vocabularies are compiled into one memory-mapped matcher (see link_matcher.py), which workers share,
+        # with link titles folded to their canonical titles when there is a redirect table
+        self.matcher = open_matcher(verb_index_path, link_index_path, redirects_path=redirects_path)
+        self.redirects = RedirectTable(redirects_path) if redirects_path else None
+        self.verb_link_output_path = verb_link_output_path
+        self.sentences_output_path = sentences_output_path
+        self.compress_segments = compress_segments
+        self.checkpoint = None
+        self.numbering = None
+        self.done = set()
+
+    def resume(self, numbering):
+        if not is_checkpointed(self.verb_link_output_path):
+            return None
+        self.numbering = numbering
+        if os.path.isdir(self.verb_link_output_path):
+            check_numbering(self.verb_link_output_path, numbering)
+            self.done = load_manifest(self.verb_link_output_path)
+        return self.done
+
+    def open(self):
+        if is_checkpointed(self.verb_link_output_path):
+            self.checkpoint = BatchCheckpoint(self.verb_link_output_path, self.sentences_output_path, self.compress_segments, self.numbering)
+        else:
+            self.verb_link_file = open(self.verb_link_output_path, 'a')
+            self.sentences_file = open(self.sentences_output_path, 'a')
+
+    # Pages are matched batch_size at a time (see CompiledMatcher.match_many), the rest at the end of the task
+    batch_size = 1000
+
+    def new_state(self):
+        return [], [], []
+
+    def process(self, page, state):
+        state[0].append((page.title, page.ns, page.text))
+        if len(state[0]) >= self.batch_size:
+            self.match_pages(state)
+
+    def match_pages(self, state):
+        verb_link_vectors, intersected_sentences = process_pages(state[0], self.matcher, self.redirects)
+        state[0].clear()
+        state[1].extend(verb_link_vectors)
+        state[2].extend(intersected_sentences)
+
+    def finish(self, state):
+        self.match_pages(state)
+        return state[1], state[2]
+
+    def merge(self, task_id, state):
+        verb_link_vectors, intersected_sentences = state
+        if self.checkpoint:
+            # Redone only because another extractor of the pass had not committed it
+            if task_id in self.done:
+                return
+            self.checkpoint.commit(task_id, verb_link_vectors, intersected_sentences)
+        else:
+            for vectors in verb_link_vectors:
+                self.verb_link_file.write(json.dumps(vectors) + '\n')
+            for sentence in intersected_sentences:
+                self.sentences_file.write(json.dumps(sentence) + '\n')
+
+    def close(self):
+        if self.checkpoint:
+            self.checkpoint.close()
+        else:
+            self.verb_link_file.close()
+            self.sentences_file.close()
+        print(f"Results saved to {self.verb_link_output_path} and {self.sentences_output_path}")
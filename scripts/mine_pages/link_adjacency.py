@@ -0,0 +1,88 @@
+import json
+import mmap
+import os
+import sys
+from array import array
+
+# Adjacency directory layout (native little-endian, appended page by page):
+#   page_ids.u32      source page id of every page, in dump order
+#   link_offsets.u64  n+1 offsets into link_ids; page i links to link_ids[link_offsets[i]:link_offsets[i + 1]]
+#   link_ids.u32      canonical page ids of the link targets, in text order
+#   meta.json         page and link counts, written on close
+PAGE_IDS = 'page_ids.u32'
+LINK_OFFSETS = 'link_offsets.u64'
+LINK_IDS = 'link_ids.u32'
+META = 'meta.json'
+
+if sys.byteorder != 'little':
+    raise RuntimeError("link_adjacency assumes a little-endian host")
+
+# Appends (page_id, [link_ids]) records to the three arrays; nothing but the current batch is held in memory
+class LinkAdjacencyWriter:
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.page_file = open(os.path.join(output_dir, PAGE_IDS), 'wb')
+        self.offset_file = open(os.path.join(output_dir, LINK_OFFSETS), 'wb')
+        self.link_file = open(os.path.join(output_dir, LINK_IDS), 'wb')
+        self.num_pages = 0
+        self.num_links = 0
+        array('Q', [0]).tofile(self.offset_file)
+
+    def write(self, records):
+        page_ids = array('I')
+        offsets = array('Q')
+        link_ids = array('I')
+        for page_id, links in records:
+            page_ids.append(page_id)
+            link_ids.extend(links)
+            offsets.append(self.num_links + len(link_ids))
+        # Links first, then offsets, then pages: a crash mid-write leaves every listed page complete
+        link_ids.tofile(self.link_file)
+        offsets.tofile(self.offset_file)
+        page_ids.tofile(self.page_file)
+        for f in (self.link_file, self.offset_file, self.page_file):
+            f.flush()
+        self.num_pages += len(page_ids)
+        self.num_links += len(link_ids)
+
+    def close(self, **meta):
+        for f in (self.link_file, self.offset_file, self.page_file):
+            f.close()
+        with open(os.path.join(self.output_dir, META), 'w') as f:
+            json.dump(dict(meta, pages=self.num_pages, links=self.num_links), f, indent=4)
+
+# Memory-mapped view of an adjacency directory
+class LinkAdjacency:
+    def __init__(self, adjacency_dir):
+        self.maps = []
+        self.page_ids = self.open_array(adjacency_dir, PAGE_IDS, 'I')
+        self.link_offsets = self.open_array(adjacency_dir, LINK_OFFSETS, 'Q')
+        self.link_ids = self.open_array(adjacency_dir, LINK_IDS, 'I')
+        # Pages past the last complete offset were torn by a crash
+        self.num_pages = min(len(self.page_ids), len(self.link_offsets) - 1)
+
+    def open_array(self, adjacency_dir, name, typecode):
+        with open(os.path.join(adjacency_dir, name), 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return memoryview(b'').cast(typecode)
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(mm)
+        view = memoryview(mm)
+        return view[:len(view) - len(view) % array(typecode).itemsize].cast(typecode)
+
+    def __len__(self):
+        return self.num_pages
+
+    def links(self, i):
+        return self.link_ids[self.link_offsets[i]:self.link_offsets[i + 1]].tolist()
+
+    def __iter__(self):
+        for i in range(self.num_pages):
+            yield self.page_ids[i], self.links(i)
+
+    def close(self):
+        for view in (self.page_ids, self.link_offsets, self.link_ids):
+            view.release()
+        for mm in self.maps:
+            mm.close()
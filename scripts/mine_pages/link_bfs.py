@@ -0,0 +1,115 @@
+import multiprocessing as mp
+import numpy as np
+
+# Level-synchronous walk counting from one seed at a time over a LinkGraph's forward CSR.
+#
+# For every seed, counts[v] is the number of link walks of length 1..max_depth from the seed that end at v,
+# only continuing through pages with at least min_out_degree links (duplicate links count as separate walks).
+# That is what the queue-based traversal in process_links_iterative counted, but each level is accumulated into a
+# dense per-node count vector, so work is bounded by the edges of the frontier instead of the number of walks, and
+# memory by two num_nodes vectors plus a frontier chunk of at most max_edges links, however many pages a hub reaches.
+# Nodes come back ordered by count and then by first discovery, matching the order the queue version produced.
+
+# Concatenated CSR rows of `nodes`, and the length of each row
+def gather(indptr, indices, nodes):
+    starts = indptr[nodes].astype(np.int64)
+    lengths = indptr[nodes + 1].astype(np.int64) - starts
+    before = np.cumsum(lengths) - lengths
+    positions = np.repeat(starts - before, lengths) + np.arange(int(lengths.sum()), dtype=np.int64)
+    return indices[positions], lengths
+
+# Boundaries splitting weights into runs that add up to at most limit each (a heavier single item is a run of its own)
+def chunk_bounds(weights, limit):
+    ends = np.cumsum(weights)
+    bounds = [0]
+    while bounds[-1] < len(weights):
+        start = bounds[-1]
+        stop = int(np.searchsorted(ends, (ends[start - 1] if start else 0) + limit, side='right'))
+        bounds.append(max(stop, start + 1))
+    return bounds
+
+# Walk counts from one seed. total and level are zeroed num_nodes vectors, handed back zeroed.
+def seed_walk_counts(indptr, indices, seed, max_depth, min_out_degree, total, level, max_edges):
+    nodes = np.array([seed], dtype=np.int64)
+    counts = np.ones(1, dtype=np.int64)
+    reached = []
+    for depth in range(max_depth):
+        degree = indptr[nodes + 1].astype(np.int64) - indptr[nodes].astype(np.int64)
+        keep = degree >= min_out_degree
+        nodes, counts, degree = nodes[keep], counts[keep], degree[keep]
+        if not len(nodes):
+            break
+        # The next frontier, in order of first occurrence among the links of this one
+        discovered = []
+        bounds = chunk_bounds(degree, max_edges)
+        for a, b in zip(bounds, bounds[1:]):
+            targets, lengths = gather(indptr, indices, nodes[a:b])
+            targets = targets.astype(np.int64)
+            unique, first = np.unique(targets, return_index=True)
+            new = level[unique] == 0
+            discovered.append(unique[new][np.argsort(first[new], kind='stable')])
+            np.add.at(level, targets, np.repeat(counts[a:b], lengths))
+        nodes = np.concatenate(discovered)
+        counts = level[nodes]
+        level[nodes] = 0
+        reached.append(nodes[total[nodes] == 0])
+        total[nodes] += counts
+
+    if not reached:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # reached is in order of first discovery, so a stable sort by count keeps that order among ties
+    reached = np.concatenate(reached)
+    totals = total[reached]
+    total[reached] = 0
+    order = np.argsort(-totals, kind='stable')
+    return reached[order], totals[order]
+
+# Walk counts for a batch of seeds. Returns one (nodes, counts) pair of arrays per seed, sorted.
+def walk_counts(graph, seeds, max_depth, min_out_degree=2, max_edges=1 << 22):
+    total = np.zeros(len(graph), dtype=np.int64)
+    level = np.zeros(len(graph), dtype=np.int64)
+    return [seed_walk_counts(graph.fwd_indptr, graph.fwd_indices, seed, max_depth, min_out_degree, total, level, max_edges)
+            for seed in seeds]
+
+# Seeds in tasks of about batch_edges links each, counting for a seed the links of the pages it links to (its second
+# frontier), so that a task of a few hubs weighs about as much as one of many small pages
+def seed_batches(graph, seeds, batch_edges, max_edges=1 << 22):
+    indptr = graph.fwd_indptr
+    out_degree = graph.out_degree().astype(np.int64)
+    seeds = np.asarray(seeds, dtype=np.int64)
+    costs = []
+    bounds = chunk_bounds(out_degree[seeds], max_edges)
+    for a, b in zip(bounds, bounds[1:]):
+        targets, lengths = gather(indptr, graph.fwd_indices, seeds[a:b])
+        sums = np.concatenate(([0], np.cumsum(out_degree[targets])))
+        ends = np.cumsum(lengths)
+        costs.append(1 + sums[ends] - sums[ends - lengths])
+    bounds = chunk_bounds(np.concatenate(costs) if costs else np.zeros(0, dtype=np.int64), batch_edges)
+    return [seeds[a:b].tolist() for a, b in zip(bounds, bounds[1:])]
+
+# Worker globals: the graph is memory-mapped in the parent and shared with the forked pool
+_graph = None
+
+def init_worker(graph):
+    global _graph
+    _graph = graph
+
+def walk_counts_task(task):
+    seeds, max_depth, min_out_degree, max_edges = task
+    return walk_counts(_graph, seeds, max_depth, min_out_degree, max_edges)
+
+# Walk counts for any number of seeds, in tasks of about batch_edges second-frontier links (see seed_batches)
+# spread over num_workers processes. Yields (seed, nodes, counts) in seed order.
+def iter_walk_counts(graph, seeds, max_depth, min_out_degree=2, batch_edges=1 << 24, num_workers=None, max_edges=1 << 22):
+    batches = seed_batches(graph, seeds, batch_edges, max_edges)
+    tasks = [(batch, max_depth, min_out_degree, max_edges) for batch in batches]
+    if num_workers == 1 or len(batches) <= 1:
+        results = (walk_counts(graph, *task) for task in tasks)
+        for batch, result in zip(batches, results):
+            for seed, (nodes, counts) in zip(batch, result):
+                yield seed, nodes, counts
+        return
+    with mp.Pool(processes=num_workers or mp.cpu_count(), initializer=init_worker, initargs=(graph,)) as pool:
+        for batch, result in zip(batches, pool.imap(walk_counts_task, tasks)):
+            for seed, (nodes, counts) in zip(batch, result):
+                yield seed, nodes, counts
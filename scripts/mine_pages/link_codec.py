@@ -0,0 +1,87 @@
+import json
+import numpy as np
+
+# Link lists of the records table (see build_records_db.py) as BLOBs: the ids sorted ascending, duplicates kept,
+# stored as the differences between neighbours in LEB128 varints (7 bits per byte, high bit set on every byte
+# but the last of a value). Sorting makes the differences small, so most take one or two bytes, and no
+# consumer depends on link order, only on the ids and how often each occurs.
+MAX_VARINT_BYTES = 5  # enough for any uint32
+
+# Varint bytes of a uint32 array, and how many bytes each value took
+def encode_varints(values):
+    lengths = np.ones(len(values), dtype=np.int64)
+    for k in range(1, MAX_VARINT_BYTES):
+        lengths += values >= (1 << (7 * k))
+    starts = np.cumsum(lengths) - lengths
+    out = np.zeros(int(lengths.sum()), dtype=np.uint8)
+    for k in range(MAX_VARINT_BYTES):
+        has_byte = lengths > k
+        if not has_byte.any():
+            break
+        chunk = (values[has_byte] >> np.uint32(7 * k)) & np.uint32(0x7F)
+        more = (lengths[has_byte] > k + 1).astype(np.uint32) << np.uint32(7)
+        out[starts[has_byte] + k] = chunk | more
+    return out, lengths
+
+# A batch of link lists to BLOBs in one pass, as build_records_db.py writes them
+def encode_links_many(lists):
+    counts = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+    offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    values = np.fromiter((link for links in lists for link in links), dtype=np.uint32, count=int(offsets[-1]))
+    # Sort within each list, then difference against the previous id of the same list
+    owners = np.repeat(np.arange(len(lists)), counts)
+    values = values[np.lexsort((values, owners))]
+    deltas = np.diff(values, prepend=np.uint32(0))
+    firsts = offsets[:-1][counts > 0]
+    deltas[firsts] = values[firsts]
+    out, lengths = encode_varints(deltas)
+    byte_offsets = np.concatenate(([0], np.cumsum(lengths)))[offsets].tolist()
+    data = out.tobytes()
+    return [data[start:end] for start, end in zip(byte_offsets[:-1], byte_offsets[1:])]
+
+def encode_links(ids):
+    return encode_links_many([ids])[0]
+
+# Values of a run of varints, one per byte with the high bit clear
+def decode_varints(data):
+    ends = np.flatnonzero(data < 0x80)
+    if not len(ends):
+        return np.zeros(0, dtype=np.uint32)
+    data = data[:ends[-1] + 1]
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shifts = (np.arange(len(data)) - np.repeat(starts, ends - starts + 1)) * 7
+    # The 7-bit groups of a value never overlap, so summing the shifted groups assembles it
+    groups = (data & 0x7F).astype(np.uint32) << shifts.astype(np.uint32)
+    return np.add.reduceat(groups, starts)
+
+# One stored value to a uint32 array; JSON text from a database that has not been migrated yet still decodes
+def decode_links(value):
+    if isinstance(value, str):
+        return np.asarray(json.loads(value), dtype=np.uint32)
+    if not value:
+        return np.zeros(0, dtype=np.uint32)
+    return np.cumsum(decode_varints(np.frombuffer(value, dtype=np.uint8)), dtype=np.uint32)
+
+# A batch of stored values decoded in one pass: (ids, offsets), value i being ids[offsets[i]:offsets[i + 1]]
+def decode_links_many(values):
+    if any(isinstance(value, str) for value in values):
+        arrays = [decode_links(value) for value in values]
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum([len(array) for array in arrays], out=offsets[1:])
+        return (np.concatenate(arrays) if arrays else np.zeros(0, dtype=np.uint32)), offsets
+    data = np.frombuffer(b''.join(value or b'' for value in values), dtype=np.uint8)
+    byte_offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum([len(value or b'') for value in values], out=byte_offsets[1:])
+    # Every value of a blob ends on a byte with the high bit clear
+    ends_before = np.concatenate(([0], np.cumsum(data < 0x80)))
+    counts = ends_before[byte_offsets[1:]] - ends_before[byte_offsets[:-1]]
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    if not len(data):
+        return np.zeros(0, dtype=np.uint32), offsets
+    # Running sums restart at every value: subtract the total reached before the value starts
+    totals = np.cumsum(decode_varints(data), dtype=np.uint64)
+    before = np.concatenate(([0], totals))[offsets[:-1]]
+    ids = (totals - np.repeat(before, counts)).astype(np.uint32)
+    return ids, offsets
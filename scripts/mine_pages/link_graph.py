@@ -0,0 +1,170 @@
+import json
+import os
+import numpy as np
+from tqdm import tqdm
+from redirects import title_hash
+
+# Link graph directory layout (.npy arrays are opened with mmap_mode='r'):
+#   title_offsets.npy  uint64[n+1]  byte offsets of node titles in titles.bin
+#   titles.bin         UTF-8 titles of the n nodes back to back
+#   title_hashes.npy   uint64[n]    title hashes, sorted, for title -> node lookups
+#   title_nodes.npy    uint32[n]    node id of each sorted hash
+#   fwd_indptr.npy     uint64[n+1]  out-links of node i are fwd_indices[fwd_indptr[i]:fwd_indptr[i + 1]]
+#   fwd_indices.npy    uint32[m]    in text order, duplicates kept
+#   rev_indptr.npy     uint64[n+1]  in-links of node i are rev_indices[rev_indptr[i]:rev_indptr[i + 1]]
+#   rev_indices.npy    uint32[m]
+#   meta.json          node and edge counts and the source the graph was built from
+ARRAYS = ['title_offsets', 'title_hashes', 'title_nodes', 'fwd_indptr', 'fwd_indices', 'rev_indptr', 'rev_indices']
+TITLES = 'titles.bin'
+META = 'meta.json'
+
+# Rows of (node, [nodes]) to CSR: a stable sort by row keeps each row's links in their original order
+def to_csr(rows, cols, num_nodes):
+    order = np.argsort(rows, kind='stable')
+    indices = cols[order].astype(np.uint32)
+    indptr = np.zeros(num_nodes + 1, dtype=np.uint64)
+    np.cumsum(np.bincount(rows, minlength=num_nodes), out=indptr[1:])
+    return indptr, indices
+
+def write_link_graph(graph_dir, titles, sources, targets, meta):
+    os.makedirs(graph_dir, exist_ok=True)
+    num_nodes = len(titles)
+    sources = np.asarray(sources, dtype=np.uint32)
+    targets = np.asarray(targets, dtype=np.uint32)
+    fwd_indptr, fwd_indices = to_csr(sources, targets, num_nodes)
+    rev_indptr, rev_indices = to_csr(targets, sources, num_nodes)
+
+    encoded = [title.encode('utf-8') for title in titles]
+    title_offsets = np.zeros(num_nodes + 1, dtype=np.uint64)
+    np.cumsum([len(title) for title in encoded], out=title_offsets[1:])
+    with open(os.path.join(graph_dir, TITLES), 'wb') as f:
+        f.writelines(encoded)
+    hashes = np.fromiter((title_hash(title) for title in titles), dtype=np.uint64, count=num_nodes)
+    title_nodes = np.argsort(hashes, kind='stable').astype(np.uint32)
+
+    arrays = {'title_offsets': title_offsets, 'title_hashes': hashes[title_nodes], 'title_nodes': title_nodes,
+              'fwd_indptr': fwd_indptr, 'fwd_indices': fwd_indices, 'rev_indptr': rev_indptr, 'rev_indices': rev_indices}
+    for name, values in arrays.items():
+        np.save(os.path.join(graph_dir, name + '.npy'), values)
+    with open(os.path.join(graph_dir, META), 'w') as f:
+        json.dump(dict(meta, nodes=num_nodes, edges=len(fwd_indices)), f, indent=4)
+    print(f"Link graph of {num_nodes} nodes and {len(fwd_indices)} links written to {graph_dir}")
+
+# Build from links.jsonl ({title: [links]} per line) or links.json ({title: [links]}); titles are kept as written
+def build_link_graph(links_path, graph_dir):
+    node_ids = {}
+    source_chunks = []
+    target_chunks = []
+
+    def node(title):
+        node_id = node_ids.get(title)
+        if node_id is None:
+            node_id = node_ids[title] = len(node_ids)
+        return node_id
+
+    def add(title, links):
+        source = node(title)
+        target_chunks.append(np.fromiter((node(link) for link in links), dtype=np.uint32, count=len(links)))
+        source_chunks.append(np.full(len(links), source, dtype=np.uint32))
+
+    with open(links_path, 'r') as f:
+        if links_path.endswith('.jsonl'):
+            for line in tqdm(f, desc="Loading links"):
+                for title, links in json.loads(line).items():
+                    add(title, links)
+        else:
+            for title, links in tqdm(json.load(f).items(), desc="Loading links"):
+                add(title, links)
+
+    sources = np.concatenate(source_chunks) if source_chunks else np.zeros(0, dtype=np.uint32)
+    targets = np.concatenate(target_chunks) if target_chunks else np.zeros(0, dtype=np.uint32)
+    titles = list(node_ids)
+    del node_ids
+    write_link_graph(graph_dir, titles, sources, targets, {'source': links_path})
+
+# Build from a page id adjacency (see link_adjacency.py), naming nodes through the redirect table
+def build_link_graph_from_adjacency(adjacency_dir, redirects_path, graph_dir):
+    from link_adjacency import LinkAdjacency
+    from redirects import RedirectTable
+    adjacency = LinkAdjacency(adjacency_dir)
+    redirects = RedirectTable(redirects_path)
+    page_ids = np.frombuffer(adjacency.page_ids, dtype=np.uint32)[:len(adjacency)]
+    offsets = np.frombuffer(adjacency.link_offsets, dtype=np.uint64)[:len(adjacency) + 1]
+    link_ids = np.frombuffer(adjacency.link_ids, dtype=np.uint32)[:int(offsets[-1])]
+    # Dense node ids in page id order
+    nodes = np.unique(np.concatenate([page_ids, link_ids]))
+    sources = np.repeat(np.searchsorted(nodes, page_ids), np.diff(offsets).astype(np.int64))
+    targets = np.searchsorted(nodes, link_ids)
+    titles = [redirects.title(int(page_id)) or str(page_id) for page_id in nodes]
+    write_link_graph(graph_dir, titles, sources, targets, {'source': adjacency_dir, 'redirects_path': redirects_path})
+    del page_ids, offsets, link_ids
+    adjacency.close()
+    redirects.close()
+
+# Memory-mapped link graph: opening it reads no edges, and forked workers share the mapped pages
+class LinkGraph:
+    def __init__(self, graph_dir):
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(graph_dir, name + '.npy'), mmap_mode='r'))
+        self.titles = np.memmap(os.path.join(graph_dir, TITLES), dtype=np.uint8, mode='r') if os.path.getsize(os.path.join(graph_dir, TITLES)) else np.zeros(0, dtype=np.uint8)
+        self.num_nodes = len(self.title_offsets) - 1
+
+    def __len__(self):
+        return self.num_nodes
+
+    # Node id of a title, or None
+    def id(self, title):
+        key = np.uint64(title_hash(title))
+        i = int(np.searchsorted(self.title_hashes, key))
+        while i < self.num_nodes and self.title_hashes[i] == key:
+            node = int(self.title_nodes[i])
+            if self.title(node) == title:
+                return node
+            i += 1
+        return None
+
+    def title(self, node):
+        return self.titles[int(self.title_offsets[node]):int(self.title_offsets[node + 1])].tobytes().decode('utf-8')
+
+    def neighbors(self, node):
+        return self.fwd_indices[int(self.fwd_indptr[node]):int(self.fwd_indptr[node + 1])]
+
+    def in_neighbors(self, node):
+        return self.rev_indices[int(self.rev_indptr[node]):int(self.rev_indptr[node + 1])]
+
+    def out_degree(self, node=None):
+        if node is None:
+            return np.diff(self.fwd_indptr)
+        return int(self.fwd_indptr[node + 1] - self.fwd_indptr[node])
+
+    def in_degree(self, node=None):
+        if node is None:
+            return np.diff(self.rev_indptr)
+        return int(self.rev_indptr[node + 1] - self.rev_indptr[node])
+
+    # Induced subgraph on a set of nodes: (sorted node ids, indptr, indices) with indices relabelled to positions in nodes
+    def subgraph(self, nodes):
+        nodes = np.unique(np.asarray(nodes, dtype=np.uint32))
+        indptr = np.zeros(len(nodes) + 1, dtype=np.uint64)
+        rows = []
+        for i, node in enumerate(nodes):
+            links = self.neighbors(node)
+            positions = np.searchsorted(nodes, links)
+            positions[positions == len(nodes)] = 0
+            keep = nodes[positions] == links if len(nodes) else np.zeros(0, dtype=bool)
+            rows.append(positions[keep].astype(np.uint32))
+            indptr[i + 1] = indptr[i] + int(keep.sum())
+        indices = np.concatenate(rows) if rows else np.zeros(0, dtype=np.uint32)
+        return nodes, indptr, indices
+
+# Open a graph, building it from its links file first if it does not exist yet
+def open_link_graph(links_path, graph_dir):
+    if not os.path.exists(os.path.join(graph_dir, META)):
+        build_link_graph(links_path, graph_dir)
+    return LinkGraph(graph_dir)
+
+if __name__ == "__main__":
+    links_path = 'wiki_knowledge/links.jsonl'  # or data/links.json from find_links.py
+    graph_dir = 'wiki_knowledge/link_graph'
+
+    build_link_graph(links_path, graph_dir)
@@ -0,0 +1,515 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from itertools import compress
+import numpy as np
+from redirects import RedirectTable
+from vocabulary import open_vocabulary
+
+# Tokens are whitespace separated, with wiki link markup ([[, ]] and |) treated as separators
+markup_table = str.maketrans('[]|', '   ')
+
+# Marker key for "a vocabulary entry ends here"; tokens are always str so None never collides
+END = None
+
+# Token trie over the verb and link vocabularies, built once and scanned once per page
+class LinkMatcher:
+    def __init__(self, verb_index, link_index):
+        self.root = {}
+        self.max_len = 0
+        for verb, emb_idx in verb_index.items():
+            self.add(verb, emb_idx, 0)
+        for link, emb_idx in link_index.items():
+            self.add(link, emb_idx, 1)
+
+    # Insert one entry; the terminal holds [verb_idx, link_idx] so a title can be both
+    def add(self, phrase, emb_idx, slot):
+        tokens = self.tokenize(phrase)
+        if not tokens:
+            return
+        node = self.root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        terminal = node.get(END)
+        if terminal is None:
+            terminal = node[END] = [None, None]
+        terminal[slot] = emb_idx
+        self.max_len = max(self.max_len, len(tokens))
+
+    # Whether a single token is itself a verb vocabulary entry, so callers need no verb dict of their own
+    def is_verb(self, token):
+        node = self.root.get(token)
+        return node is not None and END in node and node[END][0] is not None
+
+    def verbs_of(self, words):
+        return {word for word in words if self.is_verb(word)}
+
+    def tokenize(self, text):
+        return text.translate(markup_table).split()
+
+    # Left to right longest-match scan, returning the verb and link emb_idx hits in text order
+    def match(self, text):
+        tokens = self.tokenize(text)
+        # Resolve every token against the root at C speed, then only walk from positions that start an entry
+        heads = list(map(self.root.get, tokens))
+        verb_hits = []
+        link_hits = []
+        n = len(tokens)
+        resume_at = 0
+        for i in compress(range(n), heads):
+            if i < resume_at:
+                continue
+            node = heads[i]
+            best = node.get(END)
+            best_end = i + 1
+            j = i + 1
+            # Keep extending while the node has children beyond its END marker
+            while j < n and (len(node) > 1 or END not in node):
+                node = node.get(tokens[j])
+                if node is None:
+                    break
+                j += 1
+                terminal = node.get(END)
+                if terminal is not None:
+                    best = terminal
+                    best_end = j
+            if best is None:
+                continue
+            if best[0] is not None:
+                verb_hits.append(best[0])
+            if best[1] is not None:
+                link_hits.append(best[1])
+            resume_at = best_end
+        return verb_hits, link_hits
+
+    def match_many(self, texts):
+        return [self.match(text) for text in texts]
+
+# Compiled matcher over the verb and link vocabularies, native little-endian, sections 8-byte aligned:
+#   header: magic, version, longest entry in tokens, log2 of the slot counts of the token and child tables, token
+#   count, node count, entry count, then (offset, length) of the sections:
+#   token_keys     uint64[ts]   hash of a vocabulary token, 0 for an empty slot   \ open-addressing hash table from a
+#   token_ids      uint32[ts]   its token id, from 1                              / token's bytes to its id
+#   token_offsets  int64[t+2]   bytes of token id i are token_data[token_offsets[i]:token_offsets[i + 1]]
+#   token_data     uint8[]      UTF-8 tokens back to back and 8 bytes of padding, to check hash hits against
+#   root_children  uint32[t+1]  trie node of the one-token prefix starting with token id i, 0 when none
+#   child_keys     uint64[cs]   node << 32 | token id of a trie edge below the root, 0 for an empty slot
+#   child_nodes    uint32[cs]   the node the edge leads to
+#   node_verbs     uint32[n]    verb emb_idx of the entry ending at node i, or NO_ENTRY
+#   node_links     uint32[n]    link emb_idx of the entry ending at node i, or NO_ENTRY
+#   node_flags     uint8[n]     ENTRY when an entry ends at node i, EXTENDS when node i has children
+# Node 0 is the root. A page is tokenized, each distinct token is interned to its id with one hashed lookup and a
+# byte comparison, and the trie is then walked over token ids with exact integer keys, so no lookup can report an
+# entry that is not in the vocabulary. The walk advances every candidate start of a whole batch of pages at once,
+# against a file that worker processes share through the page cache, instead of a dict trie copied into every process.
+MATCHER_MAGIC = b'WVMAT\x00\x00\x01'
+MATCHER_VERSION = 2
+MATCHER_SECTIONS = ['token_keys', 'token_ids', 'token_offsets', 'token_data', 'root_children', 'child_keys',
+                    'child_nodes', 'node_verbs', 'node_links', 'node_flags']
+MATCHER_DTYPES = [np.uint64, np.uint32, np.int64, np.uint8, np.uint32, np.uint64, np.uint32, np.uint32, np.uint32,
+                  np.uint8]
+MATCHER_HEADER = struct.Struct('<8sIIIIQQQ' + 'QQ' * len(MATCHER_SECTIONS))
+MATCHER_SUFFIX = '.wvm'
+NO_ENTRY = 0xFFFFFFFF
+EXTENDS = 1
+ENTRY = 2
+PROBE_WINDOW = 4
+PROBE_OFFSETS = np.arange(PROBE_WINDOW)
+SPACE = ord(' ')
+MATCH_BYTES = 1 << 20
+PADDING = b' ' * 8
+
+# Odd multiplier of the token hash
+MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+if sys.byteorder != 'little':
+    raise RuntimeError("link_matcher assumes a little-endian host")
+
+# Every character str.split() splits on, and the wiki link markup, as spaces: the tokens of a page are then the
+# runs of bytes other than a space in its UTF-8 encoding, exactly those tokenize() gives
+space_table = str.maketrans({**{c: ' ' for c in range(0x10000) if chr(c).isspace()}, **{ord(c): ' ' for c in '[]|'}})
+
+# The low k bytes of a word, for k = 0..8
+BYTE_MASKS = np.array([(1 << (8 * k)) - 1 for k in range(9)], np.uint64)
+
+# Every 8 bytes of data from each offset, as little-endian words; data ends with 8 bytes of padding
+def word_view(data):
+    return np.ndarray((len(data) - 7,), '<u8', data, 0, (1,))
+
+# Byte spans and hashes of the space-separated tokens of data, which ends with PADDING. A token is hashed 8 bytes
+# at a time, from its length and its words (the last one masked to the token), so the cost is per token rather than
+# per byte; 0, the empty slot, becomes 1.
+def hash_tokens(data):
+    spaces = np.empty(len(data) + 2, bool)
+    spaces[0] = spaces[-1] = True
+    np.equal(np.frombuffer(data, np.uint8), SPACE, out=spaces[1:-1])
+    edges = np.flatnonzero(spaces[1:] != spaces[:-1])
+    starts, ends = edges[::2], edges[1::2]
+    words = word_view(data)
+    lengths = ends - starts
+    hashes = (lengths.astype(np.uint64) * MULTIPLIER ^ (words[starts] & BYTE_MASKS[np.minimum(lengths, 8)])) * MULTIPLIER
+    pending = np.flatnonzero(lengths > 8)
+    offset = 8
+    while len(pending):
+        left = lengths[pending] - offset
+        word = words[starts[pending] + offset] & BYTE_MASKS[np.minimum(left, 8)]
+        hashes[pending] = (hashes[pending] ^ word) * MULTIPLIER
+        pending = pending[left > 8]
+        offset += 8
+    return starts, ends, np.maximum(hashes ^ (hashes >> np.uint64(32)), np.uint64(1))
+
+def tokenize(text):
+    return text.translate(markup_table).split()
+
+# Home slot of each key: the top bits of the key times the multiplier
+def home_slots(keys, bits):
+    return ((keys * MULTIPLIER) >> np.uint64(64 - bits)).view(np.int64)
+
+# Place unique nonzero keys by linear probing, a round per probe step: every key whose slot is free either takes it
+# or, losing to another key of the same round, moves on like the keys that found it taken
+def build_table(keys, bits):
+    size = 1 << bits
+    slot_keys = np.zeros(size, np.uint64)
+    placed_at = np.empty(len(keys), np.int64)
+    pending = np.arange(len(keys))
+    slots = home_slots(keys, bits)
+    while len(pending):
+        free = slot_keys[slots] == 0
+        taken, first = np.unique(slots[free], return_index=True)
+        winners = pending[free][first]
+        slot_keys[taken] = keys[winners]
+        placed_at[winners] = taken
+        left = np.ones(len(pending), bool)
+        left[np.flatnonzero(free)[first]] = False
+        pending = pending[left]
+        slots = (slots[left] + 1) & (size - 1)
+    return slot_keys, placed_at
+
+# Slots of a table of 2**bits slots for 2**bits >= keys / load_factor
+def table_bits(num_keys, load_factor=0.5):
+    return max(4, int(np.ceil(np.log2(max(num_keys, 1) / load_factor))))
+
+# Slot of each key in slot_keys, or -1 where it is not a key. Most keys are settled at their home slot; the rest
+# probe PROBE_WINDOW slots at a time in one gather, until a hit or an empty slot.
+def find_slots(slot_keys, keys, bits):
+    mask = (1 << bits) - 1
+    slots = home_slots(keys, bits)
+    stored = slot_keys[slots]
+    hit = stored == keys
+    found = np.where(hit, slots, -1)
+    pending = np.flatnonzero(~hit & (stored != 0))
+    slots = (slots[pending] + 1) & mask
+    while len(pending):
+        window = slot_keys[(slots[:, None] + PROBE_OFFSETS) & mask]
+        hits = window == keys[pending, None]
+        hit = hits.any(axis=1)
+        found[pending[hit]] = (slots[hit] + hits[hit].argmax(axis=1)) & mask
+        # A key is never stored past an empty slot of its probe sequence
+        probe = ~hit & (window != 0).all(axis=1)
+        pending = pending[probe]
+        slots = (slots[probe] + PROBE_WINDOW) & mask
+    return found
+
+# Token ids (interned into token_ids, from 1) of the terms of one vocabulary, from its (term, emb_idx) items in
+# order: the ids of all terms back to back, the token count of each term and its emb_idx
+def intern_terms(items, token_ids):
+    ids, lengths, values = array('I'), array('q'), array('I')
+    for term, emb_idx in items:
+        tokens = tokenize(term)
+        if tokens:
+            ids.extend([token_ids.setdefault(token, len(token_ids) + 1) for token in tokens])
+            lengths.append(len(tokens))
+            values.append(emb_idx)
+    return np.frombuffer(ids, np.uint32), np.frombuffer(lengths, np.int64), np.frombuffer(values, np.uint32)
+
+# Trie nodes of token id sequences (ids back to back, lengths per term), a level at a time: every distinct
+# (parent node, token id) of a level is one node. Returns each term's last node, the edges below the root as
+# (key, node) and the node count.
+def build_trie(ids, lengths, max_len):
+    term_starts = np.cumsum(lengths) - lengths
+    nodes = np.zeros(len(lengths), np.int64)
+    edge_keys, edge_nodes, num_nodes = [], [], 1
+    for level in range(max_len):
+        terms = np.flatnonzero(lengths > level)
+        keys = (nodes[terms].astype(np.uint64) << np.uint64(32)) | ids[term_starts[terms] + level].astype(np.uint64)
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        nodes[terms] = num_nodes + inverse
+        edge_keys.append(unique_keys)
+        edge_nodes.append(np.arange(num_nodes, num_nodes + len(unique_keys)))
+        num_nodes += len(unique_keys)
+    return nodes, np.concatenate(edge_keys), np.concatenate(edge_nodes), num_nodes
+
+# A term that tokenizes like an earlier one replaces it, as an insert into the dict trie would
+def last_wins(nodes, values):
+    keys, first = np.unique(nodes[::-1], return_index=True)
+    return keys, values[::-1][first]
+
+# The link vocabulary's items with every term that a redirect table resolves to another title of the vocabulary
+# mapped to that title's emb_idx, so a link is reported by its canonical page however the text spells it
+def canonical_items(link_index, redirects):
+    for term, emb_idx in link_index.items():
+        yield term, link_index.get(redirects.resolve(term), emb_idx)
+
+def write_matcher(matcher_path, verb_index, link_index, redirects=None, load_factor=0.5):
+    token_ids = {}
+    verb_ids, verb_lengths, verb_values = intern_terms(verb_index.items(), token_ids)
+    link_items = canonical_items(link_index, redirects) if redirects else link_index.items()
+    link_ids, link_lengths, link_values = intern_terms(link_items, token_ids)
+    lengths = np.concatenate((verb_lengths, link_lengths))
+    max_len = int(lengths.max()) if len(lengths) else 0
+    term_nodes, edge_keys, edge_nodes, num_nodes = build_trie(np.concatenate((verb_ids, link_ids)), lengths, max_len)
+    del verb_ids, link_ids, lengths
+
+    # Tokens in id order, hashed as the matcher hashes page tokens
+    tokens = [token.encode('utf-8') for token in token_ids]
+    del token_ids
+    token_hashes = hash_tokens(b' '.join(tokens) + PADDING)[2]
+    if len(np.unique(token_hashes)) != len(token_hashes):
+        raise ValueError("two vocabulary tokens share a hash; the matcher cannot tell them apart")
+    token_offsets = np.zeros(len(tokens) + 2, np.int64)
+    np.cumsum([len(token) for token in tokens], out=token_offsets[2:])
+    token_data = b''.join(tokens) + bytes(8)  # padding, see word_view
+    del tokens
+    token_bits = table_bits(len(token_hashes), load_factor)
+    token_keys, placed_at = build_table(token_hashes, token_bits)
+    token_slot_ids = np.zeros(len(token_keys), np.uint32)
+    token_slot_ids[placed_at] = np.arange(1, len(token_hashes) + 1)
+
+    # Edges from the root are indexed by token id; the others go to the child table
+    from_root = (edge_keys >> np.uint64(32)) == 0
+    root_children = np.zeros(len(token_hashes) + 1, np.uint32)
+    root_children[edge_keys[from_root].astype(np.int64)] = edge_nodes[from_root]
+    child_bits = table_bits(int((~from_root).sum()), load_factor)
+    child_keys, placed_at = build_table(edge_keys[~from_root], child_bits)
+    child_nodes = np.zeros(len(child_keys), np.uint32)
+    child_nodes[placed_at] = edge_nodes[~from_root]
+
+    node_verbs = np.full(num_nodes, NO_ENTRY, np.uint32)
+    node_links = np.full(num_nodes, NO_ENTRY, np.uint32)
+    nodes, values = last_wins(term_nodes[:len(verb_values)], verb_values)
+    node_verbs[nodes] = values
+    nodes, values = last_wins(term_nodes[len(verb_values):], link_values)
+    node_links[nodes] = values
+    node_flags = np.zeros(num_nodes, np.uint8)
+    node_flags[(edge_keys[~from_root] >> np.uint64(32)).astype(np.int64)] = EXTENDS
+    node_flags[(node_verbs != NO_ENTRY) | (node_links != NO_ENTRY)] |= ENTRY
+    num_entries = int(((node_flags & ENTRY) != 0).sum())
+
+    sections = [token_keys, token_slot_ids, token_offsets, np.frombuffer(token_data, np.uint8), root_children,
+                child_keys, child_nodes, node_verbs, node_links, node_flags]
+    positions = []
+    offset = MATCHER_HEADER.size
+    for section in sections:
+        offset += -offset % 8
+        positions.extend([offset, section.nbytes])
+        offset += section.nbytes
+
+    tmp_path = matcher_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(MATCHER_HEADER.pack(MATCHER_MAGIC, MATCHER_VERSION, max_len, token_bits, child_bits,
+                                    len(token_hashes), num_nodes, num_entries, *positions))
+        for section, start in zip(sections, positions[::2]):
+            f.write(b'\x00' * (start - f.tell()))
+            f.write(section.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, matcher_path)
+    print(f"{num_entries} entries over {len(token_hashes)} tokens and {num_nodes} trie nodes written to {matcher_path}")
+
+# Drop-in for LinkMatcher over a compiled matcher file. A pickled matcher reopens the file instead of copying it.
+# match_many() matches a batch of pages in one pass, which is how mine_embeddings.py and EmbeddingsExtractor call it.
+class CompiledMatcher:
+    def __init__(self, matcher_path):
+        self.path = matcher_path
+        with open(matcher_path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = MATCHER_HEADER.unpack_from(self.mm, 0)
+        magic, version = header[:2]
+        if magic != MATCHER_MAGIC or version != MATCHER_VERSION:
+            raise ValueError(f"{matcher_path} is not a compiled matcher of version {MATCHER_VERSION}")
+        self.max_len, self.token_bits, self.child_bits, self.num_tokens, self.num_nodes, self.num_entries = header[2:8]
+        for name, dtype, start, length in zip(MATCHER_SECTIONS, MATCHER_DTYPES, header[8::2], header[9::2]):
+            setattr(self, name, np.frombuffer(self.mm, dtype, length // np.dtype(dtype).itemsize, start))
+        self.token_words = word_view(self.token_data)
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def tokenize(self, text):
+        return tokenize(text)
+
+    # Byte spans and token ids of the space-separated tokens of data, 0 for a token that is not in the vocabulary.
+    # A hash hit counts only when the stored token has the same bytes. data ends with 8 spaces of padding.
+    def intern(self, data):
+        starts, ends, hashes = hash_tokens(data)
+        ids = np.zeros(len(starts), np.int64)
+        slots = find_slots(self.token_keys, hashes, self.token_bits)
+        hit = np.flatnonzero(slots >= 0)
+        candidates = self.token_ids[slots[hit]].astype(np.int64)
+        page_starts = starts[hit]
+        lengths = ends[hit] - page_starts
+        stored_starts = self.token_offsets[candidates]
+        # Compared 8 bytes at a time, the last word masked to the token's length
+        page_words = word_view(data)
+        differ = page_words[page_starts] ^ self.token_words[stored_starts]
+        equal = ((self.token_offsets[candidates + 1] - stored_starts == lengths)
+                 & ((differ & BYTE_MASKS[np.minimum(lengths, 8)]) == 0))
+        pending = np.flatnonzero(equal & (lengths > 8))
+        offset = 8
+        while len(pending):
+            left = lengths[pending] - offset
+            differ = page_words[page_starts[pending] + offset] ^ self.token_words[stored_starts[pending] + offset]
+            equal[pending] = (differ & BYTE_MASKS[np.minimum(left, 8)]) == 0
+            pending = pending[(left > 8) & equal[pending]]
+            offset += 8
+        ids[hit[equal]] = candidates[equal]
+        return starts, ends, ids
+
+    # Node of the longest entry starting at each candidate start (tokens whose one-token prefix is in the trie),
+    # 0 where none does, and its length in tokens. tids ends with a 0, as every page does, and token id 0 has no
+    # trie edge, so no walk runs past it.
+    def longest_entries(self, tids):
+        heads = self.root_children[tids]
+        starts = np.flatnonzero(heads)
+        nodes = heads[starts].astype(np.int64)
+        flags = self.node_flags[nodes]
+        best = np.where(flags >= ENTRY, nodes, 0)
+        best_length = np.ones(len(starts), np.int64)
+        alive = np.flatnonzero(flags & EXTENDS)
+        nodes = nodes[alive]
+        positions = starts[alive] + 1
+        length = 1
+        while len(alive):
+            keys = ((nodes << 32) | tids[positions]).view(np.uint64)
+            slots = find_slots(self.child_keys, keys, self.child_bits)
+            known = np.flatnonzero(slots >= 0)
+            alive, positions = alive[known], positions[known] + 1
+            nodes = self.child_nodes[slots[known]].astype(np.int64)
+            length += 1
+            flags = self.node_flags[nodes]
+            entry = flags >= ENTRY
+            best[alive[entry]] = nodes[entry]
+            best_length[alive[entry]] = length
+            extends = (flags & EXTENDS).view(bool)
+            alive, nodes, positions = alive[extends], nodes[extends], positions[extends]
+        return starts, best, best_length
+
+    # Left to right longest-match scan of each text, returning (verb emb_idx hits, link emb_idx hits) per text in
+    # text order, as LinkMatcher.match does for one. Texts are matched MATCH_BYTES or so at a time, which bounds
+    # the per-byte arrays.
+    def match_many(self, texts):
+        results = []
+        group = []
+        size = 0
+        for text in texts:
+            group.append(text.translate(space_table).encode('utf-8'))
+            size += len(group[-1])
+            if size >= MATCH_BYTES:
+                results.extend(self.match_group(group))
+                group = []
+                size = 0
+        if group:
+            results.extend(self.match_group(group))
+        return results
+
+    # match_many over one group of pages, each already through space_table and encoded
+    def match_group(self, pages):
+        starts, _, tids = self.intern(b' '.join(pages) + PADDING)
+        # Token id 0, which has no trie edge, after every page's tokens, so no entry spans two pages
+        page_ends = np.cumsum(np.fromiter(map(len, pages), np.int64, len(pages)) + 1) - 1
+        cuts = np.searchsorted(starts, page_ends)
+        tids = np.insert(tids, cuts, 0)
+        bounds = np.concatenate(([0], cuts + np.arange(1, len(pages) + 1)))
+
+        starts, best, lengths = self.longest_entries(tids)
+        found = np.flatnonzero(best)
+        starts, nodes, lengths = starts[found], best[found], lengths[found]
+        # A one-token entry never overlaps the next start, so only multi-token entries are resolved, and the starts
+        # that the chosen ones cover are dropped. One that overlaps no earlier one is always chosen, and so is the
+        # next one at or after the end of a chosen one; that chain is followed by pointer doubling, all at once.
+        longer = np.flatnonzero(lengths > 1)
+        if len(longer):
+            longer_starts = starts[longer]
+            longer_ends = longer_starts + lengths[longer]
+            reach = np.maximum.accumulate(longer_ends)
+            chosen = np.concatenate(([True], longer_starts[1:] >= reach[:-1], [False]))
+            jump = np.append(np.searchsorted(longer_starts, longer_ends), len(longer))
+            grown = True
+            while grown:
+                count = np.count_nonzero(chosen)
+                chosen[jump[chosen]] = True
+                jump = jump[jump]
+                grown = np.count_nonzero(chosen) > count
+            chosen = longer[chosen[:-1]]
+            covered = np.zeros(len(tids) + 1, np.int64)
+            covered[starts[chosen] + 1] += 1
+            covered[starts[chosen] + lengths[chosen]] -= 1
+            kept = np.cumsum(covered)[starts] == 0
+            starts, nodes = starts[kept], nodes[kept]
+
+        hits = []
+        for values in (self.node_verbs[nodes], self.node_links[nodes]):
+            some = values != NO_ENTRY
+            cuts = np.searchsorted(starts[some], bounds).tolist()
+            values = values[some].tolist()
+            hits.append([values[cuts[i]:cuts[i + 1]] for i in range(len(pages))])
+        return list(zip(*hits))
+
+    def match(self, text):
+        return self.match_many([text])[0]
+
+    # The words that are verb entries on their own, in one lookup for the lot
+    def verbs_of(self, words):
+        # A word with a space or markup in it is not one token, so never a verb entry
+        words = [word for word in dict.fromkeys(words) if word and word == word.translate(space_table)]
+        if not words:
+            return set()
+        _, _, ids = self.intern(' '.join(words).encode('utf-8') + PADDING)
+        verbs = self.node_verbs[self.root_children[ids]] != NO_ENTRY
+        return set(compress(words, verbs.tolist()))
+
+    def is_verb(self, token):
+        return bool(self.verbs_of([token]))
+
+    def close(self):
+        del self.token_words
+        for name in MATCHER_SECTIONS:
+            delattr(self, name)
+        self.mm.close()
+
+# Format version of a matcher file, or None when it is not one; files of an older version are compiled again
+def matcher_version(matcher_path):
+    with open(matcher_path, 'rb') as f:
+        header = f.read(12)
+    if len(header) < 12 or header[:8] != MATCHER_MAGIC:
+        return None
+    return struct.unpack('<I', header[8:])[0]
+
+# Compile the verb and link vocabularies (JSON or .wvv, see vocabulary.py) into one matcher file
+def compile_matcher(verb_index_path, link_index_path, matcher_path, redirects_path=None):
+    verb_index = open_vocabulary(verb_index_path)
+    link_index = open_vocabulary(link_index_path)
+    redirects = RedirectTable(redirects_path) if redirects_path else None
+    write_matcher(matcher_path, verb_index, link_index, redirects)
+    verb_index.close()
+    link_index.close()
+    if redirects:
+        redirects.close()
+    return matcher_path
+
+# Open the matcher for a pair of vocabularies (and a redirect table, see redirects.py, folding links to their
+# canonical titles), compiling it next to the link vocabulary when it is missing or older than any of them
+def open_matcher(verb_index_path, link_index_path, matcher_path=None, redirects_path=None):
+    sources = [verb_index_path, link_index_path] + ([redirects_path] if redirects_path else [])
+    if matcher_path is None:
+        names = [os.path.basename(os.path.splitext(path)[0]) for path in sources[:1] + sources[2:]]
+        matcher_path = f"{os.path.splitext(link_index_path)[0]}_{'_'.join(names)}{MATCHER_SUFFIX}"
+    if (not os.path.exists(matcher_path) or matcher_version(matcher_path) != MATCHER_VERSION
+            or any(os.path.getmtime(matcher_path) < os.path.getmtime(path) for path in sources)):
+        compile_matcher(verb_index_path, link_index_path, matcher_path, redirects_path)
+    return CompiledMatcher(matcher_path)
@@ -1,151 +1,277 @@
 import json
 import re
 import multiprocessing as mp
-from lxml import etree
 from tqdm import tqdm
+import os
+import traceback
+from functools import partial
+from page_index import load_page_index, batch_ranges, iterparse_range
+from dump_source import iter_pages, page_from_elem
+from link_matcher import LinkMatcher, open_matcher
+from page_ring import PageRing
+from checkpoint import BatchCheckpoint, check_numbering, load_manifest
+from redirects import RedirectTable
 
-# Load JSON data
-def load_json(file_path):
-    with open(file_path, 'r') as file:
-        return json.load(file)
+link_pattern = re.compile(r"\[\[(.+?)\]\]")
+clean_pattern = re.compile(r'[^a-z0-9,.!?]+')
+sentence_pattern = re.compile(r'[.!?]')
 
-# Clean and split text by punctuation
+# Clean and split text by punctuation: lowercase and normalize the whole page once, then split into sentences
 def clean_and_split_text(text):
-    sentences = re.split(r'[.!?]', text)
-    clean_sentences = [re.sub(r'\s+', ' ', re.sub(r'[^a-z0-9.,?]', ' ', sentence.lower())).strip() for sentence in sentences]
-    return clean_sentences
+    return [sentence.strip() for sentence in sentence_pattern.split(clean_pattern.sub(' ', text.lower()))]
 
-# Process a batch of pages
-def process_batch(serialized_pages, verb_index, link_index):
-    verb_link_vectors = []
-    intersected_sentences = []
-
-    link_pattern = re.compile(r"\[\[(.+?)\]\]")
+# Normalize a link target the same way sentences are normalized, so it can be matched against sentence tokens
+def normalize_link(link):
+    return clean_pattern.sub(' ', link.lower()).replace('.', ' ').replace('!', ' ').replace('?', ' ').strip()
 
-    for serialized_page in serialized_pages:
-        page = etree.fromstring(serialized_page)
-        title = page.findtext('{http://www.mediawiki.org/xml/export-0.10/}title')
-        text = page.findtext('.//{http://www.mediawiki.org/xml/export-0.10/}text')
+# The links of one page to intersect with its sentences: each normalized target, mapped to the target as reported.
+# With a redirect table the link is reported by its canonical title, while matching still uses the text as written.
+def page_links(text, redirects=None):
+    links = {}
+    for link in link_pattern.findall(text):
+        link = link.split("|")[0]
+        lowered = link.lower()
+        if lowered.startswith('file:') or lowered.endswith('.png'):
+            continue
+        normalized = normalize_link(link)
+        if normalized and normalized not in links:
+            links[normalized] = redirects.resolve(link) if redirects else link
+    return links
 
-        if not text:
+# Every (link, verb) co-mention per (sentence, words) of one page, using a per-page token trie over its links
+def find_intersections(title, links, sentences, verb_words):
+    # Hashed lookup for every link of this page, multi-word links included; hits map back to the original link target
+    link_matcher = LinkMatcher({}, links)
+    intersections = []
+    for sentence, words in sentences:
+        verbs = [word for word in dict.fromkeys(words) if word in verb_words]
+        if not verbs:
             continue
+        _, found_links = link_matcher.match(sentence)
+        for link in dict.fromkeys(found_links):
+            for verb in verbs:
+                intersections.append([title, link, verb, sentence])
+    return intersections
 
-        # Create verb and link vectors
-        verb_vector = []
-        link_vector = []
-
-        words = text.split()
-        for word in words:
-            if word in verb_index:
-                verb_vector.append(verb_index[word])
-            if word in link_index:
-                link_vector.append(link_index[word])
-
-        if verb_vector or link_vector:
-            verb_link_vectors.append([title, verb_vector, link_vector])
-
-        # Extract links using the pattern
-        links = link_pattern.findall(text)
-        links = [link.split("|")[0] for link in links if not link.lower().startswith('file:') and not link.lower().endswith('.png')]
-
-        # Split text into sentences and find intersections
-        sentences = clean_and_split_text(text)
-        for sentence in sentences:
-            found_verb = None
-            found_link = None
-            for word in sentence.split():
-                if not found_verb and word in verb_index:
-                    found_verb = word
-                if not found_link and word in links:
-                    found_link = word
-                if found_verb and found_link:
-                    intersected_sentences.append([title, found_link, found_verb, sentence])
-                    break
+# Process a batch of (title, ns, text) records
+def process_pages(pages, matcher, redirects=None):
+    pages = [(title, text) for title, ns, text in pages if text]
+
+    # Create verb and link vectors for the whole batch in one longest-match pass, so multi-word titles match too
+    results = matcher.match_many([text for _, text in pages])
+    verb_link_vectors = [[title, verb_vector, link_vector]
+                         for (title, _), (verb_vector, link_vector) in zip(pages, results) if verb_vector or link_vector]
+
+    # Sentences where a verb and a link of a page co-occur; only pages with links have any, and the verbs among
+    # all of their words take one lookup against the matcher
+    linked = []
+    for title, text in pages:
+        links = page_links(text, redirects)
+        if links:
+            linked.append((title, links, [(sentence, sentence.split()) for sentence in clean_and_split_text(text)]))
+    verb_words = matcher.verbs_of(word for _, _, sentences in linked for _, words in sentences for word in words)
+    intersected_sentences = []
+    for title, links, sentences in linked:
+        intersected_sentences.extend(find_intersections(title, links, sentences, verb_words))
 
     return verb_link_vectors, intersected_sentences
 
-# Worker function
-def worker(task_queue, result_queue, verb_index, link_index):
+# Worker function. A failure is reported on error_queue before the worker exits, so the producer stops instead of
+# waiting for ring slots that no one will free.
+def worker(page_ring, result_queue, error_queue, matcher, redirects=None):
     while True:
         try:
-            serialized_pages = task_queue.get(timeout=1)
-            verb_link_vectors, intersected_sentences = process_batch(serialized_pages, verb_index, link_index)
-            result_queue.put((verb_link_vectors, intersected_sentences))
-        except mp.queues.Empty:
-            break
+            # Block until the producer fills a ring slot; None means the dump is exhausted
+            item = page_ring.get()
+            if item is None:
+                break
+            batch_id, part, last, pages = item
+            verb_link_vectors, intersected_sentences = process_pages(pages, matcher, redirects)
+            result_queue.put((batch_id, part, last, verb_link_vectors, intersected_sentences))
         except Exception as e:
             print(f"Error: {e}")
+            error_queue.put(traceback.format_exc())
             break
     print("Worker exiting...")
 
-# Writer function
-def writer(result_queue, verb_link_output_path, sentences_output_path):
-    with open(verb_link_output_path, 'a') as verb_link_file, open(sentences_output_path, 'a') as sentences_file:
-        while True:
-            try:
-                verb_link_vectors, intersected_sentences = result_queue.get(timeout=1)
-                if not verb_link_vectors and not intersected_sentences:
-                    break
+# Producer: raise once a ring worker has reported a failure or died without one (killed, out of memory)
+def check_workers(processes, error_queue):
+    try:
+        error = error_queue.get_nowait()
+    except mp.queues.Empty:
+        error = None
+    if error is not None:
+        raise RuntimeError(f"A worker failed, stopping the run:\n{error}")
+    died = [p.pid for p in processes if p.exitcode not in (None, 0)]
+    if died:
+        raise RuntimeError(f"Workers {died} died, stopping the run")
+
+# Shard worker function: parses its own batches' byte ranges of the dump instead of reading from a producer
+def shard_worker(dump_path, root_tag, batches, result_queue, matcher, redirects=None):
+    for batch_id, start, end in batches:
+        pages = []
+        context = iterparse_range(dump_path, root_tag, start, end)
+        for event, elem in context:
+            page = page_from_elem(elem)
+            pages.append((page.title, page.ns, page.text))
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        verb_link_vectors, intersected_sentences = process_pages(pages, matcher, redirects)
+        result_queue.put((batch_id, 0, True, verb_link_vectors, intersected_sentences))
+    print(f"Shard worker for {len(batches)} batches exiting...")
+
+# Outputs are checkpointed per batch when the page embeddings path is a directory of segments
+def is_checkpointed(verb_link_output_path):
+    return not verb_link_output_path.endswith('.jsonl')
+
+# Writer function: appends to JSONL, or collects each batch's parts and commits the batch exactly once
+def writer(result_queue, verb_link_output_path, sentences_output_path, compress_segments=False, numbering=None):
+    if is_checkpointed(verb_link_output_path):
+        checkpoint = BatchCheckpoint(verb_link_output_path, sentences_output_path, compress_segments, numbering)
+        pending = {}
+    else:
+        verb_link_file = open(verb_link_output_path, 'a')
+        sentences_file = open(sentences_output_path, 'a')
+    while True:
+        try:
+            result = result_queue.get(timeout=1)
+            if result is None:
+                break
+            batch_id, part, last, verb_link_vectors, intersected_sentences = result
+            if is_checkpointed(verb_link_output_path):
+                parts = pending.setdefault(batch_id, {'parts': {}, 'total': None})
+                parts['parts'][part] = (verb_link_vectors, intersected_sentences)
+                if last:
+                    parts['total'] = part + 1
+                if parts['total'] == len(parts['parts']):
+                    ordered = [parts['parts'][i] for i in range(parts['total'])]
+                    checkpoint.commit(batch_id, [v for vectors, _ in ordered for v in vectors], [s for _, sentences in ordered for s in sentences])
+                    del pending[batch_id]
+            else:
                 for vectors in verb_link_vectors:
                     verb_link_file.write(json.dumps(vectors) + '\n')
                 for sentence in intersected_sentences:
                     sentences_file.write(json.dumps(sentence) + '\n')
-            except mp.queues.Empty:
-                continue
-            except Exception as e:
-                print(f"Error in writer: {e}")
+        except mp.queues.Empty:
+            continue
+        except Exception as e:
+            print(f"Error in writer: {e}")
+    if is_checkpointed(verb_link_output_path):
+        if pending:
+            print(f"Writer exiting with {len(pending)} incomplete batches, they will be redone on the next run")
+        checkpoint.close()
+    else:
+        verb_link_file.close()
+        sentences_file.close()
     print("Writer exiting...")
 
 # Main function
-def main(dump_path, verb_index_path, link_index_path, verb_link_output_path, sentences_output_path, num_workers=6, batch_size=1000, resume=0):
-    # Load verb and link indices
-    verb_index = load_json(verb_index_path)
-    link_index = load_json(link_index_path)
+def main(dump_path, verb_index_path, link_index_path, verb_link_output_path, sentences_output_path, num_workers=6, batch_size=10000, resume=0, page_index_path=None, multistream_index_path=None, num_readers=None, ring_slots=None, ring_slot_size=8 << 20, compress_segments=False, redirects_path=None):
+    # Verb and link indices compiled into one memory-mapped matcher (see link_matcher.py) on first use; workers
+    # share its pages rather than each holding a trie, and test verbs against it too. With a redirect table the
+    # matcher reports every link title by the emb_idx of its canonical title.
+    matcher = open_matcher(verb_index_path, link_index_path, redirects_path=redirects_path)
+
+    # Redirect table (see redirects.py) folding intersected links to canonical titles; workers share its mapping
+    redirects = RedirectTable(redirects_path) if redirects_path else None
 
-    # Setup multiprocessing queues
-    task_queue = mp.Queue()
+    # Batches already in the manifest are skipped, so a restart picks up exactly the unfinished work.
+    # Batch ids are page_number // batch_size, and the manifest refuses a restart with another batch_size.
+    # Each batch is one segment, so batch_size also sets the segment count: 10000 pages keeps a full dump to ~2000.
+    numbering = f'pages:{batch_size}'
+    done = set()
+    if is_checkpointed(verb_link_output_path) and os.path.isdir(verb_link_output_path):
+        check_numbering(verb_link_output_path, numbering)
+        done = load_manifest(verb_link_output_path)
+        print(f"{len(done)} batches already committed in {verb_link_output_path}")
+
+    # With a page index (see page_index.py) every worker parses its own byte ranges and skipping is a seek
+    if page_index_path:
+        main_sharded(dump_path, page_index_path, matcher, verb_link_output_path, sentences_output_path, num_workers, batch_size, resume, compress_segments, done, redirects, numbering)
+        return
+
+    # Pages go to the workers through a shared-memory ring of length-prefixed records; results come back on a queue
+    page_ring = PageRing(ring_slots or 2 * num_workers, ring_slot_size)
     result_queue = mp.Queue()
+    error_queue = mp.Queue()
 
     # Start worker processes
     processes = []
     for _ in range(num_workers):
-        p = mp.Process(target=worker, args=(task_queue, result_queue, verb_index, link_index))
+        p = mp.Process(target=worker, args=(page_ring, result_queue, error_queue, matcher, redirects))
         p.start()
         processes.append(p)
+    check = partial(check_workers, processes, error_queue)
 
     # Start writer process
-    writer_process = mp.Process(target=writer, args=(result_queue, verb_link_output_path, sentences_output_path))
+    writer_process = mp.Process(target=writer, args=(result_queue, verb_link_output_path, sentences_output_path, compress_segments, numbering))
     writer_process.start()
 
-    # Parse the XML and split into batches dynamically
-    context = etree.iterparse(dump_path, events=('end',), tag='{http://www.mediawiki.org/xml/export-0.10/}page')
-    pages = []
-    page_counter = 0
-    for event, elem in tqdm(context, desc="Reading pages"):
-        page_counter += 1
-        if page_counter <= resume:
-            elem.clear()
-            while elem.getprevious() is not None:
-                del elem.getparent()[0]
+    # Read pages (plain XML, or a bz2 multistream dump decompressed by num_readers processes) and batch them.
+    # If a worker fails, the others are stopped and the writer still commits the batches that completed.
+    try:
+        pages = []
+        current_batch = None
+        page_counter = 0
+        for page in tqdm(iter_pages(dump_path, multistream_index_path, num_readers), desc="Reading pages"):
+            page_counter += 1
+            if page_counter <= resume:
+                continue
+            batch_id = (page_counter - 1) // batch_size
+            if batch_id in done:
+                continue
+
+            if batch_id != current_batch and pages:
+                page_ring.put(pages, current_batch, check)
+                pages = []
+            current_batch = batch_id
+            pages.append((page.title, page.ns, page.text))
+        if pages:
+            page_ring.put(pages, current_batch, check)
+        page_ring.close(num_workers, check)
+
+        # Ensure all worker processes have finished, and none of them on a failure
+        for p in processes:
+            p.join()
+        check()
+    except BaseException:
+        for p in processes:
+            p.terminate()
+            p.join()
+        raise
+    finally:
+        page_ring.unlink()
+        # Signal the writer process to stop
+        result_queue.put(None)  # Signal the writer to exit
+        writer_process.join()
+
+    print(f"Results saved to {verb_link_output_path} and {sentences_output_path}")
+
+# Sharded main: split the not yet committed batches into contiguous runs of byte ranges, one per worker
+def main_sharded(dump_path, page_index_path, matcher, verb_link_output_path, sentences_output_path, num_workers, batch_size, resume, compress_segments, done, redirects=None, numbering=None):
+    meta, offsets, _ = load_page_index(page_index_path)
+    todo = [batch for batch in batch_ranges(meta, offsets, batch_size, resume) if batch[0] not in done]
+    shards = [todo[i * len(todo) // num_workers:(i + 1) * len(todo) // num_workers] for i in range(num_workers)]
+    print(f"{len(todo)} batches of {batch_size} pages left over {len(offsets)} pages")
+
+    result_queue = mp.Queue()
+
+    processes = []
+    for batches in shards:
+        if not batches:
             continue
+        p = mp.Process(target=shard_worker, args=(dump_path, meta['root'], batches, result_queue, matcher, redirects))
+        p.start()
+        processes.append(p)
+
+    writer_process = mp.Process(target=writer, args=(result_queue, verb_link_output_path, sentences_output_path, compress_segments, numbering))
+    writer_process.start()
 
-        serialized_page = etree.tostring(elem, encoding='utf-8')
-        pages.append(serialized_page)
-        if len(pages) >= batch_size:
-            task_queue.put(pages)
-            pages = []
-        elem.clear()
-        while elem.getprevious() is not None:
-            del elem.getparent()[0]
-    if pages:
-        task_queue.put(pages)
-
-    # Ensure all worker processes have finished
     for p in processes:
         p.join()
 
-    # Signal the writer process to stop
-    result_queue.put(([], []))  # Signal the writer to exit
+    result_queue.put(None)  # Signal the writer to exit
     writer_process.join()
 
     print(f"Results saved to {verb_link_output_path} and {sentences_output_path}")
@@ -156,7 +282,10 @@ if __name__ == "__main__":
     dump_path = 'enwiki-20240501-pages-articles15.xml-p17324603p17460152'
     verb_index_path = 'data/verb_embeddings.json'  
     link_index_path = 'data/link_embeddings.json'  
-    verb_link_output_path = 'page_embeddings.jsonl'  
-    sentences_output_path = 'intersected_sentences.jsonl'  
+    verb_link_output_path = 'page_embeddings'  # Directory of binary segments (see page_segments.py); use a .jsonl path for JSONL
+    sentences_output_path = 'intersected_sentences'  # Directory of per-batch JSONL files alongside segments; a .jsonl file with a .jsonl embeddings path
+    page_index_path = None  # e.g. 'enwiki-latest-pages-articles.index.jsonl' built with page_index.py
+    multistream_index_path = None  # e.g. 'enwiki-latest-pages-articles-multistream-index.txt.bz2' when dump_path is the .bz2
+    redirects_path = None  # e.g. 'data/redirects.wvr' built with redirects.py
     
-    main(dump_path, verb_index_path, link_index_path, verb_link_output_path, sentences_output_path, num_workers=5, batch_size=100)
+    main(dump_path, verb_index_path, link_index_path, verb_link_output_path, sentences_output_path, num_workers=5, batch_size=10000, page_index_path=page_index_path, multistream_index_path=multistream_index_path, redirects_path=redirects_path)
@@ -5,6 +5,7 @@ from lxml import etree
 from tqdm import tqdm
 import queue
 import time
+from page_index import load_page_index, resume_offset, iterparse_range
 
 # Load JSON data
 def load_json(file_path):
@@ -105,7 +106,7 @@ def writer(result_queue, verb_link_output_path, sentences_output_path):
     print("Writer exiting...")
 
 # Main function
-def main(dump_path, verb_index_path, link_index_path, verb_link_output_path, sentences_output_path, num_workers=6, batch_size=1000, resume=0, queue_max_size=100):
+def main(dump_path, verb_index_path, link_index_path, verb_link_output_path, sentences_output_path, num_workers=6, batch_size=1000, resume=0, queue_max_size=100, page_index_path=None):
     # Load verb and link indices
     verb_index = load_json(verb_index_path)
     link_index = load_json(link_index_path)
@@ -114,17 +115,16 @@ def main(dump_path, verb_index_path, link_index_path, verb_link_output_path, sen
     task_queue = mp.Queue(maxsize=queue_max_size)
     result_queue = mp.Queue(maxsize=queue_max_size)
 
-    # Parse the XML and skip to the resume point
-    context = etree.iterparse(dump_path, events=('end',), tag='{http://www.mediawiki.org/xml/export-0.10/}page')
-    page_counter = 0
-    for event, elem in tqdm(context, desc="Skipping pages", total=resume):
-        page_counter += 1
-        if page_counter > resume:
-            break
-        elem.clear()
-        while elem.getprevious() is not None:
-            del elem.getparent()[0]
-    del context
+    # Skip to the resume point: seek straight to it with a page index, otherwise parse and discard
+    if page_index_path:
+        meta, offsets, _ = load_page_index(page_index_path)
+        start = resume_offset(meta, offsets, resume)
+        print(f"Seeking to byte {start} for page {resume}")
+        context = iterparse_range(dump_path, meta['root'], start, meta['end'])
+        skip = 0
+    else:
+        context = etree.iterparse(dump_path, events=('end',), tag='{http://www.mediawiki.org/xml/export-0.10/}page')
+        skip = resume
 
     # Start worker processes
     worker_processes = []
@@ -138,11 +138,16 @@ def main(dump_path, verb_index_path, link_index_path, verb_link_output_path, sen
     writer_process.start()
 
     # Parse the XML and split into batches dynamically
-    context = etree.iterparse(dump_path, events=('end',), tag='{http://www.mediawiki.org/xml/export-0.10/}page')
     pages = []
     page_counter = 0
     for event, elem in tqdm(context, desc="Reading pages"):
         page_counter += 1
+        if page_counter <= skip:
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+            continue
+
         serialized_page = etree.tostring(elem, encoding='utf-8')
         pages.append(serialized_page)
         if len(pages) >= batch_size:
@@ -171,5 +176,6 @@ if __name__ == "__main__":
     link_index_path = 'wiki_knowledge/embeddings/link_embeddings.json'  # Replace with your processed links JSON file path
     verb_link_output_path = 'page_embeddings.jsonl'  # Replace with your output JSONL file path
     sentences_output_path = 'intersected_sentences.jsonl'  # Replace with your output JSONL file path
+    page_index_path = 'enwiki-latest-pages-articles.index.jsonl'  # Built once with page_index.py, set to None to skip by parsing
     
-    main(dump_path, verb_index_path, link_index_path, verb_link_output_path, sentences_output_path, num_workers=10, batch_size=1000, resume=8308044)
+    main(dump_path, verb_index_path, link_index_path, verb_link_output_path, sentences_output_path, num_workers=10, batch_size=1000, resume=8308044, page_index_path=page_index_path)
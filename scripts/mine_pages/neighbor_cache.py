@@ -0,0 +1,96 @@
+import sqlite3
+from collections import OrderedDict
+from link_codec import decode_links_many
+
+# Decoded link lists of records rows by emb_idx, in least-recently-used order, for the per-key SQL path of
+# build_l1_db_*.py. A popular page is linked from millions of keys, and without the cache its row is fetched and
+# decoded again for each of them. Link lists are held as the np.uint32 arrays link_codec.py decodes to, 4 bytes a
+# link, and callers convert only what they use. The bound is on array bytes held rather than entries, since one
+# hub row outweighs thousands of small ones. An emb_idx without a record is cached too, as an empty entry.
+ENTRY_OVERHEAD = 64  # bytes charged per entry on top of its arrays, so that empty entries are not free
+SQLITE_MAX_VARIABLE_NUMBER = 999  # the default of SQLite builds before 3.32; used when the limit cannot be read
+
+# Bound parameters allowed per statement on this connection
+def variable_limit(cursor):
+    try:
+        return cursor.connection.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+    except AttributeError:  # Python < 3.11
+        return SQLITE_MAX_VARIABLE_NUMBER
+
+class NeighborCache:
+    def __init__(self, cursor, max_bytes=80 << 20, chunk_size=None):
+        self.cursor = cursor
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size or variable_limit(cursor)
+        self.entries = OrderedDict()  # emb_idx -> ([(key, links)] in id order, cost)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.queries = 0
+
+    # What an entry counts against max_bytes: the bytes of its link arrays plus a fixed overhead
+    @staticmethod
+    def cost(rows):
+        return ENTRY_OVERHEAD + sum(links.nbytes for _, links in rows)
+
+    def put(self, emb_idx, rows):
+        cost = self.cost(rows)
+        if cost > self.max_bytes:
+            return
+        self.entries[emb_idx] = (rows, cost)
+        self.size += cost
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= evicted
+            self.evictions += 1
+
+    # Misses go to SQLite in IN queries of at most chunk_size parameters
+    def fetch(self, emb_idcs):
+        fetched = {}
+        for i in range(0, len(emb_idcs), self.chunk_size):
+            chunk = emb_idcs[i:i + self.chunk_size]
+            placeholders = ','.join(['?'] * len(chunk))
+            self.cursor.execute(f'SELECT key, emb_idx, value FROM records WHERE emb_idx IN ({placeholders})', chunk)
+            rows = self.cursor.fetchall()
+            self.queries += 1
+            ids, offsets = decode_links_many([row[2] for row in rows])
+            offsets = offsets.tolist()
+            chunk_rows = {emb_idx: [] for emb_idx in chunk}
+            for j, row in enumerate(rows):
+                # A copy, so a cached row does not keep the whole chunk's decoded array alive
+                chunk_rows[row[1]].append((row[0], ids[offsets[j]:offsets[j + 1]].copy()))
+            for emb_idx, entry in chunk_rows.items():
+                self.put(emb_idx, entry)
+            fetched.update(chunk_rows)
+        return fetched
+
+    def get_values(self, emb_idcs):
+        """The records rows with any of the emb_idcs, as get_values_from_db returns them: [[key, {emb_idx: links}]]
+        in ascending emb_idx order, each links an np.uint32 array shared with the cache and not to be modified."""
+        wanted = sorted(set(emb_idcs))
+        found = {}
+        missing = []
+        for emb_idx in wanted:
+            entry = self.entries.get(emb_idx)
+            if entry is None:
+                missing.append(emb_idx)
+            else:
+                self.entries.move_to_end(emb_idx)
+                found[emb_idx] = entry[0]
+        self.hits += len(wanted) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            found.update(self.fetch(missing))
+        return [[key, {emb_idx: links}] for emb_idx in wanted for key, links in found[emb_idx]]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions, 'entries': len(self.entries), 'bytes': self.size, 'queries': self.queries}
+
+    def report(self):
+        stats = self.stats()
+        return (f"Neighbor cache: {stats['hit_rate']:.1%} hits ({stats['hits']} of {stats['hits'] + stats['misses']}), "
+                f"{stats['evictions']} evictions, {stats['entries']} entries holding {stats['bytes']} of "
+                f"{self.max_bytes} bytes, {stats['queries']} queries")
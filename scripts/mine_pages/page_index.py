@@ -0,0 +1,146 @@
+import html
+import json
+import re
+from array import array
+from itertools import zip_longest
+from lxml import etree
+from tqdm import tqdm
+
+PAGE_TAG = '{http://www.mediawiki.org/xml/export-0.10/}page'
+
+title_pattern = re.compile(rb'<title>(.*?)</title>')
+ns_pattern = re.compile(rb'<ns>(-?\d+)</ns>')
+id_pattern = re.compile(rb'<id>(\d+)</id>')
+
+# Read the opening <mediawiki ...> tag so a byte range can be parsed on its own
+def read_root_tag(dump_path):
+    with open(dump_path, 'rb') as f:
+        head = f.read(1 << 16)
+    start = head.index(b'<mediawiki')
+    end = head.index(b'>', start)
+    return head[start:end + 1].decode('utf-8')
+
+# Find the offset of the closing </mediawiki> tag, which is where the last page range ends
+def find_root_end(dump_path):
+    with open(dump_path, 'rb') as f:
+        f.seek(0, 2)
+        size = f.tell()
+        f.seek(max(0, size - 4096))
+        tail_start = f.tell()
+        tail = f.read()
+    idx = tail.rfind(b'</mediawiki>')
+    return tail_start + idx if idx != -1 else size
+
+# [offset, page_id, ns, title] of every <page> of the raw dump, from a single pass over its lines
+def scan_pages(dump_path):
+    with open(dump_path, 'rb') as dump:
+        offset = 0
+        current = None
+        for line in dump:
+            stripped = line.strip()
+            if stripped == b'<page>':
+                current = [offset, None, None, None]
+            elif current is not None:
+                if current[3] is None and stripped.startswith(b'<title>'):
+                    current[3] = html.unescape(title_pattern.match(stripped).group(1).decode('utf-8'))
+                elif current[2] is None and stripped.startswith(b'<ns>'):
+                    current[2] = int(ns_pattern.match(stripped).group(1))
+                elif current[1] is None and stripped.startswith(b'<id>'):
+                    # The first <id> after <page> is the page id, later ones belong to revisions
+                    current[1] = int(id_pattern.match(stripped).group(1))
+                    yield current
+                    current = None
+            offset += len(line)
+
+# First line of an index: the dump, its root tag and the offset of </mediawiki>, where the last page range ends
+def page_index_meta(dump_path):
+    return {'dump_path': dump_path, 'root': read_root_tag(dump_path), 'end': find_root_end(dump_path)}
+
+# Record [offset, page_id, ns, title] for every <page>
+def build_page_index(dump_path, index_path):
+    page_counter = 0
+    with open(index_path, 'w') as out:
+        out.write(json.dumps(page_index_meta(dump_path)) + '\n')
+        for row in tqdm(scan_pages(dump_path), desc="Indexing pages"):
+            out.write(json.dumps(row, ensure_ascii=False) + '\n')
+            page_counter += 1
+    print(f"Indexed {page_counter} pages into {index_path}")
+    return page_counter
+
+# Index the dump an index was written for (FilterExtractor writes its own) again, and raise ValueError unless
+# that gives back the same metadata and rows
+def verify_page_index(index_path):
+    with open(index_path, 'r', encoding='utf-8') as f:
+        meta = json.loads(f.readline())
+        if meta != page_index_meta(meta['dump_path']):
+            raise ValueError(f"{index_path} does not match the root tag or end of {meta['dump_path']}")
+        for number, (line, row) in enumerate(zip_longest(f, scan_pages(meta['dump_path']))):
+            if line is None or row is None or json.loads(line) != row:
+                raise ValueError(f"{index_path} does not match page {number} of {meta['dump_path']}")
+
+# Load the index metadata and page offsets, optionally with titles
+def load_page_index(index_path, with_titles=False):
+    offsets = array('Q')
+    titles = [] if with_titles else None
+    with open(index_path, 'r') as f:
+        meta = json.loads(f.readline())
+        for line in tqdm(f, desc="Loading page index"):
+            row = json.loads(line)
+            offsets.append(row[0])
+            if with_titles:
+                titles.append(row[3])
+    return meta, offsets, titles
+
+# Byte offset to seek to in order to skip the first `resume` pages
+def resume_offset(meta, offsets, resume):
+    if resume >= len(offsets):
+        return meta['end']
+    return offsets[resume]
+
+# Byte ranges of fixed-size page batches, numbered from the start of the dump so batch ids are stable across runs
+def batch_ranges(meta, offsets, batch_size, resume=0):
+    ranges = []
+    for batch_id, first in enumerate(range(0, len(offsets), batch_size)):
+        last = first + batch_size
+        if last <= resume:
+            continue
+        start = offsets[max(first, resume)]
+        end = offsets[last] if last < len(offsets) else meta['end']
+        ranges.append((batch_id, start, end))
+    return ranges
+
+# File-like view of [start, end) of the dump wrapped in the root tag so lxml can parse it
+class DumpRange:
+    def __init__(self, dump_path, root_tag, start, end):
+        self.file = open(dump_path, 'rb')
+        self.file.seek(start)
+        self.remaining = end - start
+        self.prefix = root_tag.encode('utf-8')
+        self.suffix = b'</mediawiki>'
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = 1 << 20
+        chunk = b''
+        if self.prefix:
+            chunk, self.prefix = self.prefix[:size], self.prefix[size:]
+        elif self.remaining > 0:
+            chunk = self.file.read(min(size, self.remaining))
+            self.remaining -= len(chunk)
+            if not chunk:
+                self.remaining = 0
+        elif self.suffix:
+            chunk, self.suffix = self.suffix[:size], self.suffix[size:]
+        else:
+            self.file.close()
+        return chunk
+
+# Drop-in replacement for etree.iterparse over the pages in a single byte range
+def iterparse_range(dump_path, root_tag, start, end):
+    return etree.iterparse(DumpRange(dump_path, root_tag, start, end), events=('end',), tag=PAGE_TAG)
+
+if __name__ == "__main__":
+    dump_path = 'enwiki-latest-pages-articles.xml'  # Replace with your input XML file path
+    index_path = 'enwiki-latest-pages-articles.index.jsonl'  # Replace with your output index path
+
+    build_page_index(dump_path, index_path)
@@ -0,0 +1,108 @@
+import multiprocessing as mp
+import struct
+from multiprocessing import shared_memory
+
+# Slot header: record count (END_OF_PAGES marks the end of the dump), bytes used, batch id, part number
+# within the batch and whether this is the batch's last part
+SLOT_HEADER = struct.Struct('<IIqI?')
+# Record header: title length, namespace, text length; followed by the UTF-8 title and text
+RECORD_HEADER = struct.Struct('<IiI')
+END_OF_PAGES = 0xFFFFFFFF
+
+# Ring of fixed-size shared-memory slots, each holding a batch of length-prefixed (title, ns, text) records.
+# One producer fills slots in order; any number of workers claim full slots and hand them back when done.
+# While the producer waits for a slot it calls check, when given, every poll_interval seconds; check raises
+# once the workers can no longer free the slot (one failed or died), so the producer does not wait forever.
+class PageRing:
+    def __init__(self, num_slots=16, slot_size=8 << 20, poll_interval=1.0):
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+        self.poll_interval = poll_interval
+        self.shm = shared_memory.SharedMemory(create=True, size=num_slots * slot_size)
+        self.free = [mp.Semaphore(1) for _ in range(num_slots)]
+        self.full = [mp.Semaphore(0) for _ in range(num_slots)]
+        self.next_read = mp.Value('q', 0)
+        self.next_write = 0
+
+    # Producer: write a batch of (title, ns, text) into the next slot(s), waiting for workers to free them.
+    # A batch that outgrows a slot continues in the next one as a further part of the same batch id.
+    def put(self, pages, batch_id=0, check=None):
+        buf = self.shm.buf
+        part = 0
+        slot, base, pos, count = self.claim_write_slot(check)
+        for title, ns, text in pages:
+            title_bytes = (title or '').encode('utf-8')
+            text_bytes = (text or '').encode('utf-8')
+            size = RECORD_HEADER.size + len(title_bytes) + len(text_bytes)
+            if size > self.slot_size - SLOT_HEADER.size:
+                raise ValueError(f"Page {title!r} is {size} bytes and does not fit in a {self.slot_size} byte slot")
+            if pos + size > base + self.slot_size:
+                self.commit_write_slot(slot, base, pos, count, batch_id, part, False)
+                part += 1
+                slot, base, pos, count = self.claim_write_slot(check)
+            RECORD_HEADER.pack_into(buf, pos, len(title_bytes), ns, len(text_bytes))
+            pos += RECORD_HEADER.size
+            buf[pos:pos + len(title_bytes)] = title_bytes
+            pos += len(title_bytes)
+            buf[pos:pos + len(text_bytes)] = text_bytes
+            pos += len(text_bytes)
+            count += 1
+        self.commit_write_slot(slot, base, pos, count, batch_id, part, True)
+
+    def acquire_free(self, slot, check):
+        while not self.free[slot].acquire(timeout=self.poll_interval):
+            if check:
+                check()
+
+    def claim_write_slot(self, check=None):
+        slot = self.next_write % self.num_slots
+        self.next_write += 1
+        self.acquire_free(slot, check)
+        base = slot * self.slot_size
+        return slot, base, base + SLOT_HEADER.size, 0
+
+    def commit_write_slot(self, slot, base, pos, count, batch_id, part, last):
+        SLOT_HEADER.pack_into(self.shm.buf, base, count, pos - base, batch_id, part, last)
+        self.full[slot].release()
+
+    # Producer: one end marker per worker
+    def close(self, num_workers, check=None):
+        for _ in range(num_workers):
+            slot = self.next_write % self.num_slots
+            self.next_write += 1
+            self.acquire_free(slot, check)
+            SLOT_HEADER.pack_into(self.shm.buf, slot * self.slot_size, END_OF_PAGES, SLOT_HEADER.size, -1, 0, True)
+            self.full[slot].release()
+
+    # Worker: claim the next full slot and decode it straight from shared memory.
+    # Returns (batch_id, part, last, pages), or None at the end of the dump.
+    def get(self):
+        with self.next_read.get_lock():
+            slot = self.next_read.value % self.num_slots
+            self.next_read.value += 1
+        self.full[slot].acquire()
+        base = slot * self.slot_size
+        view = self.shm.buf[base:base + self.slot_size]
+        try:
+            count, used, batch_id, part, last = SLOT_HEADER.unpack_from(view, 0)
+            if count == END_OF_PAGES:
+                return None
+            pages = []
+            pos = SLOT_HEADER.size
+            for _ in range(count):
+                title_len, ns, text_len = RECORD_HEADER.unpack_from(view, pos)
+                pos += RECORD_HEADER.size
+                title = str(view[pos:pos + title_len], 'utf-8')
+                pos += title_len
+                text = str(view[pos:pos + text_len], 'utf-8')
+                pos += text_len
+                pages.append((title, ns, text))
+            return batch_id, part, last, pages
+        finally:
+            view.release()
+            self.free[slot].release()
+
+    # Producer: release the shared memory once every worker has exited
+    def unlink(self):
+        self.shm.close()
+        self.shm.unlink()
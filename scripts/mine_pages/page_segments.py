@@ -0,0 +1,238 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import OrderedDict
+
+# Segment layout (all integers native little-endian):
+#   header: magic, version, flags, page count, then (offset, length) of the six sections below
+#   title_offsets  uint32[n+1]  byte offsets into title_bytes
+#   title_bytes    UTF-8 titles back to back
+#   verb_offsets   uint32[n+1]  index into verb_ids (or byte offset into the varint blob when compressed)
+#   verb_ids       uint32[]     (or zigzag delta varints when compressed)
+#   link_offsets   uint32[n+1]
+#   link_ids       uint32[]
+MAGIC = b'WVSEG\x00\x00\x01'
+VERSION = 1
+FLAG_VARINT = 1
+SECTIONS = ['title_offsets', 'title_bytes', 'verb_offsets', 'verb_ids', 'link_offsets', 'link_ids']
+HEADER = struct.Struct('<8sIII' + 'QQ' * len(SECTIONS))
+SEGMENT_SUFFIX = '.wvs'
+
+if sys.byteorder != 'little':
+    raise RuntimeError("page_segments assumes a little-endian host")
+
+# Zigzag delta varint encoding of an unsorted id list (order and duplicates are preserved)
+def encode_varints(ids, out):
+    prev = 0
+    for value in ids:
+        delta = value - prev
+        prev = value
+        zigzag = (delta << 1) ^ (delta >> 63)
+        while zigzag >= 0x80:
+            out.append((zigzag & 0x7F) | 0x80)
+            zigzag >>= 7
+        out.append(zigzag)
+
+def decode_varints(data):
+    ids = []
+    prev = 0
+    shift = 0
+    zigzag = 0
+    for byte in data:
+        zigzag |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        prev += (zigzag >> 1) ^ -(zigzag & 1)
+        ids.append(prev)
+        zigzag = 0
+        shift = 0
+    return ids
+
+# Write one segment file holding a batch of [title, verb_vector, link_vector] pages
+def write_segment(path, pages, compress=False):
+    title_offsets = array('I', [0])
+    title_bytes = bytearray()
+    verb_offsets = array('I', [0])
+    link_offsets = array('I', [0])
+    if compress:
+        verb_ids = bytearray()
+        link_ids = bytearray()
+    else:
+        verb_ids = array('I')
+        link_ids = array('I')
+
+    for title, verb_vector, link_vector in pages:
+        title_bytes += title.encode('utf-8')
+        title_offsets.append(len(title_bytes))
+        if compress:
+            encode_varints(verb_vector, verb_ids)
+            encode_varints(link_vector, link_ids)
+        else:
+            verb_ids.extend(verb_vector)
+            link_ids.extend(link_vector)
+        verb_offsets.append(len(verb_ids))
+        link_offsets.append(len(link_ids))
+
+    sections = [title_offsets.tobytes(), bytes(title_bytes), verb_offsets.tobytes(),
+                bytes(verb_ids) if compress else verb_ids.tobytes(), link_offsets.tobytes(),
+                bytes(link_ids) if compress else link_ids.tobytes()]
+    positions = []
+    offset = HEADER.size
+    for section in sections:
+        # Keep every section 8-byte aligned so it can be cast in place
+        offset += -offset % 8
+        positions.extend([offset, len(section)])
+        offset += len(section)
+
+    # Write under a temporary name and rename, so a segment is either complete or absent
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, FLAG_VARINT if compress else 0, len(pages), *positions))
+        for section, start in zip(sections, positions[::2]):
+            f.write(b'\x00' * (start - f.tell()))
+            f.write(section)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+# Memory-mapped view of one segment: len(), O(1) page lookup and iteration, nothing decoded up front
+class SegmentReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self.mm, 0)
+        magic, version, flags, self.num_pages = header[:4]
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a page embeddings segment")
+        self.compressed = bool(flags & FLAG_VARINT)
+        view = memoryview(self.mm)
+        self.sections = {}
+        for name, start, length in zip(SECTIONS, header[4::2], header[5::2]):
+            self.sections[name] = view[start:start + length]
+        self.title_offsets = self.sections['title_offsets'].cast('I')
+        self.verb_offsets = self.sections['verb_offsets'].cast('I')
+        self.link_offsets = self.sections['link_offsets'].cast('I')
+        if self.compressed:
+            self.verb_ids = self.sections['verb_ids']
+            self.link_ids = self.sections['link_ids']
+        else:
+            self.verb_ids = self.sections['verb_ids'].cast('I')
+            self.link_ids = self.sections['link_ids'].cast('I')
+
+    def __len__(self):
+        return self.num_pages
+
+    def title(self, i):
+        return str(self.sections['title_bytes'][self.title_offsets[i]:self.title_offsets[i + 1]], 'utf-8')
+
+    def verbs(self, i):
+        ids = self.verb_ids[self.verb_offsets[i]:self.verb_offsets[i + 1]]
+        return decode_varints(ids) if self.compressed else ids.tolist()
+
+    def links(self, i):
+        ids = self.link_ids[self.link_offsets[i]:self.link_offsets[i + 1]]
+        return decode_varints(ids) if self.compressed else ids.tolist()
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.num_pages
+        if not 0 <= i < self.num_pages:
+            raise IndexError(i)
+        return [self.title(i), self.verbs(i), self.links(i)]
+
+    def __iter__(self):
+        for i in range(self.num_pages):
+            yield self[i]
+
+    def close(self):
+        for section in self.sections.values():
+            section.release()
+        for view in (self.title_offsets, self.verb_offsets, self.link_offsets, self.verb_ids, self.link_ids):
+            view.release()
+        self.sections = {}
+        self.mm.close()
+
+def list_segments(output_dir):
+    return sorted(os.path.join(output_dir, name) for name in os.listdir(output_dir) if name.endswith(SEGMENT_SUFFIX))
+
+# Page count from a segment's header alone, without mapping the file
+def segment_pages(path):
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError(f"{path} is not a page embeddings segment")
+    magic, version, _, num_pages = HEADER.unpack(header)[:4]
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a page embeddings segment")
+    return num_pages
+
+# All segments of a directory behind one page numbering. A whole dump is hundreds of thousands of segments, more
+# mappings than vm.max_map_count allows, so segments are mapped on demand: iteration maps one at a time, and
+# random access keeps the max_open most recently used segments mapped.
+class PageEmbeddingReader:
+    def __init__(self, output_dir, max_open=64):
+        self.paths = list_segments(output_dir)
+        self.max_open = max_open
+        self.open_segments = OrderedDict()  # segment number -> SegmentReader, least recently used first
+        self.starts = [0]
+        for path in self.paths:
+            self.starts.append(self.starts[-1] + segment_pages(path))
+
+    def __len__(self):
+        return self.starts[-1]
+
+    def segment(self, s):
+        segment = self.open_segments.get(s)
+        if segment is not None:
+            self.open_segments.move_to_end(s)
+            return segment
+        segment = self.open_segments[s] = SegmentReader(self.paths[s])
+        while len(self.open_segments) > self.max_open:
+            _, evicted = self.open_segments.popitem(last=False)
+            evicted.close()
+        return segment
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        s = bisect.bisect_right(self.starts, i) - 1
+        return self.segment(s)[i - self.starts[s]]
+
+    # Each segment in order, mapped only while the caller holds it
+    def iter_segments(self):
+        for path in self.paths:
+            segment = SegmentReader(path)
+            try:
+                yield segment
+            finally:
+                segment.close()
+
+    def __iter__(self):
+        for segment in self.iter_segments():
+            yield from segment
+
+    def close(self):
+        for segment in self.open_segments.values():
+            segment.close()
+        self.open_segments.clear()
+
+# Iterate [title, verb_vector, link_vector] from either page_embeddings.jsonl or a segment directory
+def iter_page_embeddings(path):
+    if path.endswith('.jsonl'):
+        with open(path, 'r') as f:
+            for line in f:
+                yield json.loads(line)
+    else:
+        reader = PageEmbeddingReader(path)
+        try:
+            yield from reader
+        finally:
+            reader.close()
@@ -0,0 +1,97 @@
+import heapq
+import os
+import tempfile
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+# Exact phrase counting in bounded memory: counts are kept in a Counter until it holds max_entries phrases,
+# then spilled to disk as a run of "phrase\tcount" lines sorted by phrase. Runs from any number of workers
+# are combined by a streaming k-way merge, so only the counter, the merge heap and the top-N heap are in memory.
+RUN_SUFFIX = '.run'
+
+def write_run(run_dir, counts):
+    fd, path = tempfile.mkstemp(suffix=RUN_SUFFIX, dir=run_dir)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for phrase in sorted(counts):
+            f.write(f"{phrase}\t{counts[phrase]}\n")
+    return path
+
+def read_run(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            phrase, count = line.rstrip('\n').rsplit('\t', 1)
+            yield phrase, int(count)
+
+# Total count of every phrase across runs, in phrase order
+def merge_runs(paths):
+    merged = heapq.merge(*(read_run(path) for path in paths))
+    for phrase, group in groupby(merged, key=itemgetter(0)):
+        yield phrase, sum(count for _, count in group)
+
+# Merge many runs into one, so the number of open files in the final merge stays bounded
+def compact_runs(run_dir, paths):
+    fd, path = tempfile.mkstemp(suffix=RUN_SUFFIX, dir=run_dir)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for phrase, count in merge_runs(paths):
+            f.write(f"{phrase}\t{count}\n")
+    for old in paths:
+        os.remove(old)
+    return path
+
+# Run paths in tiers, compacted as in a size-tiered LSM tree: once a tier holds fanout runs they are merged into a
+# single run one tier up. A count is rewritten once per tier it climbs, log_fanout(runs) times in all, instead of
+# once per compaction as when every run, the ever growing merged one included, is merged again.
+class TieredRuns:
+    def __init__(self, run_dir, fanout=64):
+        self.run_dir = run_dir
+        self.fanout = fanout
+        self.tiers = []  # tiers[i] holds runs of about fanout ** i spilled runs each
+
+    def add(self, paths):
+        for path in paths:
+            level = 0
+            while True:
+                if level == len(self.tiers):
+                    self.tiers.append([])
+                self.tiers[level].append(path)
+                if len(self.tiers[level]) < self.fanout:
+                    break
+                path = compact_runs(self.run_dir, self.tiers[level])
+                self.tiers[level] = []
+                level += 1
+
+    # Every run still live, fewer than fanout per tier, for the final k-way merge
+    def paths(self):
+        return [path for tier in self.tiers for path in tier]
+
+# Exact top_n phrases by total count (all of them when top_n is None) with at least min_count occurrences
+def top_phrases(paths, top_n=None, min_count=2):
+    totals = ((count, phrase) for phrase, count in merge_runs(paths) if count >= min_count)
+    if top_n is None:
+        return [(phrase, count) for count, phrase in sorted(totals, reverse=True)]
+    return [(phrase, count) for count, phrase in heapq.nlargest(top_n, totals)]
+
+# Counter that spills a sorted run once it holds more than max_entries phrases
+class SpillingCounter:
+    def __init__(self, run_dir, max_entries=2000000):
+        self.run_dir = run_dir
+        self.max_entries = max_entries
+        self.counts = Counter()
+        self.runs = []
+
+    def update(self, phrases):
+        self.counts.update(phrases)
+        if len(self.counts) > self.max_entries:
+            self.spill()
+
+    def spill(self):
+        if self.counts:
+            self.runs.append(write_run(self.run_dir, self.counts))
+            self.counts = Counter()
+
+    # Spill what is left and hand over the run files
+    def flush(self):
+        self.spill()
+        runs, self.runs = self.runs, []
+        return runs
@@ -0,0 +1,175 @@
+import bisect
+import hashlib
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from tqdm import tqdm
+from dump_source import iter_pages
+
+# Table layout (native little-endian, sections 8-byte aligned):
+#   header: magic, version, entry count, canonical page count, then (offset, length) of the five sections below
+#   keys           uint64[n]   title hashes, sorted
+#   ids            uint32[n]   canonical page id of each key (redirect chains already collapsed)
+#   canonical_ids  uint32[m]   page ids of the canonical (non-redirect) pages, sorted
+#   title_offsets  uint64[m+1] byte offsets into title_bytes
+#   title_bytes    UTF-8 canonical titles back to back
+MAGIC = b'WVRDR\x00\x00\x01'
+VERSION = 1
+SECTIONS = ['keys', 'ids', 'canonical_ids', 'title_offsets', 'title_bytes']
+HEADER = struct.Struct('<8sIQQ' + 'QQ' * len(SECTIONS))
+# Longest redirect chain that is followed; longer chains (and cycles) are left unresolved
+MAX_CHAIN = 16
+
+if sys.byteorder != 'little':
+    raise RuntimeError("redirects assumes a little-endian host")
+
+space_pattern = re.compile(r'[\s_]+')
+
+# MediaWiki title normalization: underscores are spaces, no section anchor, first letter is case-insensitive
+def normalize_title(title):
+    title = space_pattern.sub(' ', title.split('#', 1)[0]).strip()
+    return title[:1].upper() + title[1:]
+
+def title_hash(title):
+    return int.from_bytes(hashlib.blake2b(title.encode('utf-8'), digest_size=8).digest(), 'little')
+
+# Collects page ids and redirect targets page by page; write() collapses chains and writes the table
+class RedirectCollector:
+    def __init__(self):
+        self.page_ids = {}
+        self.redirects = {}
+
+    def add(self, page):
+        if page.page_id is None:
+            return
+        title = normalize_title(page.title)
+        if page.redirect:
+            self.redirects[title] = normalize_title(page.redirect)
+        else:
+            self.page_ids[title] = page.page_id
+
+    def update(self, other):
+        self.page_ids.update(other.page_ids)
+        self.redirects.update(other.redirects)
+
+    # Follow a redirect chain to a canonical page id, or None for a dangling or cyclic chain
+    def resolve(self, title):
+        for _ in range(MAX_CHAIN):
+            page_id = self.page_ids.get(title)
+            if page_id is not None:
+                return page_id
+            title = self.redirects.get(title)
+            if title is None:
+                return None
+        return None
+
+    def write(self, table_path):
+        entries = {title_hash(title): page_id for title, page_id in self.page_ids.items()}
+        resolved = 0
+        for title in self.redirects:
+            page_id = self.resolve(title)
+            if page_id is not None:
+                entries[title_hash(title)] = page_id
+                resolved += 1
+        keys = array('Q', sorted(entries))
+        ids = array('I', (entries[key] for key in keys))
+
+        canonical = sorted((page_id, title) for title, page_id in self.page_ids.items())
+        canonical_ids = array('I', (page_id for page_id, _ in canonical))
+        title_offsets = array('Q', [0])
+        title_bytes = bytearray()
+        for _, title in canonical:
+            title_bytes += title.encode('utf-8')
+            title_offsets.append(len(title_bytes))
+
+        sections = [keys.tobytes(), ids.tobytes(), canonical_ids.tobytes(), title_offsets.tobytes(), bytes(title_bytes)]
+        positions = []
+        offset = HEADER.size
+        for section in sections:
+            offset += -offset % 8
+            positions.extend([offset, len(section)])
+            offset += len(section)
+
+        tmp_path = table_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(keys), len(canonical_ids), *positions))
+            for section, start in zip(sections, positions[::2]):
+                f.write(b'\x00' * (start - f.tell()))
+                f.write(section)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, table_path)
+        print(f"{len(canonical_ids)} pages and {resolved} of {len(self.redirects)} redirects written to {table_path}")
+
+# One pass over the dump collecting every page and redirect into the table
+def build_redirect_table(dump_path, table_path, index_path=None, num_readers=None):
+    collector = RedirectCollector()
+    # Page order does not matter here, so a .bz2 multistream dump is read unordered
+    for page in tqdm(iter_pages(dump_path, index_path, num_readers, ordered=False), desc="Collecting redirects"):
+        collector.add(page)
+    collector.write(table_path)
+
+# Memory-mapped title -> canonical page id table; lookups are a binary search over the sorted hashes,
+# and forked workers share the pages of the mapping. A pickled table reopens the file instead of copying it.
+class RedirectTable:
+    def __init__(self, table_path):
+        self.path = table_path
+        with open(table_path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self.mm, 0)
+        magic, version, self.num_entries, self.num_pages = header[:4]
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{table_path} is not a redirect table")
+        view = memoryview(self.mm)
+        self.sections = {name: view[start:start + length] for name, start, length in zip(SECTIONS, header[4::2], header[5::2])}
+        self.keys = self.sections['keys'].cast('Q')
+        self.ids = self.sections['ids'].cast('I')
+        self.canonical_ids = self.sections['canonical_ids'].cast('I')
+        self.title_offsets = self.sections['title_offsets'].cast('Q')
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def __len__(self):
+        return self.num_entries
+
+    # Canonical page id of a title or redirect title, or None when the dump has no such page
+    def canonical_id(self, title):
+        key = title_hash(normalize_title(title))
+        i = bisect.bisect_left(self.keys, key)
+        if i < self.num_entries and self.keys[i] == key:
+            return self.ids[i]
+        return None
+
+    def title(self, page_id):
+        i = bisect.bisect_left(self.canonical_ids, page_id)
+        if i == self.num_pages or self.canonical_ids[i] != page_id:
+            return None
+        return str(self.sections['title_bytes'][self.title_offsets[i]:self.title_offsets[i + 1]], 'utf-8')
+
+    # Canonical title of a link target; unknown targets come back normalized so spellings still fold together
+    def resolve(self, link):
+        link = normalize_title(link.split('|', 1)[0])
+        page_id = self.canonical_id(link)
+        if page_id is None:
+            return link
+        return self.title(page_id)
+
+    def close(self):
+        for view in (self.keys, self.ids, self.canonical_ids, self.title_offsets, *self.sections.values()):
+            view.release()
+        self.sections = {}
+        self.mm.close()
+
+if __name__ == "__main__":
+    dump_path = 'enwiki-latest-pages-articles.xml'  # Replace with your input XML file path
+    index_path = None  # Set with dump_path = 'enwiki-latest-pages-articles-multistream.xml.bz2' to read the compressed dump
+    table_path = 'data/redirects.wvr'  # Replace with your output table path
+
+    build_redirect_table(dump_path, table_path, index_path)
@@ -0,0 +1,168 @@
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from redirects import title_hash
+
+# Compiled term -> emb_idx vocabulary (link_embeddings.json, verb_embeddings.json), native little-endian,
+# sections 8-byte aligned:
+#   header: magic, version, entry count, then (offset, length) of the seven sections below
+#   term_offsets  uint64[n+1]  byte offsets into term_bytes
+#   term_bytes    UTF-8 terms back to back, sorted bytewise
+#   term_ids      uint32[n]    emb_idx of each sorted term
+#   hash_keys     uint64[n]    term hashes, sorted, for term -> emb_idx lookups
+#   hash_terms    uint32[n]    term number of each sorted hash
+#   sorted_ids    uint32[n]    emb_idx values, sorted, for emb_idx -> term lookups
+#   id_terms      uint32[n]    term number of each sorted emb_idx
+MAGIC = b'WVVOC\x00\x00\x01'
+VERSION = 1
+SECTIONS = ['term_offsets', 'term_bytes', 'term_ids', 'hash_keys', 'hash_terms', 'sorted_ids', 'id_terms']
+HEADER = struct.Struct('<8sIQ' + 'QQ' * len(SECTIONS))
+VOCABULARY_SUFFIX = '.wvv'
+
+if sys.byteorder != 'little':
+    raise RuntimeError("vocabulary assumes a little-endian host")
+
+def write_vocabulary(vocabulary_path, index):
+    entries = sorted((term.encode('utf-8'), emb_idx) for term, emb_idx in index.items())
+    term_offsets = array('Q', [0])
+    term_bytes = bytearray()
+    for term, _ in entries:
+        term_bytes += term
+        term_offsets.append(len(term_bytes))
+    term_ids = array('I', (emb_idx for _, emb_idx in entries))
+
+    by_hash = sorted((title_hash(term.decode('utf-8')), i) for i, (term, _) in enumerate(entries))
+    hash_keys = array('Q', (key for key, _ in by_hash))
+    hash_terms = array('I', (i for _, i in by_hash))
+    by_id = sorted((emb_idx, i) for i, (_, emb_idx) in enumerate(entries))
+    sorted_ids = array('I', (emb_idx for emb_idx, _ in by_id))
+    id_terms = array('I', (i for _, i in by_id))
+    del entries, by_hash, by_id
+
+    sections = [term_offsets.tobytes(), bytes(term_bytes), term_ids.tobytes(), hash_keys.tobytes(), hash_terms.tobytes(), sorted_ids.tobytes(), id_terms.tobytes()]
+    positions = []
+    offset = HEADER.size
+    for section in sections:
+        offset += -offset % 8
+        positions.extend([offset, len(section)])
+        offset += len(section)
+
+    tmp_path = vocabulary_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(term_ids), *positions))
+        for section, start in zip(sections, positions[::2]):
+            f.write(b'\x00' * (start - f.tell()))
+            f.write(section)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, vocabulary_path)
+    print(f"{len(term_ids)} terms written to {vocabulary_path}")
+
+# Compile a {term: emb_idx} JSON file; the JSON is loaded once here and never again
+def compile_vocabulary(json_path, vocabulary_path=None):
+    vocabulary_path = vocabulary_path or os.path.splitext(json_path)[0] + VOCABULARY_SUFFIX
+    with open(json_path, 'r') as f:
+        write_vocabulary(vocabulary_path, json.load(f))
+    return vocabulary_path
+
+# Memory-mapped, read-only stand-in for the {term: emb_idx} dict: term lookups are a binary search over
+# the sorted hashes, emb_idx lookups a binary search over the sorted ids. Worker processes share the
+# mapped pages through the page cache, and a pickled vocabulary reopens the file instead of copying it.
+class Vocabulary:
+    def __init__(self, vocabulary_path):
+        self.path = vocabulary_path
+        with open(vocabulary_path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = HEADER.unpack_from(self.mm, 0)
+        magic, version, self.num_terms = header[:3]
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{vocabulary_path} is not a compiled vocabulary")
+        view = memoryview(self.mm)
+        self.sections = {name: view[start:start + length] for name, start, length in zip(SECTIONS, header[3::2], header[4::2])}
+        self.term_offsets = self.sections['term_offsets'].cast('Q')
+        self.term_ids = self.sections['term_ids'].cast('I')
+        self.hash_keys = self.sections['hash_keys'].cast('Q')
+        self.hash_terms = self.sections['hash_terms'].cast('I')
+        self.sorted_ids = self.sections['sorted_ids'].cast('I')
+        self.id_terms = self.sections['id_terms'].cast('I')
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def __len__(self):
+        return self.num_terms
+
+    # Term number i in sorted order
+    def term_at(self, i):
+        return str(self.sections['term_bytes'][self.term_offsets[i]:self.term_offsets[i + 1]], 'utf-8')
+
+    def get(self, term, default=None):
+        key = title_hash(term)
+        i = bisect.bisect_left(self.hash_keys, key)
+        while i < self.num_terms and self.hash_keys[i] == key:
+            j = self.hash_terms[i]
+            if self.term_at(j) == term:
+                return self.term_ids[j]
+            i += 1
+        return default
+
+    def __getitem__(self, term):
+        emb_idx = self.get(term)
+        if emb_idx is None:
+            raise KeyError(term)
+        return emb_idx
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    # Term of an emb_idx, or None; the inverse mapping the vector database scripts used to build as a dict
+    def term(self, emb_idx, default=None):
+        try:
+            i = bisect.bisect_left(self.sorted_ids, emb_idx)
+        except TypeError:
+            # Non-integer ids, such as the 'UNKNOWN' placeholder of build_records_db.py, are never in the vocabulary
+            return default
+        if i == self.num_terms or self.sorted_ids[i] != emb_idx:
+            return default
+        return self.term_at(self.id_terms[i])
+
+    def __iter__(self):
+        for i in range(self.num_terms):
+            yield self.term_at(i)
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        return iter(self.term_ids.tolist())
+
+    def items(self):
+        for i in range(self.num_terms):
+            yield self.term_at(i), self.term_ids[i]
+
+    def close(self):
+        for view in (self.term_offsets, self.term_ids, self.hash_keys, self.hash_terms, self.sorted_ids, self.id_terms, *self.sections.values()):
+            view.release()
+        self.sections = {}
+        self.mm.close()
+
+# Open the compiled form of a vocabulary JSON file, compiling it next to the JSON on first use.
+# A path that already ends in .wvv is opened as is.
+def open_vocabulary(path):
+    if path.endswith(VOCABULARY_SUFFIX):
+        return Vocabulary(path)
+    vocabulary_path = os.path.splitext(path)[0] + VOCABULARY_SUFFIX
+    if not os.path.exists(vocabulary_path) or os.path.getmtime(vocabulary_path) < os.path.getmtime(path):
+        compile_vocabulary(path, vocabulary_path)
+    return Vocabulary(vocabulary_path)
+
+if __name__ == "__main__":
+    for json_path in ['data/verb_embeddings.json', 'data/link_embeddings.json']:  # written by build_semantic.py
+        compile_vocabulary(json_path)
@@ -1,30 +1,43 @@
 import json
+import os
+import sys
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from degree_stats import segment_link_counts
+from page_segments import PageEmbeddingReader, iter_page_embeddings
+
 def process_jsonl_to_dict(jsonl_filename):
-    """Process JSONL file and create a dictionary with each first value as the key and the length of the third value as the value."""
+    """Process page embeddings (JSONL or segments) and create a dictionary with each first value as the key and the length of the third value as the value."""
     result_dict = {}
+
+    if not jsonl_filename.endswith('.jsonl'):
+        # Segments: the link vector lengths come straight from the link offsets, nothing is decoded
+        reader = PageEmbeddingReader(jsonl_filename)
+        for segment in tqdm(reader.iter_segments(), total=len(reader.paths), desc="Processing page embedding segments"):
+            for i, length in enumerate(segment_link_counts(segment).tolist()):
+                result_dict[segment.title(i)] = length
+        reader.close()
+        return result_dict
     
-    with open(jsonl_filename, 'r') as f:
-        for line in tqdm(f, desc="Processing JSONL file"):
-            record = json.loads(line)
-            
-            # Assuming the JSON object is a list and we need the first and third values
-            first_value = record[0]
-            third_value = record[2]
-            
-            # Calculate the length of the third value
-            length_of_third_value = len(third_value)
-            
-            # Add to the result dictionary
-            result_dict[first_value] = length_of_third_value
+    for record in tqdm(iter_page_embeddings(jsonl_filename), desc="Processing page embeddings"):
+        
+        # Each record is [title, verb_vector, link_vector] and we need the first and third values
+        first_value = record[0]
+        third_value = record[2]
+        
+        # Calculate the length of the third value
+        length_of_third_value = len(third_value)
+        
+        # Add to the result dictionary
+        result_dict[first_value] = length_of_third_value
             
     return result_dict
 
 # Example usage
-jsonl_filename = 'page_embeddings.jsonl'
+jsonl_filename = 'page_embeddings'  # or 'page_embeddings.jsonl'
 result_dict = process_jsonl_to_dict(jsonl_filename)
 
 # Print the resulting dictionary
 with open("link_impact.json", "w") as outj:
-    json.dump(result_dict, outj, indent=4, ensure_ascii=False)
+    json.dump(result_dict, outj, ensure_ascii=False)
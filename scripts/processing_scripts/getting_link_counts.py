@@ -1,21 +1,19 @@
-import json
-from collections import defaultdict
-from tqdm import tqdm
+import os
+import sys
 
-def count_links(input_path, output_path):
-    link_counts = defaultdict(int)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from degree_stats import open_degree_stats
+from link_graph import open_link_graph
 
-    # Open the input JSONL file and process each line
-    with open(input_path, 'r') as file:
-        for line in tqdm(file, desc="Processing links"):
-            data = json.loads(line.strip())
-            for page, links in data.items():
-                for link in links:
-                    link_counts[link] += 1
+def count_links(input_path, output_path, graph_dir=None, stats_dir=None):
+    # A link's count is its in-degree in the memory-mapped link graph (see link_graph.py), built on first use
+    graph_dir = graph_dir or os.path.splitext(input_path)[0] + '_graph'
+    open_link_graph(input_path, graph_dir)
+    # The degrees are kept as arrays (see degree_stats.py) for later top-k queries
+    stats = open_degree_stats(graph_dir, stats_dir or os.path.splitext(input_path)[0] + '_degree_stats')
 
-    # Save the link counts to the output JSON file
-    with open(output_path, 'w') as out_file:
-        json.dump(link_counts, out_file, indent=4, ensure_ascii=False)
+    # Save the link counts to the output JSON file, most linked first
+    stats.write_json(output_path)
 
     print(f"Link counts saved to {output_path}")
 
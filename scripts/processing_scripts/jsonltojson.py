@@ -1,23 +1,27 @@
 import json
+import os
+import sys
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from page_segments import iter_page_embeddings
+
 def process_jsonl(input_file, verbout_file, linkout_file):
     verbout = {}
     linkout = {}
     counter = 0
-    with open(input_file, 'r') as f:
-        for i, line in enumerate(tqdm(f, desc="Processing JSONL file")):
-            record = json.loads(line)
+    # Reads page_embeddings.jsonl or a directory of binary page embedding segments
+    for i, record in enumerate(tqdm(iter_page_embeddings(input_file), desc="Processing page embeddings")):
 
-            # Assuming the JSONL file has 'verbs' and 'links' keys
-            page, verbs, links = record
-            if 'Wikipedia' in page: continue
+        # Each record is [page, verbs, links]
+        page, verbs, links = record
+        if 'Wikipedia' in page: continue
 
-            """if page not in verbout:
-                verbout[page] = list(set(verbs))  # You can store additional data if needed"""
+        """if page not in verbout:
+            verbout[page] = list(set(verbs))  # You can store additional data if needed"""
 
-            if page not in linkout:
-                linkout[page] = list(set(links))
+        if page not in linkout:
+            linkout[page] = list(set(links))
 
     
     with open(linkout_file, 'w') as vf:
@@ -26,7 +30,7 @@ def process_jsonl(input_file, verbout_file, linkout_file):
     
 
 # Example usage
-input_file = 'page_embeddings.jsonl'
+input_file = 'page_embeddings'  # or 'page_embeddings.jsonl'
 verbout_file = 'verbout.json'
 linkout_file = 'linkout.json'
 process_jsonl(input_file, verbout_file, linkout_file)
@@ -1,37 +1,25 @@
 import json
+import os
+import sys
+import numpy as np
 from tqdm import tqdm
 
-def load_jsonl(file_path):
-    """Load the JSONL file into a dictionary, skipping entries with values of length 1."""
-    data = {}
-    with open(file_path, 'r') as f:
-        for line in tqdm(f, desc="Loading JSON"):
-            entry = json.loads(line.strip())
-            for key, value in entry.items():
-                if isinstance(value, list) and len(value) > 1:  # Only include if the value list has more than 1 item
-                    data[key] = value
-    return data
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from link_bfs import iter_walk_counts, walk_counts
+from link_graph import open_link_graph
 
-def process_links_iteratively(master_dict, key, max_depth):
-    """Iteratively process links up to a specified depth and count the traversals."""
-    connections = {}
-    queue = [(key, 0)]  # Initialize the queue with the starting key and depth
+def process_links_iteratively(graph, node, max_depth):
+    """Count the link walks of up to max_depth steps from a node to every page they reach."""
+    return walk_counts_to_titles(graph, *walk_counts(graph, [node], max_depth)[0])
 
-    while queue:
-        current_key, depth = queue.pop(0)  # Dequeue the next key-depth pair
-        if depth < max_depth and current_key in master_dict and isinstance(master_dict[current_key ], list):
-            for sub_key in master_dict[current_key]:
-                if sub_key not in connections:
-                    connections[sub_key] = 0
-                connections[sub_key] += 1  # Count the traversal
-                queue.append((sub_key, depth + 1))  # Enqueue the sub_key with incremented depth
+def walk_counts_to_titles(graph, nodes, counts):
+    # Already sorted by count, ties in the order the pages were first reached
+    return {graph.title(sub_node): count for sub_node, count in zip(nodes.tolist(), counts.tolist())}
 
-    connections = dict(sorted(connections.items(), key=lambda item: item[1], reverse=True))  # Sort connections by value
-    return connections
-
-def process_and_write_jsonl(input_file, output_file, max_depth=3):
-    """Process each entry in the JSONL file and write results incrementally."""
-    master_dict = load_jsonl(input_file)  # Load the JSONL file into memory
+def process_and_write_jsonl(input_file, output_file, max_depth=3, graph_dir=None, all_pages=False, num_workers=None, batch_edges=1 << 24):
+    """Process each entry in the link graph and write results incrementally."""
+    # Memory-mapped link graph (see link_graph.py), built from the JSONL file on first use
+    graph = open_link_graph(input_file, graph_dir or os.path.splitext(input_file)[0] + '_graph')
     presidents = [
     "Ronald Reagan",
     "James K. Polk",
@@ -78,18 +66,27 @@ def process_and_write_jsonl(input_file, output_file, max_depth=3):
     "Franklin D. Roosevelt"
 ]
 
-    with open(output_file, 'w') as f:
-        #for key, value in tqdm(master_dict.items(),desc="Processing Master dict"):  # Iterate through each key-value pair
+    if all_pages:
+        # Every page with more than one link, as the JSONL loader used to keep
+        seeds = np.flatnonzero(graph.out_degree() > 1).tolist()
+    else:
+        seeds = []
         for pres in presidents:
-            if pres not in master_dict:
+            node = graph.id(pres)
+            # Pages with at most one link are left out, as the JSONL loader used to do
+            if node is None or graph.out_degree(node) <= 1:
                 print(f"This president {pres} is not in the master dict, skipping")
                 continue
-            key = pres
-            value = master_dict[pres]
-            if isinstance(value, list) and len(value) > 1:  # Process only if the value is a non-trivial list
-                processed_data = process_links_iteratively(master_dict, key, max_depth)
-                json.dump({key: processed_data}, f, ensure_ascii=False)  # Write the processed data to the output file
-                f.write('\n')  # Ensure each JSON object is on a new line
+            seeds.append(node)
+
+    # Seeds are expanded level by level across num_workers processes, in tasks of about batch_edges links
+    with open(output_file, 'w') as f:
+        results = iter_walk_counts(graph, seeds, max_depth, batch_edges=batch_edges, num_workers=num_workers)
+        for node, nodes, counts in tqdm(results, total=len(seeds), desc="Processing link graph"):
+            key = graph.title(node)
+            processed_data = walk_counts_to_titles(graph, nodes, counts)
+            json.dump({key: processed_data}, f, ensure_ascii=False)  # Write the processed data to the output file
+            f.write('\n')  # Ensure each JSON object is on a new line
 
 if __name__ == "__main__":
     input_file = 'wiki_knowledge/links.jsonl'
@@ -5,6 +5,11 @@ import sqlite3
 import pandas as pd
 import numpy as np
 import numpy.typing as npt
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from vocabulary import open_vocabulary
 
 app = Flask(__name__)
 
@@ -31,8 +36,8 @@ class CustomEmbeddingFunction:
 # Initialize the ChromaDB client
 client = chromadb.PersistentClient(path="wikichroma")
 collection = client.get_collection("wc_final_6")
-with open("wiki_knowledge/embeddings/link_embeddings.json", "r") as inj:
-    link_idx = json.load(inj)
+# Memory-mapped link vocabulary (see vocabulary.py), compiled next to the JSON file on first use
+link_idx = open_vocabulary("wiki_knowledge/embeddings/link_embeddings.json")
 #link_idx = {v: k for k, v in link_idx.items()}
 processor = CustomEmbeddingFunction()
 
@@ -1,4 +1,9 @@
 import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from degree_stats import DegreeStats
 
 def load_json(filename):
     """Load a JSON file and return the data."""
@@ -35,7 +40,15 @@ def process_link_impact_json(filename, substring, reverse=True):
     save_json(sorted_data, filename)
     print(f"Processed and updated {filename}")
 
+def process_degree_stats(stats_dir, filename, substring, top_k=None):
+    """Write the link counts without keys containing the substring, most linked first, straight from the degree statistics."""
+    stats = DegreeStats(stats_dir)
+    stats.write_json(filename, k=top_k, exclude=[substring])
+    stats.close()
+    print(f"Processed and updated {filename}")
+
 # Example usage
+stats_dir = 'data/link_mapping_example_stats'  # written by find_link_impact.py; process_link_impact_json still cleans a plain JSON file
 filename = 'link_impact.json'
 substring = 'Wikipedia'
-process_link_impact_json(filename, substring)
+process_degree_stats(stats_dir, filename, substring)
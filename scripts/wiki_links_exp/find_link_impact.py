@@ -1,23 +1,17 @@
-import json
-from collections import defaultdict
+import os
+import sys
 
-# Read the input JSON file
-with open('data/link_mapping_example.json', 'r') as f:
-    data = json.load(f)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from degree_stats import open_degree_stats
+from link_graph import open_link_graph
 
-# Create a defaultdict to store the counts
-counts = defaultdict(int)
+# Memory-mapped link graph (see link_graph.py), built from the link mapping on first use
+graph = open_link_graph('data/link_mapping_example.json', 'data/link_mapping_example_graph')
 
-# Iterate over the data and count the occurrences of each value
-for key, values in data.items():
-    for value in values:
-        counts[value] += 1
+# The count of each value is its in-degree, kept as arrays next to the graph (see degree_stats.py)
+stats = open_degree_stats('data/link_mapping_example_graph', 'data/link_mapping_example_stats')
 
-# Convert the defaultdict to a regular dictionary
-result = dict(counts)
-
-# Write the result to the output JSON file
-with open('link_impact.json', 'w') as f:
-    json.dump(result, f, indent=4, ensure_ascii=False)
+# Write the result to the output JSON file, most linked first
+stats.write_json('link_impact.json')
 
 print("The file 'link_impact.json' has been created with the counts of each value.")
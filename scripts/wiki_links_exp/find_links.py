@@ -1,35 +1,30 @@
-from lxml import etree
-import json
 import os
-import re
-from tqdm import tqdm
-
-def process_wikipedia_dump(dump_path):
-
-    my_links = {}
-    output_dir = 'data'
-    os.makedirs(output_dir, exist_ok=True)
-
-    link_pattern = re.compile(r"\[\[(.+?)\]\]")
-
-    context = etree.iterparse(dump_path, events=('end',), tag='{http://www.mediawiki.org/xml/export-0.10/}page')
-    for event, elem in tqdm(context):
-
-        title = elem.findtext('{http://www.mediawiki.org/xml/export-0.10/}title').lower()
-        text = elem.findtext('.//{http://www.mediawiki.org/xml/export-0.10/}text')
-
-        if text:
-            links = re.findall(link_pattern, text)
-            my_links[title] = links
-
-        # Clear the element to free up memory
-        elem.clear()
-        while elem.getprevious() is not None:
-            del elem.getparent()[0]
-    with open(f"{output_dir}/links.json", "w") as outj:
-        json.dump(my_links, outj, indent=4, ensure_ascii=False)
-
-
-dump_path = 'enwiki-latest-pages-articles.xml'
-dump_path = 'enwiki-20240501-pages-articles15.xml-p17324603p17460152'
-process_wikipedia_dump(dump_path)
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from dump_pipeline import run_pipeline
+from extractors import LinksExtractor, LinkAdjacencyExtractor
+
+# Map every page to its links in one parallel pass, streaming results to disk as batches complete.
+#   data/links.json: {lowercased title: [links]}, raw link targets or, with a redirect table, canonical titles
+#   adjacency_dir (needs redirects_path): (page_id, [link page ids]) arrays, see link_adjacency.py
+# A .bz2 multistream dump (index_path) or a page index (page_index_path) lets workers parse the dump themselves.
+def process_wikipedia_dump(dump_path, index_path=None, redirects_path=None, page_index_path=None, num_workers=None, adjacency_dir=None, links_path='data/links.json'):
+    extractors = []
+    if links_path:
+        extractors.append(LinksExtractor(links_path, redirects_path))
+    if adjacency_dir:
+        if redirects_path is None:
+            raise ValueError("The link adjacency needs a redirect table (see redirects.py) to map titles to page ids")
+        extractors.append(LinkAdjacencyExtractor(adjacency_dir, redirects_path))
+    run_pipeline(dump_path, extractors, index_path, page_index_path, num_workers)
+
+
+if __name__ == "__main__":
+    dump_path = 'enwiki-latest-pages-articles.xml'
+    dump_path = 'enwiki-20240501-pages-articles15.xml-p17324603p17460152'
+    index_path = None  # Set with dump_path = 'enwiki-latest-pages-articles-multistream.xml.bz2' to read the compressed dump
+    redirects_path = None  # e.g. 'data/redirects.wvr' built with redirects.py
+    page_index_path = None  # e.g. 'enwiki-latest-pages-articles.index.jsonl' built with page_index.py
+    adjacency_dir = None  # e.g. 'data/link_adjacency', together with redirects_path
+    process_wikipedia_dump(dump_path, index_path, redirects_path, page_index_path, adjacency_dir=adjacency_dir)
@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+import time
+from itertools import islice
+from stretch_matcher import StretchMatcher
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from dump_source import iter_pages
+
+# The original find_word_stretches_and_context: join every window, text.find() it, rfind/find the context per mark
+def join_and_find(text, knowledge, min_words=1, stretch_max=8):
+    words = text.split()
+    stretches = {}
+    potential_stretches = []
+
+    def find_context(start, end):
+        before_context_idx = max(text[:start].rfind(p) for p in '.?![{')
+        if before_context_idx == -1:
+            before_context_idx = 0
+        elif text[before_context_idx] not in '[{':
+            before_context_idx += 1
+        after_context_idx = min((text[end:].find(p) for p in '.?!]}' if text[end:].find(p) != -1), default=len(text))
+        if after_context_idx == -1:
+            after_context_idx = len(text)
+        else:
+            after_context_idx += end
+        return text[before_context_idx:after_context_idx].strip()
+
+    for start in range(len(words)):
+        for end in range(start + min_words, min(start + stretch_max + 1, len(words) + 1)):
+            stretch = " ".join(words[start:end])
+            if stretch.lower() in knowledge:
+                potential_stretches.append((stretch, start, end))
+
+    potential_stretches.sort(key=lambda x: len(x[0]), reverse=True)
+
+    used_ranges = []
+    for stretch, start, end in potential_stretches:
+        stretch_start = text.find(stretch)
+        stretch_end = stretch_start + len(stretch)
+        if not any(stretch_start < used_end and stretch_end > used_start for used_start, used_end in used_ranges):
+            stretches[stretch.lower()] = find_context(stretch_start, stretch_end)
+            used_ranges.append((stretch_start, stretch_end))
+    return stretches
+
+# Seconds per call, best of `repeat`
+def latency(func, text, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+# Latency of both matchers on articles of growing length, built by concatenating dump pages
+def main(dump_path, knowledge_path, lengths=(1000, 5000, 20000, 50000), index_path=None, num_pages=5000):
+    with open(knowledge_path, 'r') as f:
+        knowledge = set(json.load(f))
+    matcher = StretchMatcher(knowledge)
+    corpus = "\n".join(p.text for p in islice(iter_pages(dump_path, index_path), num_pages) if p.text)
+    words = corpus.split(' ')
+    print(f"{len(knowledge)} knowledge phrases, corpus of {len(words)} words")
+
+    for length in lengths:
+        text = ' '.join(words[:length])
+        before, old = latency(lambda t: join_and_find(t, knowledge), text, repeat=1)
+        after, new = latency(matcher.match, text)
+        same = sum(1 for phrase, context in new.items() if old.get(phrase) == context)
+        print(f"{len(text.split()):>8} words: join-and-find {before * 1000:10.1f} ms, StretchMatcher {after * 1000:8.1f} ms, "
+              f"{before / after:6.1f}x; {same}/{len(new)} phrases with the same context ({len(old)} before)")
+
+if __name__ == "__main__":
+    dump_path = 'enwiki-20240501-pages-articles15.xml-p17324603p17460152'
+    knowledge_path = 'wiki_knowledge/truncatedknowledge.json'
+
+    main(dump_path, knowledge_path)
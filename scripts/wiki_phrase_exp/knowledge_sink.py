@@ -0,0 +1,72 @@
+import json
+import os
+
+# Append-only knowledge output: one {"title": ..., "stretches": {...}} line per page in knowledge.jsonl.
+# Pages are buffered and flush() appends only the pages added since the last flush, so a checkpoint costs
+# O(new pages). compact() turns the log into the single {title: stretches} JSON the scripts used to write.
+# An existing log is continued rather than truncated: a torn last line from a crash is cut off on open, and the
+# titles already logged are kept so a rerun can skip them with `title in sink`.
+class KnowledgeSink:
+    def __init__(self, output_dir, name='knowledge.jsonl'):
+        self.path = os.path.join(output_dir, name)
+        self.titles = set()
+        if os.path.exists(self.path):
+            self.recover()
+            self.titles.update(title for title, _ in self.read())
+            if self.titles:
+                print(f"Continuing {self.path} after {len(self.titles)} pages")
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.pending = []
+
+    # Cut the log back to its last complete line; flush() writes whole lines, so only the tail can be torn
+    def recover(self):
+        with open(self.path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            position = end
+            while position > 0:
+                step = min(position, 1 << 16)
+                f.seek(position - step)
+                newline = f.read(step).rfind(b'\n')
+                if newline >= 0:
+                    position = position - step + newline + 1
+                    break
+                position -= step
+            if position < end:
+                f.truncate(position)
+
+    def __contains__(self, title):
+        return title in self.titles
+
+    def add(self, title, stretches):
+        self.titles.add(title)
+        self.pending.append(json.dumps({'title': title, 'stretches': stretches}, ensure_ascii=False) + '\n')
+
+    def flush(self):
+        self.file.writelines(self.pending)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = []
+
+    # Stream the log back; a torn last line from a crash is ignored and a repeated title keeps its last entry
+    def read(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                yield record['title'], record['stretches']
+
+    def compact(self, json_path):
+        self.flush()
+        knowledge = dict(self.read())
+        tmp_path = json_path + '.tmp'
+        with open(tmp_path, 'w') as outj:
+            json.dump(knowledge, outj, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, json_path)
+        return len(knowledge)
+
+    def close(self):
+        self.flush()
+        self.file.close()
@@ -0,0 +1,73 @@
+import re
+from bisect import bisect_left
+
+token_pattern = re.compile(r'\S+')
+# Context runs from just after the nearest . ? ! (or from a [ or {) before a stretch, up to the nearest . ? ! ] } after it
+open_pattern = re.compile(r'[.?!\[{]')
+close_pattern = re.compile(r'[.?!\]}]')
+
+# Marker key for "a phrase ends here"; tokens are always str so None never collides
+END = None
+
+# Token trie over a phrase set, finding the non-overlapping knowledge stretches of a text and their context.
+# Everything works on token character offsets, so a page costs O(tokens * stretch_max) plus sorting the hits.
+class StretchMatcher:
+    def __init__(self, phrases, min_words=1, stretch_max=8):
+        self.root = {}
+        self.min_words = min_words
+        self.stretch_max = stretch_max
+        for phrase in phrases:
+            node = self.root
+            for token in phrase.lower().split():
+                node = node.setdefault(token, {})
+            node[END] = True
+
+    # Every (start, end) token window of min_words to stretch_max tokens that is a phrase, in text order
+    def find_windows(self, tokens):
+        windows = []
+        for start in range(len(tokens)):
+            node = self.root
+            for end in range(start, min(start + self.stretch_max, len(tokens))):
+                node = node.get(tokens[end])
+                if node is None:
+                    break
+                if END in node and end + 1 - start >= self.min_words:
+                    windows.append((start, end + 1))
+        return windows
+
+    # Slice of text around [start, end) up to the nearest sentence boundary or bracket on either side
+    def context(self, text, opens, closes, start, end):
+        i = bisect_left(opens, start) - 1
+        if i < 0:
+            before = 0
+        else:
+            before = opens[i] if text[opens[i]] in '[{' else opens[i] + 1
+        j = bisect_left(closes, end)
+        after = closes[j] if j < len(closes) else len(text)
+        return text[before:after].strip()
+
+    # Lowercased phrase -> context of its first occurrence. Longer stretches claim their tokens first and
+    # shorter ones overlapping them are dropped.
+    def match(self, text):
+        spans = [m.span() for m in token_pattern.finditer(text)]
+        words = [text[a:b] for a, b in spans]
+        tokens = [word.lower() for word in words]
+        windows = self.find_windows(tokens)
+        if not windows:
+            return {}
+
+        opens = [m.start() for m in open_pattern.finditer(text)]
+        closes = [m.start() for m in close_pattern.finditer(text)]
+        # Length of the space-joined stretch; the sort is stable so ties keep text order
+        windows.sort(key=lambda w: sum(len(word) for word in words[w[0]:w[1]]) + w[1] - w[0] - 1, reverse=True)
+
+        used = [False] * len(tokens)
+        stretches = {}
+        for start, end in windows:
+            if any(used[start:end]):
+                continue
+            used[start:end] = [True] * (end - start)
+            phrase = " ".join(tokens[start:end])
+            if phrase not in stretches:
+                stretches[phrase] = self.context(text, opens, closes, spans[start][0], spans[end - 1][1])
+        return stretches
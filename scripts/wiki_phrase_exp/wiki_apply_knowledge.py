@@ -5,82 +5,48 @@ import sys
 import json
 import os
 import re
+from stretch_matcher import StretchMatcher
+from knowledge_sink import KnowledgeSink
 
 class WikipediaProcessor:
-    def __init__(self, dump_path, knowledge_path, output_dir='wiki_knowledge/applied'):
+    def __init__(self, dump_path, knowledge_path, output_dir='wiki_knowledge/applied', compact=False):
         with open(knowledge_path, "r") as foo:
             self.myknowledge = json.load(foo)
         print("Finished loading that beast!")
+        # Phrase trie over the knowledge set, built once
+        self.matcher = StretchMatcher(self.myknowledge)
         self.dump_path = dump_path
         self.output_dir = output_dir
-        self.knowledge = {}
         self.counter = 0
         os.makedirs(self.output_dir, exist_ok=True)
+        # Pages are appended to knowledge.jsonl as they are processed. With compact=True the log is also turned into
+        # one JSON at the end; an interrupted run only appends. A rerun continues the log and skips the pages it
+        # already holds.
+        self.compact = compact
+        self.knowledge = KnowledgeSink(self.output_dir)
         
         # Set up the signal handler
         signal.signal(signal.SIGINT, self.create_sigint_handler())
     
-    def find_word_stretches_and_context(self, text, min_words=1, stretch_max=8):
-        words = text.split()
-        stretches = {}
-        potential_stretches = []
+    # Knowledge phrases in the text, each with the sentence (or bracketed span) around its first occurrence
+    def find_word_stretches_and_context(self, text):
+        return self.matcher.match(text)
 
-        def find_context(start, end):
-            # Find the nearest punctuation mark before the stretch
-            before_context_idx = max(text[:start].rfind(p) for p in '.?![{')
-            if before_context_idx == -1:
-                before_context_idx = 0
-            else:
-                if text[before_context_idx] in '[{':
-                    before_context_idx += 0  # Keep the opening bracket
-                else:
-                    before_context_idx += 1
-
-            # Find the nearest punctuation mark after the stretch
-            after_context_idx = min((text[end:].find(p) for p in '.?!]}' if text[end:].find(p) != -1), default=len(text))
-            if after_context_idx == -1:
-                after_context_idx = len(text)
-            else:
-                after_context_idx += end  # Include the punctuation or closing bracket
-
-            return text[before_context_idx:after_context_idx].strip()
-
-        # Collect all possible stretches
-        for start in range(len(words)):
-            for end in range(start + min_words, min(start + stretch_max + 1, len(words) + 1)):
-                stretch = " ".join(words[start:end])
-                if stretch.lower() in self.knowledge:
-                    potential_stretches.append((stretch, start, end))
-
-        # Sort stretches by length (longest first)
-        potential_stretches.sort(key=lambda x: len(x[0]), reverse=True)
-
-        used_ranges = []
-
-        for stretch, start, end in potential_stretches:
-            stretch_start = text.find(stretch)
-            stretch_end = stretch_start + len(stretch)
-            # Check for overlaps with already used ranges
-            if not any(stretch_start < used_end and stretch_end > used_start for used_start, used_end in used_ranges):
-                context = find_context(stretch_start, stretch_end)
-                stretches[stretch.lower()] = context
-                used_ranges.append((stretch_start, stretch_end))
-
-        return stretches
     def create_sigint_handler(self):
         def handle_sigint(signal, frame):
-            print("\nSIGINT received. Writing knowledge to file...")
-            self.save_knowledge()
+            print("\nSIGINT received. Appending knowledge to the log...")
+            self.knowledge.close()
             print("Exiting gracefully.")
             sys.exit(0)
         return handle_sigint
 
+    # Checkpoint: append the pages processed since the last save
     def save_knowledge(self):
-        #self.forget()
-        #sorted_knowledge = dict(sorted(self.knowledge.items(), key=lambda item: item[1], reverse=True))
-        with open(f'{self.output_dir}/knowledge_test_{self.counter}.json', 'w') as outj:
-            json.dump(self.knowledge, outj, indent=4, ensure_ascii=False)
-        print(f"Knowledge written to {self.output_dir}/knowledge_test_{self.counter}.json")
+        self.knowledge.flush()
+
+    def compact_knowledge(self):
+        count = self.knowledge.compact(f'{self.output_dir}/knowledge_test_{self.counter}.json')
+        print(f"Knowledge for {count} pages written to {self.output_dir}/knowledge_test_{self.counter}.json")
 
     def process(self):
         # Compile a regex pattern for extracting links
@@ -95,18 +61,20 @@ class WikipediaProcessor:
             title = elem.findtext('{http://www.mediawiki.org/xml/export-0.10/}title')
             text = elem.findtext('.//{http://www.mediawiki.org/xml/export-0.10/}text')
 
-            if text:
+            if text and title not in self.knowledge:
                 if '#REDIRECT' in text: continue
                 # Find all matches in the text
                 stretches = self.find_word_stretches_and_context(text)
-                self.knowledge[title] = stretches
+                self.knowledge.add(title, stretches)
 
             # Clear the element to free up memory
             elem.clear()
             while elem.getprevious() is not None:
                 del elem.getparent()[0]
         
-        self.save_knowledge()
+        if self.compact:
+            self.compact_knowledge()
+        self.knowledge.close()
 
 
 if __name__ == "__main__":
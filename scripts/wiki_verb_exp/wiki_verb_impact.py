@@ -1,36 +1,26 @@
-import json
 import os
-import re
 import signal
 import sys
-from lxml import etree
-from tqdm import tqdm
-from collections import defaultdict
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mine_pages'))
+from dump_pipeline import run_pipeline
+from extractors import VerbCountsExtractor
 
 class WikipediaProcessor:
-    def __init__(self, dump_path, verb_list_path, output_dir='data'):
+    def __init__(self, dump_path, verb_list_path, output_dir='data', index_path=None, page_index_path=None, num_workers=None, checkpoint_every=100000):
         self.dump_path = dump_path
+        self.index_path = index_path
+        self.page_index_path = page_index_path
+        self.num_workers = num_workers
         self.output_dir = output_dir
-        self.knowledge = defaultdict(int)
-        self.counter = 0
-        self.load_verb_list(verb_list_path)
+        # Counting runs in pipeline workers, each with its own Counter per batch, merged (and checkpointed) here
+        self.verb_counts = VerbCountsExtractor(verb_list_path, output_dir, checkpoint_every)
+        print("Loaded verb list.")
         os.makedirs(self.output_dir, exist_ok=True)
         
         # Set up the signal handler
         signal.signal(signal.SIGINT, self.create_sigint_handler())
     
-    def load_verb_list(self, verb_list_path):
-        with open(verb_list_path, "r") as f:
-            self.verb_list = json.load(f)
-        print("Loaded verb list.")
-    
-    def clean_and_split_text(self, text):
-        # Remove any non-alphabetic characters except spaces and lowercase all words
-        text = re.sub(r'[^a-zA-Z ]', '', text).lower()
-        # Split text into words
-        words = text.split()
-        return set(words)
-
     def create_sigint_handler(self):
         def handle_sigint(signal, frame):
             print("\nSIGINT received. Writing knowledge to file...")
@@ -40,36 +30,17 @@ class WikipediaProcessor:
         return handle_sigint
 
     def save_knowledge(self):
-        sorted_knowledge = dict(sorted(self.knowledge.items(), key=lambda item: item[1], reverse=True))
-        with open(f'{self.output_dir}/verb_counts_{self.counter}.json', 'w') as outj:
-            json.dump(sorted_knowledge, outj, indent=4, ensure_ascii=False)
-        print(f"Knowledge written to {self.output_dir}/verb_counts_{self.counter}.json")
+        self.verb_counts.save()
 
     def process(self):
-        # Start parsing
-        context = etree.iterparse(self.dump_path, events=('end',), tag='{http://www.mediawiki.org/xml/export-0.10/}page')
-        
-        for event, elem in tqdm(context, desc="Processing Wikipedia dump"):
-            
-            title = elem.findtext('{http://www.mediawiki.org/xml/export-0.10/}title')
-            text = elem.findtext('.//{http://www.mediawiki.org/xml/export-0.10/}text')
-            
-            if text:
-                words = self.clean_and_split_text(text)
-                for key in self.verb_list:
-                    if key in words:
-                        self.knowledge[key] += 1
-
-            # Clear the element to free up memory
-            elem.clear()
-            while elem.getprevious() is not None:
-                del elem.getparent()[0]
-        
-        self.save_knowledge()
+        # A .bz2 multistream dump (index_path) or a page index (page_index_path) lets workers parse the dump themselves
+        run_pipeline(self.dump_path, [self.verb_counts], self.index_path, self.page_index_path, self.num_workers)
 
 if __name__ == "__main__":
     dump_path = 'enwiki-latest-pages-articles.xml'
     dump_path = 'enwiki-20240501-pages-articles15.xml-p17324603p17460152'
     verb_list_path = 'data/verb_list.json'
-    processor = WikipediaProcessor(dump_path, verb_list_path)
+    index_path = None  # Set with dump_path = 'enwiki-latest-pages-articles-multistream.xml.bz2' to read the compressed dump
+    page_index_path = None  # e.g. 'enwiki-latest-pages-articles.index.jsonl' built with page_index.py
+    processor = WikipediaProcessor(dump_path, verb_list_path, index_path=index_path, page_index_path=page_index_path)
     processor.process()